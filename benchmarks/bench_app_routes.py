@@ -0,0 +1,95 @@
+"""
+Compares matching request URIs against the paths of an app in the forwardAuth endpoint
+before and after compiling the paths into AppRoutes.
+
+- linear: what `_match_path` did on every request, loading `app_meta.json`, parsing it into `AppMeta`,
+  sorting the paths by length and checking them one by one
+- linear in memory: the same without loading and parsing the file, to separate the cost of the scan
+- compiled: `AppRoutes.match` of the paths compiled once
+
+Run with `python benchmarks/bench_app_routes.py [number of paths ...]`.
+"""
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from shard_core.model.app_meta import AppMeta
+from shard_core.service.app_routes import AppRoutes
+
+ITERATIONS = 2000
+
+
+def make_app_meta(path_count: int) -> dict:
+	rng = random.Random(0)
+	paths = {'': {'access': 'private', 'headers': {'X-Ptl-Client-Id': '{{ auth.client_id }}'}}}
+	while len(paths) < path_count:
+		depth = rng.randint(1, 4)
+		path = ''.join(f'/{rng.choice(["api", "public", "share", "dav", "static", "v1", "v2"])}{rng.randint(0, 9)}'
+			for _ in range(depth))
+		paths[path] = {'access': rng.choice(['public', 'private', 'peer'])}
+	return {
+		'v': '1.0',
+		'app_version': '1.0.0',
+		'name': 'bench_app',
+		'icon': 'icon.svg',
+		'entrypoints': [{'container_name': 'bench_app', 'container_port': 80, 'entrypoint_port': 'http'}],
+		'paths': paths,
+		'lifecycle': {'always_on': False, 'idle_time_for_shutdown': 3600},
+	}
+
+
+def linear_match(app_meta_file: Path, uri: str):
+	with open(app_meta_file) as f:
+		app_meta = AppMeta.parse_obj(json.load(f))
+	return linear_match_in_memory(app_meta, uri)
+
+
+def linear_match_in_memory(app_meta: AppMeta, uri: str):
+	for path, props in sorted(app_meta.paths.items(), key=lambda x: len(x[0]), reverse=True):
+		if uri.startswith(path):
+			return props
+
+
+def measure(func, uris) -> float:
+	timings = []
+	for _ in range(5):
+		start = time.perf_counter()
+		for uri in uris:
+			func(uri)
+		timings.append(time.perf_counter() - start)
+	return statistics.median(timings) / len(uris) * 1_000_000
+
+
+def bench(path_count: int, directory: Path):
+	app_meta_dict = make_app_meta(path_count)
+	app_meta_file = directory / f'app_meta_{path_count}.json'
+	app_meta_file.write_text(json.dumps(app_meta_dict))
+	app_meta = AppMeta.parse_obj(app_meta_dict)
+	app_routes = AppRoutes(app_meta.paths)
+
+	rng = random.Random(1)
+	uris = [rng.choice(list(app_meta.paths)) + rng.choice(['', '/', '/index.html', '/some/file.txt'])
+		for _ in range(ITERATIONS)]
+	for uri in uris:
+		assert app_routes.match(uri) is linear_match_in_memory(app_meta, uri)
+
+	print(
+		f'{path_count:>5} paths | '
+		f'linear {measure(lambda u: linear_match(app_meta_file, u), uris[:200]):8.1f} µs | '
+		f'linear in memory {measure(lambda u: linear_match_in_memory(app_meta, u), uris):8.2f} µs | '
+		f'compiled {measure(app_routes.match, uris):6.2f} µs')
+
+
+def main():
+	path_counts = [int(n) for n in sys.argv[1:]] or [3, 20, 100, 500]
+	with tempfile.TemporaryDirectory() as directory:
+		for path_count in path_counts:
+			bench(path_count, Path(directory))
+
+
+if __name__ == '__main__':
+	main()
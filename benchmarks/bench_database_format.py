@@ -0,0 +1,119 @@
+"""
+Compares the 'pretty' and 'compact' database file formats on generated databases of realistic content.
+
+For every size, it measures
+- load: reading and decoding the whole file, done once by resident storage and on every access by file storage
+- flush: encoding and writing the whole database, done by resident storage after changes
+- update: one `last_connection` update through TinyDB with the file opened and closed around it,
+  which is what every database access cost before resident storage
+
+Run with `python benchmarks/bench_database_format.py [size in MB ...]`.
+"""
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from tinydb import Query, TinyDB
+from tinydb_serialization import SerializationMiddleware
+from tinydb_serialization.serializers import DateTimeSerializer
+
+from shard_core.database.codec import OrjsonCodec
+from shard_core.database.storage import AtomicJSONStorage
+
+APP_NAMES = [f'app_{i}' for i in range(40)]
+
+
+def make_database(size_mb: float) -> dict:
+	rng = random.Random(0)
+	now = datetime(2024, 1, 1)
+	tables = {
+		'terminals': {
+			str(i): {'id': f'{i:08x}', 'name': f'terminal {i}', 'icon': 'notebook', 'last_connection': now}
+			for i in range(1, 11)},
+		'installed_apps': {
+			str(i): {'name': name, 'status': 'running', 'installation_reason': 'store', 'last_access': now}
+			for i, name in enumerate(APP_NAMES, start=1)},
+		'peers': {
+			str(i): {'id': f'{rng.getrandbits(128):032x}', 'name': f'peer {i}', 'public_bytes_b64': 'x' * 400}
+			for i in range(1, 21)},
+		'app_usage_track': {},
+		'backups': {},
+	}
+	target_size = size_mb * 1024 * 1024
+	size, i = 0, 0
+	while size < target_size:
+		i += 1
+		timestamp = now - timedelta(hours=i)
+		track = {'timestamp': timestamp, 'installed_apps': rng.sample(APP_NAMES, 10)}
+		tables['app_usage_track'][str(i)] = track
+		size += 250
+		if i % 24 == 0:
+			tables['backups'][str(i // 24)] = {
+				'startTime': timestamp,
+				'endTime': timestamp + timedelta(minutes=5),
+				'directories': [
+					{'directory': f'user_data/app_data/{app}', 'startTime': timestamp, 'endTime': timestamp,
+						'bytes': rng.randint(0, 10 ** 9), 'files': rng.randint(0, 10 ** 4)}
+					for app in APP_NAMES[:10]],
+			}
+			size += 2000
+	return tables
+
+
+def pretty_tinydb(path: Path) -> TinyDB:
+	serialization = SerializationMiddleware(AtomicJSONStorage)
+	serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
+	return TinyDB(path, storage=serialization, sort_keys=True, indent=2, fsync=False)
+
+
+def compact_tinydb(path: Path) -> TinyDB:
+	return TinyDB(path, storage=AtomicJSONStorage, codec=OrjsonCodec(), fsync=False)
+
+
+def measure(func, repeat: int = 5) -> float:
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		timings.append(time.perf_counter() - start)
+	return statistics.median(timings) * 1000
+
+
+def bench(size_mb: float, directory: Path):
+	data = make_database(size_mb)
+	for name, open_db in [('pretty', pretty_tinydb), ('compact', compact_tinydb)]:
+		path = directory / f'{name}_{size_mb}.json'
+		with open_db(path) as db:
+			db.storage.write(data)
+
+		def load(path=path, open_db=open_db):
+			with open_db(path) as db_:
+				db_.storage.read()
+
+		def flush(path=path, open_db=open_db):
+			with open_db(path) as db_:
+				db_.storage.write(data)
+
+		def update(path=path, open_db=open_db):
+			with open_db(path) as db_:
+				db_.table('terminals').update({'last_connection': datetime.utcnow()}, Query().id == '00000001')
+
+		file_size = path.stat().st_size / 1024 / 1024
+		print(
+			f'{size_mb:>6} MB {name:>8} | file {file_size:6.2f} MB | '
+			f'load {measure(load):8.1f} ms | flush {measure(flush):8.1f} ms | update {measure(update):8.1f} ms')
+
+
+def main():
+	sizes = [float(s) for s in sys.argv[1:]] or [1, 5, 10]
+	with tempfile.TemporaryDirectory() as directory:
+		for size_mb in sizes:
+			bench(size_mb, Path(directory))
+
+
+if __name__ == '__main__':
+	main()
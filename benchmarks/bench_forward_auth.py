@@ -0,0 +1,172 @@
+"""
+Compares the forwardAuth endpoints served through FastAPI's request handling with the raw ASGI endpoints.
+
+- fastapi: the auth handlers behind a FastAPI route with the Cookie and Header parameters and the
+  Response injection the endpoints had before
+- raw: the endpoints of `web.internal`, served by `RawEndpoint`
+
+Both run the same auth logic on a database with one app and one paired terminal,
+so the difference is the cost of the request handling.
+Requests are sent directly to the ASGI app by a number of concurrent clients, without a server in between.
+
+Run with `python benchmarks/bench_forward_auth.py [concurrency ...]` from the repository root.
+"""
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import gconf
+from fastapi import FastAPI, Request, Response, Cookie, Header
+
+REQUESTS = 5000
+
+APP_META = {
+	'v': '1.0',
+	'app_version': '1.0.0',
+	'name': 'bench_app',
+	'icon': 'icon.svg',
+	'entrypoints': [{'container_name': 'bench_app', 'container_port': 80, 'entrypoint_port': 'http'}],
+	'paths': {
+		'': {'access': 'private', 'headers': {
+			'X-Ptl-Client-Id': '{{ auth.client_id }}',
+			'X-Ptl-ID': '{{ portal.id }}',
+		}},
+		'/public': {'access': 'public'},
+	},
+	'lifecycle': {'always_on': False, 'idle_time_for_shutdown': 3600},
+}
+
+
+def setup_shard() -> str:
+	"""
+	Creates the database with an app and a terminal, returns the cookie of the terminal.
+	"""
+	from shard_core.database import database
+	from shard_core.database.database import installed_apps_table, terminals_table
+	from shard_core.model.app_meta import InstalledApp, Status
+	from shard_core.model.terminal import Terminal
+	from shard_core.service import identity, pairing
+	from shard_core.service.app_tools import get_installed_apps_path
+
+	database.init_database()
+	identity.init_default_identity()
+	with installed_apps_table() as installed_apps:
+		installed_apps.insert(InstalledApp(name='bench_app', status=Status.RUNNING).dict())
+	app_dir = get_installed_apps_path() / 'bench_app'
+	app_dir.mkdir(parents=True)
+	(app_dir / 'app_meta.json').write_text(json.dumps(APP_META))
+
+	terminal = Terminal.create('bench terminal')
+	with terminals_table() as terminals:
+		terminals.insert(terminal.dict())
+	return f'authorization={pairing.create_terminal_jwt(terminal.id)}'
+
+
+def fastapi_app() -> FastAPI:
+	from shard_core.web.internal import auth
+
+	app = FastAPI()
+
+	@app.get('/internal/authenticate_terminal')
+	async def authenticate_terminal(request: Request, response: Response, authorization: str = Cookie(None)):
+		response.headers.update(await auth.authenticate_terminal(request))
+
+	@app.get('/internal/auth')
+	async def authenticate_and_authorize(
+			request: Request,
+			response: Response,
+			authorization: str = Cookie(None),
+			x_forwarded_host: str = Header(None),
+			x_forwarded_uri: str = Header(None),
+	):
+		response.headers.update(await auth.authenticate_and_authorize(request))
+
+	return app
+
+
+def raw_app() -> FastAPI:
+	from shard_core.web import internal
+
+	app = FastAPI()
+	app.include_router(internal.router)
+	return app
+
+
+async def call(app, path: str, headers: dict) -> int:
+	scope = {
+		'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+		'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+		'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+		'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8080),
+	}
+	status = 0
+
+	async def receive():
+		return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+	async def send(message):
+		nonlocal status
+		if message['type'] == 'http.response.start':
+			status = message['status']
+
+	await app(scope, receive, send)
+	return status
+
+
+async def measure(app, path: str, headers: dict, expected_status: int, concurrency: int):
+	latencies = []
+
+	async def client(count: int):
+		for _ in range(count):
+			start = time.perf_counter()
+			status = await call(app, path, headers)
+			latencies.append(time.perf_counter() - start)
+			assert status == expected_status, status
+
+	start = time.perf_counter()
+	await asyncio.gather(*(client(REQUESTS // concurrency) for _ in range(concurrency)))
+	duration = time.perf_counter() - start
+	latencies.sort()
+	p99 = latencies[int(len(latencies) * 0.99)] * 1000
+	return len(latencies) / duration, statistics.median(latencies) * 1000, p99
+
+
+async def bench(concurrency: int, cookie: str):
+	cases = [
+		('terminal', '/internal/authenticate_terminal', {'Cookie': cookie}, 200),
+		('public path', '/internal/auth',
+			{'X-Forwarded-Host': 'bench_app.shard.example', 'X-Forwarded-Uri': '/public/index.html'}, 200),
+		('private path', '/internal/auth',
+			{'X-Forwarded-Host': 'bench_app.shard.example', 'X-Forwarded-Uri': '/', 'Cookie': cookie}, 200),
+		('denied', '/internal/auth',
+			{'X-Forwarded-Host': 'bench_app.shard.example', 'X-Forwarded-Uri': '/'}, 401),
+	]
+	apps = {'fastapi': fastapi_app(), 'raw': raw_app()}
+	for name, path, headers, expected_status in cases:
+		for app_name, app in apps.items():
+			await measure(app, path, headers, expected_status, concurrency)  # warm up
+			rps, p50, p99 = await measure(app, path, headers, expected_status, concurrency)
+			print(
+				f'{concurrency:>3} clients | {name:<12} | {app_name:<7} | '
+				f'{rps:8.0f} req/s | p50 {p50:6.2f} ms | p99 {p99:6.2f} ms')
+
+
+def main():
+	concurrencies = [int(n) for n in sys.argv[1:]] or [1, 16]
+	gconf.load('config.yml')
+	with tempfile.TemporaryDirectory() as directory, gconf.override_conf({'path_root': directory}):
+		Path(directory, 'core').mkdir()
+		cookie = setup_shard()
+		for concurrency in concurrencies:
+			asyncio.run(bench(concurrency, cookie))
+
+		from shard_core.database import database
+		database.close_database()
+
+
+if __name__ == '__main__':
+	main()
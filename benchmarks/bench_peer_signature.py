@@ -0,0 +1,96 @@
+"""
+Compares verifying the signature of a forwarded peer request before and after the native verifier.
+
+- prepared request: what `verify_peer_auth` did before, copying the headers, body and query params
+  into a `requests.PreparedRequest` (re-encoding the URL) and verifying it with `HTTPSignatureAuth.verify`
+- native: `http_signatures.verify_request` on the Starlette headers and the `X-Forwarded-*` values,
+  hashing the body only for the covered content digest
+
+Both resolve the same already loaded 4096 bit peer key, so the difference is the handling of the request.
+Requests are signed GETs without a body and POSTs with bodies of increasing size.
+
+Run with `python benchmarks/bench_peer_signature.py [body size in bytes ...]`.
+"""
+import statistics
+import sys
+import time
+
+import requests
+from http_message_signatures import HTTPSignatureKeyResolver, algorithms
+from requests_http_signature import HTTPSignatureAuth
+from starlette.datastructures import Headers, QueryParams
+
+from shard_core.service import crypto
+from shard_core.service.http_signatures import SignedRequest, verify_request
+
+ITERATIONS = 200
+HOST = 'bench_app.shard.example'
+URI = '/peer/items/some%20item?filter=recent&page=2'
+
+
+class KeyResolver(HTTPSignatureKeyResolver):
+	def __init__(self, public_key: crypto.PublicKey):
+		self.public_key = public_key
+
+	def resolve_public_key(self, key_id: str):
+		return self.public_key.key
+
+
+def forwarded_request(private_key: crypto.PrivateKey, body: bytes) -> tuple[Headers, bytes]:
+	method = 'POST' if body else 'GET'
+	auth = HTTPSignatureAuth(signature_algorithm=algorithms.RSA_PSS_SHA512, key_id='peer', key=private_key.to_bytes())
+	signed = auth(requests.Request(method, f'https://{HOST}{URI}', data=body or None).prepare())
+	headers = dict(signed.headers)
+	headers.update({
+		'X-Forwarded-Method': method,
+		'X-Forwarded-Proto': 'https',
+		'X-Forwarded-Host': HOST,
+		'X-Forwarded-Uri': URI,
+		'X-Forwarded-For': '10.0.0.1',
+		'X-Real-Ip': '10.0.0.1',
+		'User-Agent': 'python-requests',
+		'Accept': '*/*',
+	})
+	return Headers(headers=headers), body
+
+
+def verify_prepared(headers: Headers, body: bytes, key_resolver: KeyResolver):
+	prepared_request = requests.Request(
+		method=headers['X-Forwarded-Method'],
+		url=f'{headers["X-Forwarded-proto"]}://{headers["X-Forwarded-host"]}{headers["X-Forwarded-uri"]}',
+		headers=headers,
+		data=body,
+		params=QueryParams(''),
+	).prepare()
+	HTTPSignatureAuth.verify(prepared_request, signature_algorithm=algorithms.RSA_PSS_SHA512, key_resolver=key_resolver)
+
+
+def verify_native(headers: Headers, body: bytes, key_resolver: KeyResolver):
+	target_uri = f'{headers["X-Forwarded-proto"]}://{headers["X-Forwarded-host"]}{headers["X-Forwarded-uri"]}'
+	verify_request(SignedRequest(headers['X-Forwarded-Method'], target_uri, headers), body, key_resolver)
+
+
+def measure(verify, headers: Headers, body: bytes, key_resolver: KeyResolver):
+	latencies = []
+	for _ in range(ITERATIONS):
+		start = time.perf_counter()
+		verify(headers, body, key_resolver)
+		latencies.append(time.perf_counter() - start)
+	latencies.sort()
+	return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+	body_sizes = [int(n) for n in sys.argv[1:]] or [0, 1024, 1024 ** 2, 16 * 1024 ** 2]
+	private_key = crypto.PrivateKey()
+	key_resolver = KeyResolver(private_key.get_public_key())
+	for body_size in body_sizes:
+		headers, body = forwarded_request(private_key, b'x' * body_size)
+		for name, verify in [('prepared request', verify_prepared), ('native', verify_native)]:
+			verify(headers, body, key_resolver)  # warm up
+			p50, p99 = measure(verify, headers, body, key_resolver)
+			print(f'{body_size:>9} byte body | {name:<16} | p50 {p50:7.3f} ms | p99 {p99:7.3f} ms')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,337 @@
+"""
+Load test of the forwardAuth endpoint with traffic like Traefik sends it, runnable offline.
+
+It creates a shard in a temporary `path_root` with a number of installed apps, paired terminals and peers.
+Then it replays a mix of forwardAuth calls to `/internal/auth` from concurrent clients, directly over ASGI:
+
+- public: anonymous requests to public paths
+- private: requests to private paths with the cookie of a paired terminal
+- invalid cookie: requests to private paths with a tampered token or the token of an unknown terminal
+- peer: requests to peer paths, signed by a peer like `signed_call` does
+- invalid signature: requests to peer paths with a tampered signature
+- unknown app: requests for an app that is not installed
+
+Signed requests are prepared before the run, so signing does not count.
+While the run lasts, a task measures how late the event loop wakes it up, which shows blocking work on the loop.
+
+Results are printed and can be written as JSON with `--output`.
+With `--baseline`, the run is compared to such a file and the exit code is 1 if throughput dropped
+or the p99 latency grew by more than `--tolerance`, so it can gate changes to the auth code.
+
+Run with `python benchmarks/load_forward_auth.py --help` from the repository root.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import gconf
+import requests
+from http_message_signatures import algorithms
+from requests_http_signature import HTTPSignatureAuth
+
+DOMAIN = 'shard.example'
+
+# relative frequency of the kinds of requests
+TRAFFIC_MIX = {
+	'public': 30,
+	'private': 40,
+	'invalid cookie': 8,
+	'peer': 15,
+	'invalid signature': 4,
+	'unknown app': 3,
+}
+EXPECTED_STATUS = {
+	'public': 200,
+	'private': 200,
+	'invalid cookie': 401,
+	'peer': 200,
+	'invalid signature': 401,
+	'unknown app': 404,
+}
+SIGNED_REQUESTS_PER_PEER = 20
+LOOP_LAG_INTERVAL = 0.005  # seconds
+
+
+@dataclass
+class Shard:
+	apps: List[str]
+	cookies: List[str]
+	invalid_cookies: List[str]
+	peer_keys: List[Tuple[str, bytes]]
+
+
+@dataclass
+class Call:
+	kind: str
+	headers: List[Tuple[bytes, bytes]]
+
+
+def make_app_meta(name: str) -> Dict:
+	return {
+		'v': '1.0',
+		'app_version': '1.0.0',
+		'name': name,
+		'icon': 'icon.svg',
+		'entrypoints': [{'container_name': name, 'container_port': 80, 'entrypoint_port': 'http'}],
+		'paths': {
+			'': {'access': 'private', 'headers': {
+				'X-Ptl-Client-Id': '{{ auth.client_id }}',
+				'X-Ptl-Client-Name': '{{ auth.client_name }}',
+				'X-Ptl-ID': '{{ portal.id }}',
+			}},
+			'/public': {'access': 'public', 'headers': {'X-Ptl-Client-Type': '{{ auth.client_type }}'}},
+			'/peer': {'access': 'peer', 'headers': {'X-Ptl-Client-Id': '{{ auth.client_id }}'}},
+		},
+		'lifecycle': {'always_on': False, 'idle_time_for_shutdown': 3600},
+	}
+
+
+def setup_shard(app_count: int, terminal_count: int, peer_count: int) -> Shard:
+	from shard_core.database import database
+	from shard_core.database.database import installed_apps_table, terminals_table, peers_table
+	from shard_core.model.app_meta import InstalledApp, Status
+	from shard_core.model.peer import Peer
+	from shard_core.model.terminal import Terminal
+	from shard_core.service import identity, pairing
+	from shard_core.service.app_tools import get_installed_apps_path
+	from shard_core.service.crypto import PrivateKey
+
+	database.init_database()
+	identity.init_default_identity()
+
+	apps = [f'app{i}' for i in range(app_count)]
+	with installed_apps_table() as installed_apps:
+		installed_apps.insert_multiple(InstalledApp(name=a, status=Status.RUNNING).dict() for a in apps)
+	for app in apps:
+		app_dir = get_installed_apps_path() / app
+		app_dir.mkdir(parents=True)
+		(app_dir / 'app_meta.json').write_text(json.dumps(make_app_meta(app)))
+
+	terminals = [Terminal.create(f'terminal {i}') for i in range(terminal_count)]
+	with terminals_table() as terminals_:
+		terminals_.insert_multiple(t.dict() for t in terminals)
+	tokens = [pairing.create_terminal_jwt(t.id) for t in terminals]
+	cookies = [f'authorization={token}' for token in tokens]
+	invalid_cookies = [
+		*(f'authorization={token[:-4]}AAAA' for token in tokens),
+		f'authorization={pairing.create_terminal_jwt("unknown")}',
+	]
+
+	peer_keys = []
+	for i in range(peer_count):
+		private_key = PrivateKey()
+		public_key = private_key.get_public_key()
+		peer = Peer(id=public_key.to_hash_id(), name=f'peer {i}', public_bytes_b64=public_key.to_bytes().decode())
+		with peers_table() as peers:
+			peers.insert(peer.dict())
+		peer_keys.append((peer.short_id, private_key.to_bytes()))
+
+	return Shard(apps, cookies, invalid_cookies, peer_keys)
+
+
+def forward_auth_headers(app: str, uri: str, **headers: str) -> List[Tuple[bytes, bytes]]:
+	headers = {
+		'X-Forwarded-Method': 'GET',
+		'X-Forwarded-Proto': 'https',
+		'X-Forwarded-Host': f'{app}.{DOMAIN}',
+		'X-Forwarded-Uri': uri,
+		**headers,
+	}
+	return [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+
+
+def signed_headers(app: str, uri: str, key_id: str, key: bytes, tamper: bool) -> List[Tuple[bytes, bytes]]:
+	auth = HTTPSignatureAuth(signature_algorithm=algorithms.RSA_PSS_SHA512, key_id=key_id, key=key)
+	request = auth(requests.Request('GET', f'https://{app}.{DOMAIN}{uri}').prepare())
+	signature = request.headers['signature']
+	if tamper:
+		signature = signature[:-6] + ('AAAAA=' if not signature.endswith('AAAAA=') else 'BBBBB=')
+	return forward_auth_headers(app, uri, **{
+		'signature-input': request.headers['signature-input'],
+		'signature': signature,
+		'date': request.headers['date'],
+	})
+
+
+def make_calls(shard: Shard, count: int, rng: random.Random) -> List[Call]:
+	kinds = [k for k in TRAFFIC_MIX if shard.peer_keys or k not in ('peer', 'invalid signature')]
+	signed = {
+		tamper: [
+			signed_headers(rng.choice(shard.apps), f'/peer/item/{i}', key_id, key, tamper)
+			for key_id, key in shard.peer_keys for i in range(SIGNED_REQUESTS_PER_PEER)]
+		for tamper in (False, True)}
+
+	calls = []
+	for kind in rng.choices(kinds, weights=[TRAFFIC_MIX[k] for k in kinds], k=count):
+		app = rng.choice(shard.apps)
+		page = f'/{rng.choice(["index.html", "api/items", "static/app.js", "dav/file.txt"])}'
+		if kind == 'public':
+			headers = forward_auth_headers(app, f'/public{page}')
+		elif kind == 'private':
+			headers = forward_auth_headers(app, page, cookie=rng.choice(shard.cookies))
+		elif kind == 'invalid cookie':
+			headers = forward_auth_headers(app, page, cookie=rng.choice(shard.invalid_cookies))
+		elif kind == 'peer':
+			headers = rng.choice(signed[False])
+		elif kind == 'invalid signature':
+			headers = rng.choice(signed[True])
+		else:
+			headers = forward_auth_headers('unknown', page)
+		calls.append(Call(kind, headers))
+	return calls
+
+
+async def send_call(app, call: Call) -> int:
+	scope = {
+		'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+		'path': '/internal/auth', 'raw_path': b'/internal/auth', 'query_string': b'', 'root_path': '',
+		'headers': call.headers, 'client': ('172.17.0.1', 50000), 'server': ('172.17.0.2', 80),
+	}
+	status = 0
+
+	async def receive():
+		return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+	async def send(message):
+		nonlocal status
+		if message['type'] == 'http.response.start':
+			status = message['status']
+
+	await app(scope, receive, send)
+	return status
+
+
+async def run_load(app, calls: List[Call], concurrency: int) -> Dict:
+	latencies: Dict[str, List[float]] = {kind: [] for kind in TRAFFIC_MIX}
+	unexpected: Dict[str, int] = {}
+	loop_lags: List[float] = []
+	queue = iter(calls)
+	running = True
+
+	async def client():
+		for call in queue:
+			start = time.perf_counter()
+			status = await send_call(app, call)
+			latencies[call.kind].append(time.perf_counter() - start)
+			if status != EXPECTED_STATUS[call.kind]:
+				key = f'{call.kind}: {status}'
+				unexpected[key] = unexpected.get(key, 0) + 1
+
+	async def monitor_loop_lag():
+		while running:
+			start = time.perf_counter()
+			await asyncio.sleep(LOOP_LAG_INTERVAL)
+			loop_lags.append(time.perf_counter() - start - LOOP_LAG_INTERVAL)
+
+	monitor = asyncio.create_task(monitor_loop_lag())
+	start = time.perf_counter()
+	await asyncio.gather(*(client() for _ in range(concurrency)))
+	duration = time.perf_counter() - start
+	running = False
+	await monitor
+
+	all_latencies = [latency for kind_latencies in latencies.values() for latency in kind_latencies]
+	return {
+		'requests': len(all_latencies),
+		'duration': duration,
+		'throughput': len(all_latencies) / duration,
+		'latency': percentiles(all_latencies),
+		'latency_by_kind': {kind: percentiles(values) for kind, values in latencies.items() if values},
+		'loop_lag': percentiles(loop_lags),
+		'unexpected_status': unexpected,
+	}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+	values = sorted(values)
+	if not values:
+		return {}
+
+	def at(q: float) -> float:
+		return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+	return {'count': len(values), 'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': values[-1] * 1000}
+
+
+def print_result(result: Dict):
+	print(f'{result["requests"]} requests in {result["duration"]:.2f} s: {result["throughput"]:.0f} req/s')
+	print(f'{"":<18} {"count":>7} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+	rows = [('all', result['latency']), *result['latency_by_kind'].items(), ('event loop lag', result['loop_lag'])]
+	for name, p in rows:
+		print(f'{name:<18} {p["count"]:>7} {p["p50"]:>8.2f} {p["p90"]:>8.2f} {p["p99"]:>8.2f} {p["max"]:>8.2f}')
+	for key, count in result['unexpected_status'].items():
+		print(f'unexpected status for {key} x {count}')
+
+
+def regressions(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+	found = []
+	if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+		found.append(f'throughput {result["throughput"]:.0f} req/s, baseline {baseline["throughput"]:.0f} req/s')
+	for name, current, base in [
+		('p99 latency', result['latency'], baseline['latency']),
+		('p99 event loop lag', result['loop_lag'], baseline['loop_lag']),
+	]:
+		if current['p99'] > base['p99'] * (1 + tolerance):
+			found.append(f'{name} {current["p99"]:.2f} ms, baseline {base["p99"]:.2f} ms')
+	if result['unexpected_status']:
+		found.append(f'unexpected status codes: {result["unexpected_status"]}')
+	return found
+
+
+async def run(args, shard: Shard) -> Dict:
+	from fastapi import FastAPI
+	from shard_core.web import internal
+
+	app = FastAPI()
+	app.include_router(internal.router)
+	rng = random.Random(args.seed)
+	await run_load(app, make_calls(shard, min(args.requests, 1000), rng), args.concurrency)  # warm up
+	return await run_load(app, make_calls(shard, args.requests, rng), args.concurrency)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--apps', type=int, default=20, help='number of installed apps')
+	parser.add_argument('--terminals', type=int, default=10, help='number of paired terminals')
+	parser.add_argument('--peers', type=int, default=4, help='number of peers, each needs a 4096 bit key')
+	parser.add_argument('--requests', type=int, default=20000)
+	parser.add_argument('--concurrency', type=int, default=32, help='number of concurrent clients')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', type=Path, help='write the result as JSON')
+	parser.add_argument('--baseline', type=Path, help='JSON result of an earlier run to compare with')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+	args = parser.parse_args()
+
+	gconf.load('config.yml')
+	with tempfile.TemporaryDirectory() as directory, gconf.override_conf({
+		'path_root': directory,
+		'log': {'levels': {'shard_core': 'warning'}},
+	}):
+		Path(directory, 'core').mkdir()
+		shard = setup_shard(args.apps, args.terminals, args.peers)
+		result = asyncio.run(run(args, shard))
+
+		from shard_core.database import database
+		database.close_database()
+
+	result['config'] = {k: v for k, v in vars(args).items() if k in ('apps', 'terminals', 'peers', 'concurrency')}
+	print_result(result)
+	if args.output:
+		args.output.write_text(json.dumps(result, indent=2))
+
+	if args.baseline:
+		found = regressions(result, json.loads(args.baseline.read_text()), args.tolerance)
+		for regression in found:
+			print(f'REGRESSION: {regression}')
+		sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+	main()
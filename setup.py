@@ -28,10 +28,9 @@ setup(
 		'psycopg[binary]',
 		'cachetools',
 		'blinker',
-		'requests',
 		'aiohttp',
 		'cryptography',
-		'requests-http-signature',
+		'http-message-signatures',
 		'aiozipstream',
 		'email_validator',
 		'croniter',
@@ -41,6 +40,7 @@ setup(
 		'python-multipart',
 		'aiofiles',
 		'httpx',
+		'orjson',
 	],
 	extras_require={
 		'dev': [
@@ -51,7 +51,9 @@ setup(
 			'pytest-mock',
 			'pytest-asyncio',
 			'yappi',
-			'responses',
+			'requests',
+			'requests-http-signature',
+			'respx',
 			'aioresponses',
 			'datamodel-code-generator[http]'
 		]
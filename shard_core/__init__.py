@@ -9,11 +9,13 @@ from typing import List
 import gconf
 import jinja2
 from fastapi import FastAPI
-from requests import ConnectionError, HTTPError
+from httpx import HTTPError
 
 from .database import database
 from .service import app_installation, identity, app_lifecycle, peer, \
-	app_usage_reporting, websocket, migration, portal_controller, backup, disk
+	app_usage_reporting, websocket, migration, portal_controller, backup, disk, database_compaction, \
+	last_access
+from .service.http_client import http_client_lifespan
 from .service.app_tools import docker_stop_all_apps, docker_shutdown_all_apps, docker_prune_images
 from .service.backup import start_backup
 from .util.async_util import PeriodicTask, BackgroundTask, CronTask
@@ -62,29 +64,32 @@ def configure_logging():
 
 @asynccontextmanager
 async def lifespan(_):
-	await app_installation.login_docker_registries()
-	await migration.migrate()
-	await app_installation.refresh_init_apps()
-	backup.ensure_backup_passphrase()
-	try:
-		await portal_controller.refresh_profile()
-	except (ConnectionError, HTTPError) as e:
-		log.error(f'could not refresh profile: {e}')
-
-	background_tasks = make_background_tasks()
-	for t in background_tasks:
-		t.start()
-
-	log.info('Startup complete')
-	yield  # === run app ===
-	log.info('Shutting down')
-
-	for t in background_tasks:
-		t.stop()
-	for t in background_tasks:
-		await t.wait()
-	await docker_stop_all_apps()
-	await docker_shutdown_all_apps(force=True)
+	async with http_client_lifespan():
+		await app_installation.login_docker_registries()
+		await migration.migrate()
+		await app_installation.refresh_init_apps()
+		backup.ensure_backup_passphrase()
+		try:
+			await portal_controller.refresh_profile()
+		except HTTPError as e:
+			log.error(f'could not refresh profile: {e}')
+
+		background_tasks = make_background_tasks()
+		for t in background_tasks:
+			t.start()
+
+		log.info('Startup complete')
+		yield  # === run app ===
+		log.info('Shutting down')
+
+		for t in background_tasks:
+			t.stop()
+		for t in background_tasks:
+			await t.wait()
+		await last_access.flush_last_access()
+		await docker_stop_all_apps()
+		await docker_shutdown_all_apps(force=True)
+		database.close_database()
 
 
 def make_background_tasks() -> List[BackgroundTask]:
@@ -111,7 +116,12 @@ def make_background_tasks() -> List[BackgroundTask]:
 			cron=gconf.get('services.backup.timing.base_schedule'),
 			max_random_delay=gconf.get('services.backup.timing.max_random_delay'),
 		),
+		CronTask(
+			database_compaction.compact_database,
+			gconf.get('database.compaction.schedule'),
+		),
 		PeriodicTask(disk.update_disk_space, 3),
+		PeriodicTask(last_access.flush_last_access, gconf.get('last_access.flush_interval', default=60)),
 		websocket.ws_worker,
 	]
 
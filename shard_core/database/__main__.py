@@ -0,0 +1,58 @@
+import argparse
+import logging
+import os
+import sys
+
+import gconf
+
+from shard_core.database import database
+from shard_core.database.codec import OrjsonCodec
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		prog='python -m shard_core.database',
+		description='Maintenance of the shard_core database. Stop shard_core before running a command that writes, '
+					'a running core neither sees its changes nor keeps them.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	subparsers.add_parser(
+		'migrate-to-sqlite',
+		help='import the TinyDB JSON database into the SQLite database, set database.engine to sqlite afterwards')
+	subparsers.add_parser(
+		'compact', help='roll up app usage tracks and summarize backup reports according to their retention')
+	export_parser = subparsers.add_parser(
+		'export', help='write all tables as indented and sorted JSON in the format of the TinyDB database file')
+	export_parser.add_argument('output', nargs='?', help='file to write to, default is stdout')
+	args = parser.parse_args()
+
+	for c in os.environ.get('CONFIG', 'config.yml').split(','):
+		gconf.load(c)
+	logging.basicConfig(level=logging.INFO)
+
+	if args.command == 'migrate-to-sqlite':
+		counts = database.migrate_to_sqlite()
+		for table, count in sorted(counts.items()):
+			print(f'{table}: {count} documents')
+	elif args.command == 'compact':
+		from shard_core.service import database_compaction
+		database_compaction.compact()
+	elif args.command == 'export':
+		content = OrjsonCodec(pretty=True).dumps(_all_tables())
+		if args.output:
+			with open(args.output, 'wb') as f:
+				f.write(content)
+		else:
+			sys.stdout.buffer.write(content)
+	database.close_database()
+
+
+def _all_tables():
+	all_tables = {}
+	for name in sorted(database.table_names()):
+		with database.open_table(name) as table:
+			all_tables[name] = {str(doc.doc_id): doc for doc in table.all()}
+	return all_tables
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,148 @@
+import copy
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Iterable, Iterator
+
+from cachetools import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Change:
+	"""
+	A document of a table was inserted, updated or removed. `old` is None for inserts and `new` for removals.
+	Without a `doc_id`, the whole table may have changed, e.g. because the database was opened again.
+	"""
+	table: str
+	doc_id: int | None = None
+	old: Dict | None = None
+	new: Dict | None = None
+
+
+Subscriber = Callable[[Change], None]
+
+# Lists are replaced instead of modified, so that publishing can iterate them without a lock.
+_subscribers: Dict[str, List[Subscriber]] = {}
+_subscribers_lock = threading.Lock()
+_pending = threading.local()
+
+
+def subscribe(table: str, callback: Subscriber):
+	"""
+	Calls `callback` with every change of `table`.
+	Callbacks are called in the writing thread, in order of the changes, while it still holds the table lock.
+	So they must be quick and must not access the database, slow work belongs on another thread or the event loop.
+	"""
+	with _subscribers_lock:
+		_subscribers[table] = [*_subscribers.get(table, []), callback]
+
+
+def unsubscribe(table: str, callback: Subscriber):
+	with _subscribers_lock:
+		_subscribers[table] = [s for s in _subscribers.get(table, []) if s != callback]
+
+
+def has_subscribers(table: str) -> bool:
+	return bool(_subscribers.get(table))
+
+
+def diff(table: str, before: Dict[int, Dict], after: Dict[int, Dict]) -> List[Change]:
+	return [
+		Change(table, doc_id, before.get(doc_id), copy.deepcopy(after.get(doc_id)))
+		for doc_id in sorted(before.keys() | after.keys())
+		if before.get(doc_id) != after.get(doc_id)]
+
+
+def record(changes: Iterable[Change]):
+	"""
+	Publishes changes once the calling thread leaves its outermost `collecting` block, or right away outside of one.
+	"""
+	if getattr(_pending, 'depth', 0):
+		_pending.changes.extend(changes)
+	else:
+		_publish(changes)
+
+
+def reset(tables: Iterable[str] | None = None):
+	"""
+	Tells the subscribers of the given tables, or of all tables, that their table may have changed as a whole.
+	"""
+	record([Change(table) for table in (tables if tables is not None else list(_subscribers))])
+
+
+@contextmanager
+def collecting() -> Iterator[int]:
+	"""
+	Holds back the changes recorded by the calling thread until its outermost block ends.
+	Yields the number of changes held back before the block, for `discard`.
+	"""
+	depth = getattr(_pending, 'depth', 0)
+	if not depth:
+		_pending.changes = []
+	_pending.depth = depth + 1
+	try:
+		yield len(_pending.changes)
+	finally:
+		_pending.depth = depth
+		if not depth:
+			changes, _pending.changes = _pending.changes, []
+			_publish(changes)
+
+
+def discard(start: int):
+	"""
+	Drops the changes held back since `start`, because they were rolled back.
+	"""
+	del _pending.changes[start:]
+
+
+def _publish(changes: Iterable[Change]):
+	for change in changes:
+		for callback in _subscribers.get(change.table, []):
+			try:
+				callback(change)
+			except Exception as e:
+				log.error(f'error in subscriber of {change.table} changes: {type(e).__name__}({e})')
+
+
+def cached_until_change(*tables: str, maxsize: int = 32):
+	"""
+	Caches the results of a function until one of the tables it reads changes.
+	Only changes made by this process are seen, writes from another process, like the database CLI,
+	are not noticed until the database is opened again.
+	"""
+
+	def decorator(func):
+		cache = LRUCache(maxsize)
+		lock = threading.Lock()
+		generation = 0
+
+		def invalidate(_: Change = None):
+			nonlocal generation
+			with lock:
+				generation += 1
+				cache.clear()
+
+		@functools.wraps(func)
+		def wrapper(*args):
+			with lock:
+				if args in cache:
+					return cache[args]
+				start_generation = generation
+			result = func(*args)
+			with lock:
+				# a change during the call may have made the result outdated already
+				if generation == start_generation:
+					cache[args] = result
+			return result
+
+		for table in tables:
+			subscribe(table, invalidate)
+		wrapper.cache_clear = invalidate
+		return wrapper
+
+	return decorator
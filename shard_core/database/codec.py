@@ -0,0 +1,84 @@
+import datetime
+import json
+from typing import Any
+
+import orjson
+from tinydb_serialization.serializers import DateTimeSerializer
+
+# Same format as tinydb_serialization's SerializationMiddleware with the DateTimeSerializer registered as 'TinyDate'
+DATETIME_TAG = '{TinyDate}:'
+_datetime_serializer = DateTimeSerializer()
+
+
+class JSONCodec:
+	"""
+	Codec of the standard library json module. It expects datetimes to be tagged already,
+	e.g. by the SerializationMiddleware.
+	`dumps_document` gives a canonical compact string of a single document.
+	"""
+
+	def __init__(self, **kwargs):
+		self.kwargs = kwargs
+
+	def dumps(self, data: Any) -> str:
+		return json.dumps(data, **self.kwargs)
+
+	def loads(self, content: str | bytes) -> Any:
+		return json.loads(content)
+
+	def dumps_document(self, document: Any) -> str:
+		return json.dumps(document, sort_keys=True, separators=(',', ':'))
+
+
+class OrjsonCodec:
+	"""
+	Compact codec based on orjson that tags and untags datetimes itself,
+	so it replaces the SerializationMiddleware and reads and writes the same `{TinyDate}:` values.
+	"""
+
+	def __init__(self, pretty: bool = False):
+		self.option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+		self.pretty = pretty
+
+	def dumps(self, data: Any) -> bytes:
+		option = self.option | (orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if self.pretty else 0)
+		return orjson.dumps(data, default=_tag_datetime, option=option)
+
+	def loads(self, content: str | bytes) -> Any:
+		return untag_datetimes(orjson.loads(content))
+
+	def dumps_document(self, document: Any) -> str:
+		return orjson.dumps(document, default=_tag_datetime, option=self.option | orjson.OPT_SORT_KEYS).decode()
+
+
+def _tag_datetime(value):
+	if isinstance(value, datetime.datetime):
+		return DATETIME_TAG + _datetime_serializer.encode(value)
+	raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def tag_datetimes(value: Any):
+	if isinstance(value, datetime.datetime):
+		return DATETIME_TAG + _datetime_serializer.encode(value)
+	if isinstance(value, dict):
+		return {k: tag_datetimes(v) for k, v in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [tag_datetimes(v) for v in value]
+	return value
+
+
+def untag_datetimes(value: Any):
+	if type(value) is str:
+		return _datetime_serializer.decode(value[len(DATETIME_TAG):]) if value.startswith(DATETIME_TAG) else value
+	_untag_datetimes_in_place(value)
+	return value
+
+
+def _untag_datetimes_in_place(container: dict | list):
+	for key, value in container.items() if type(container) is dict else enumerate(container):
+		value_type = type(value)
+		if value_type is str:
+			if value.startswith(DATETIME_TAG):
+				container[key] = _datetime_serializer.decode(value[len(DATETIME_TAG):])
+		elif value_type is dict or value_type is list:
+			_untag_datetimes_in_place(value)
@@ -1,24 +1,76 @@
+import asyncio
+import atexit
+import copy
+import functools
 import logging
 import threading
 import time
-import traceback
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Dict, Set, Callable, TypeVar, List, Tuple, Any, Generic, Type
 
 import gconf
+import pydantic
 from tinydb import TinyDB, Query, JSONStorage
-from tinydb.table import Table
+from tinydb.table import Table, Document
 from tinydb_serialization import SerializationMiddleware
 from tinydb_serialization.serializers import DateTimeSerializer
 
+from shard_core.database import sqlite, metrics, changes
+from shard_core.database.codec import OrjsonCodec
+from shard_core.database.index import IndexedTinyDB
+from shard_core.database.locking import TableLock
+from shard_core.database.storage import AtomicJSONStorage, WriteBehindMiddleware, JournalStorage
+
 log = logging.getLogger(__name__)
 
+DEFAULT_TABLE = '_default'
+
 global_db_lock = threading.RLock()
 
+# In the single file layout, all table locks share the global lock, because every table lives in the same document.
+# In the sharded layout, every table has its own file and its own lock.
+_single_file_table_locks: Dict[str, TableLock] = {}
+_sharded_table_locks: Dict[str, TableLock] = {}
+_table_locks_lock = threading.Lock()
+
+_resident_dbs: Dict[Path, TinyDB] = {}
+_sqlite_dbs: Dict[Path, sqlite.SQLiteDatabase] = {}
+
+_executor: ThreadPoolExecutor | None = None
+
+# The key value store of the default table, loaded on first read and kept up to date by its accessors.
+# Other access to the default table drops it.
+_values: Dict[str, Any] | None = None
+
+T = TypeVar('T')
+
 
 def init_database():
-	file = Path(gconf.get('path_root')) / 'core' / 'shard_core_db.json'
+	invalidate_values()
+	changes.reset()
+	if _is_sqlite():
+		sqlite_file = _sqlite_db_file()
+		if not sqlite_file.exists() and _single_db_file().is_file():
+			migrate_to_sqlite()
+		_get_sqlite_db()
+		return
+
+	if _is_sharded():
+		shard_dir = _shard_dir()
+		shard_dir.mkdir(parents=True, exist_ok=True)
+		single_file = _single_db_file()
+		has_single_file_data = any(f.stat().st_size for f in _storage_files(single_file))
+		if has_single_file_data and not any(shard_dir.glob('*.json')):
+			_split_into_shards(single_file, shard_dir)
+		if _is_resident():
+			for file in shard_dir.glob('*.json'):
+				with _lock_for(file.stem):
+					_get_resident_db(file)
+		return
+
+	file = _single_db_file()
 	if file.is_dir():
 		raise Exception(f'{file} is a directory, should be a file or not existing')
 	if not file.exists():
@@ -28,90 +80,551 @@ def init_database():
 	else:
 		log.debug(f'database already exists at {file}')
 
+	if _is_resident():
+		with global_db_lock:
+			_get_resident_db(file)
+
+
+def close_database():
+	global _executor
+	if _executor:
+		_executor.shutdown()
+		_executor = None
+	_close_resident_dbs()
+
+
+def _close_resident_dbs():
+	invalidate_values()
+	changes.reset()
+	with global_db_lock:
+		for file in list(_resident_dbs):
+			_resident_dbs.pop(file).close()
+		for file in list(_sqlite_dbs):
+			_sqlite_dbs.pop(file).close()
+
+
+atexit.register(close_database)
+
 
 @contextmanager
 def get_db() -> TinyDB:
-	serialization = SerializationMiddleware(JSONStorage)
-	serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
+	if _is_sharded() or _is_sqlite():
+		raise RuntimeError('get_db() is only available for the single file TinyDB database, use the table accessors')
+	with _open_db(_single_db_file(), global_db_lock, '*') as db:
+		try:
+			yield db
+		finally:
+			invalidate_values()
 
+
+@contextmanager
+def _locked(lock, table: str, site: metrics.CallSite | None = None):
+	site = site or metrics.call_site()
 	start_time = time.monotonic()
-	with global_db_lock:
+	with lock:
 		wait_time = time.monotonic()
-		with TinyDB(
-				Path(gconf.get('path_root')) / 'core' / 'shard_core_db.json',
-				storage=serialization,
-				sort_keys=True,
-				indent=2,
-				create_dirs=True,
-		) as db_:
-			yield db_
-		end_time = time.monotonic()
-		if end_time - start_time > 1:
-			log.debug(
-				f'waiting for db_lock for {wait_time - start_time :.3f}s, '
-				f'operation took {end_time - wait_time :.3f}s')
-			log.debug('Stacktrace:\n' + ''.join(traceback.format_stack()))
+		try:
+			with changes.collecting():
+				yield
+		finally:
+			metrics.record(table, site, wait_time - start_time, time.monotonic() - wait_time)
 
 
 @contextmanager
-def installed_apps_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('installed_apps')
+def _open_db(file: Path, lock, table: str, site: metrics.CallSite | None = None) -> TinyDB:
+	with _locked(lock, table, site):
+		if _is_resident():
+			yield _get_resident_db(file)
+		else:
+			serialization = SerializationMiddleware(JSONStorage)
+			serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
+			with IndexedTinyDB(
+					file,
+					storage=serialization,
+					sort_keys=True,
+					indent=2,
+					create_dirs=True,
+			) as db_:
+				yield db_
 
 
 @contextmanager
-def identities_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('identities')
+def _open_table(name: str, site: metrics.CallSite | None = None) -> Iterator[Table]:
+	if _is_sqlite():
+		with _locked(_lock_for(name), name, site):
+			yield _get_sqlite_db().table(name)
+		return
+	with _open_db(_db_file(name), _lock_for(name), name, site) as db:
+		yield db.table(name)
 
 
-@contextmanager
-def terminals_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('terminals')
+class TableContext:
+	"""
+	Returned by the table accessors.
+	Used with `with`, it holds the table lock for the whole block and yields the TinyDB table.
+	Used with `async with`, it yields an AsyncTable whose calls run on the database executor.
+	"""
 
+	def __init__(self, name: str):
+		self.name = name
+		self._context = None
 
-@contextmanager
-def peers_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('peers')
+	def __enter__(self) -> Table:
+		self._context = _open_table(self.name)
+		return self._context.__enter__()
 
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		_invalidate_values_of(self.name)
+		return self._context.__exit__(exc_type, exc_val, exc_tb)
 
-@contextmanager
-def backups_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('backups')
+	async def __aenter__(self) -> 'AsyncTable':
+		return AsyncTable(self.name)
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		pass
+
+
+class AsyncTable:
+	"""
+	Async view of a table. Every call waits for the table lock and does its storage I/O on the database executor,
+	so the event loop is never blocked.
+	The lock is taken per call, not for the whole `async with` block.
+	Steps that must not be interleaved with other writers go into a single `run` call.
+	"""
+
+	def __init__(self, name: str):
+		self.name = name
+
+	async def run(self, func: Callable[[Table], T]) -> T:
+		site = metrics.call_site()
+
+		def run_locked():
+			with _open_table(self.name, site) as table:
+				try:
+					return func(table)
+				finally:
+					_invalidate_values_of(self.name)
+
+		return await run_in_executor(run_locked)
+
+	async def all(self) -> List[Document]:
+		return await self.run(lambda t: t.all())
+
+	async def get(self, *args, **kwargs) -> Document | List[Document] | None:
+		return await self.run(lambda t: t.get(*args, **kwargs))
+
+	async def search(self, cond) -> List[Document]:
+		return await self.run(lambda t: t.search(cond))
+
+	async def contains(self, *args, **kwargs) -> bool:
+		return await self.run(lambda t: t.contains(*args, **kwargs))
+
+	async def count(self, cond) -> int:
+		return await self.run(lambda t: t.count(cond))
+
+	async def len(self) -> int:
+		return await self.run(lambda t: len(t))
+
+	async def insert(self, document) -> int:
+		return await self.run(lambda t: t.insert(document))
+
+	async def insert_multiple(self, documents) -> List[int]:
+		return await self.run(lambda t: t.insert_multiple(documents))
+
+	async def update(self, *args, **kwargs) -> List[int]:
+		return await self.run(lambda t: t.update(*args, **kwargs))
+
+	async def upsert(self, document, cond=None) -> List[int]:
+		return await self.run(lambda t: t.upsert(document, cond))
+
+	async def remove(self, *args, **kwargs) -> List[int]:
+		return await self.run(lambda t: t.remove(*args, **kwargs))
+
+	async def truncate(self):
+		return await self.run(lambda t: t.truncate())
+
+
+def open_table(name: str) -> TableContext:
+	return TableContext(name)
 
 
 @contextmanager
-def tours_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('tours')
+def transaction(*names: str) -> Iterator[Tuple[Table, ...]]:
+	"""
+	Gives access to several tables at once and yields them in the given order.
+	The locks of all tables are held for the whole block, they are taken in a fixed order to avoid deadlocks.
+	Changes are written with a single flush at the end of the block.
+	If the block raises, the tables are rolled back to their state at its start.
+	With the sharded layout, atomicity across tables ends at the process: a crash can leave some files written.
+	"""
+	site = metrics.call_site()
+	with ExitStack() as stack:
+		for name in sorted(set(names)):
+			stack.enter_context(_locked(_lock_for(name), name, site))
+		changes_start = stack.enter_context(changes.collecting())
+
+		def on_exit(exc_type, exc_val, exc_tb):
+			if exc_type:
+				changes.discard(changes_start)
+			# a rollback also undoes values set through the accessors within the block
+			if exc_type or DEFAULT_TABLE in names:
+				invalidate_values()
+
+		stack.push(on_exit)
+
+		if _is_sqlite():
+			db = _get_sqlite_db()
+			with db.transaction():
+				yield tuple(db.table(name) for name in names)
+			return
+
+		dbs = {}
+		for name in names:
+			file = _db_file(name)
+			if file not in dbs:
+				dbs[file] = stack.enter_context(
+					_open_db_for_transaction(file, [n for n in names if _db_file(n) == file]))
+		yield tuple(dbs[_db_file(name)].table(name) for name in names)
 
 
 @contextmanager
-def app_usage_track_table() -> Iterator[Table]:
-	with get_db() as db:
-		yield db.table('app_usage_track')
+def _open_db_for_transaction(file: Path, table_names: List[str]) -> Iterator[TinyDB]:
+	if _is_resident():
+		db = _get_resident_db(file)
+		with db.storage.hold():
+			snapshot = {name: copy.deepcopy(db.storage.read().get(name)) for name in table_names}
+			try:
+				yield db
+			except BaseException:
+				tables = db.storage.read()
+				for name, table in snapshot.items():
+					if table is None:
+						tables.pop(name, None)
+					else:
+						tables[name] = table
+					db.table(name).clear_cache()
+				raise
+	else:
+		serialization = SerializationMiddleware(JSONStorage)
+		serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
+		write_behind = WriteBehindMiddleware(serialization, delay=0, lock=threading.RLock())
+		with (
+			IndexedTinyDB(file, storage=write_behind, sort_keys=True, indent=2, create_dirs=True) as db,
+			write_behind.hold(),
+		):
+			try:
+				yield db
+			except BaseException:
+				write_behind.is_dirty = False
+				raise
+
+
+async def run_in_executor(func: Callable[..., T], *args, **kwargs) -> T:
+	"""
+	Runs blocking database code on the dedicated database executor instead of the event loop.
+	"""
+	global _executor
+	if not _executor:
+		_executor = ThreadPoolExecutor(
+			max_workers=gconf.get('database.executor_workers', default=4),
+			thread_name_prefix='shard_core_db',
+		)
+	return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _is_resident() -> bool:
+	return gconf.get('database.storage', default='resident') in ('resident', 'journal')
+
+
+def _is_journaled() -> bool:
+	return gconf.get('database.storage', default='resident') == 'journal'
+
+
+def _is_sharded() -> bool:
+	return gconf.get('database.layout', default='single') == 'sharded'
+
+
+def _is_sqlite() -> bool:
+	return gconf.get('database.engine', default='tinydb') == 'sqlite'
+
+
+def _single_db_file() -> Path:
+	return Path(gconf.get('path_root')) / 'core' / 'shard_core_db.json'
+
+
+def _sqlite_db_file() -> Path:
+	return Path(gconf.get('path_root')) / 'core' / 'shard_core_db.sqlite'
+
+
+def _shard_dir() -> Path:
+	return Path(gconf.get('path_root')) / 'core' / 'db'
+
+
+def _db_file(table_name: str) -> Path:
+	if _is_sharded():
+		return _shard_dir() / f'{table_name}.json'
+	else:
+		return _single_db_file()
+
+
+def _has_separate_table_locks() -> bool:
+	return _is_sharded() or _is_sqlite()
+
+
+def _lock_for(table_name: str) -> TableLock:
+	locks = _sharded_table_locks if _has_separate_table_locks() else _single_file_table_locks
+	if lock := locks.get(table_name):
+		return lock
+	with _table_locks_lock:
+		if table_name not in locks:
+			locks[table_name] = TableLock(table_name, lock=None if _has_separate_table_locks() else global_db_lock)
+		return locks[table_name]
+
+
+def lock_stats() -> Dict[str, Dict]:
+	locks = _sharded_table_locks if _has_separate_table_locks() else _single_file_table_locks
+	return {name: lock.stats() for name, lock in locks.items()}
+
+
+def stats() -> Dict:
+	return {
+		'locks': lock_stats(),
+		**metrics.stats(),
+	}
+
+
+def _get_resident_db(file: Path) -> TinyDB:
+	if (db := _resident_dbs.get(file)) is not None:
+		return db
+
+	if any(not f.is_relative_to(gconf.get('path_root')) for f in _resident_dbs):
+		# path_root can change at runtime, e.g. between tests
+		_close_resident_dbs()
+
+	storage_kwargs = {}
+	if _is_journaled():
+		storage_cls = JournalStorage
+		storage_kwargs['max_size'] = gconf.get('database.journal.max_size', default=1024 * 1024)
+		storage_kwargs['max_age'] = gconf.get('database.journal.max_age', default=3600)
+	else:
+		storage_cls = AtomicJSONStorage
+	if gconf.get('database.format', default='compact') == 'compact':
+		storage_kwargs['codec'] = OrjsonCodec()
+	else:
+		storage_kwargs['sort_keys'] = True
+		storage_kwargs['indent'] = 2
+		serialization = SerializationMiddleware(storage_cls)
+		serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
+		storage_cls = serialization
+	write_behind = WriteBehindMiddleware(
+		storage_cls,
+		delay=gconf.get('database.write_behind_delay', default=1),
+		lock=_lock_for(file.stem) if _is_sharded() else global_db_lock,
+	)
+	db = IndexedTinyDB(
+		file,
+		storage=write_behind,
+		create_dirs=True,
+		fsync=gconf.get('database.fsync', default=True),
+		**storage_kwargs,
+	)
+	db.storage.read()
+	_resident_dbs[file] = db
+	log.debug(f'loaded resident database from {file}')
+	return db
+
+
+def _get_sqlite_db() -> sqlite.SQLiteDatabase:
+	file = _sqlite_db_file()
+	if db := _sqlite_dbs.get(file):
+		return db
+	with global_db_lock:
+		if file not in _sqlite_dbs:
+			if any(not f.is_relative_to(gconf.get('path_root')) for f in _sqlite_dbs):
+				# path_root can change at runtime, e.g. between tests
+				_close_resident_dbs()
+			_sqlite_dbs[file] = sqlite.SQLiteDatabase(file)
+			log.debug(f'opened sqlite database at {file}')
+		return _sqlite_dbs[file]
+
+
+def migrate_to_sqlite() -> Dict[str, int]:
+	"""
+	Imports the single file TinyDB database into the SQLite database and renames the JSON file,
+	so that it is not imported again. Returns the number of imported documents per table.
+	"""
+	json_file = _single_db_file()
+	with global_db_lock:
+		if (db := _resident_dbs.pop(json_file, None)) is not None:
+			db.close()
+		counts = sqlite.import_tables(_read_single_file_tables(json_file), _get_sqlite_db())
+		invalidate_values()
+		changes.reset()
+		for file in _storage_files(json_file):
+			file.rename(file.with_name(f'{file.name}.migrated'))
+	return counts
+
+
+def _split_into_shards(single_file: Path, shard_dir: Path):
+	all_tables = _read_single_file_tables(single_file)
+	for name, table in all_tables.items():
+		AtomicJSONStorage(shard_dir / f'{name}.json', sort_keys=True, indent=2).write({name: table})
+	for file in _storage_files(single_file):
+		file.rename(file.with_name(f'{file.name}.sharded'))
+	log.info(f'split {single_file} into {len(all_tables)} table files in {shard_dir}')
+
+
+def _read_single_file_tables(single_file: Path) -> Dict[str, Dict]:
+	if _is_journaled():
+		journal = JournalStorage(single_file)
+		all_tables = journal.read()
+		journal.close()
+	else:
+		all_tables = AtomicJSONStorage(single_file).read()
+	return all_tables or {}
+
+
+def _storage_files(file: Path) -> List[Path]:
+	candidates = [file, file.with_name(f'{file.name}.journal'), file.with_name(f'{file.name}.journal.old')]
+	return [f for f in candidates if f.exists()]
+
+
+def table_names() -> Set[str]:
+	if _is_sqlite():
+		return _get_sqlite_db().tables()
+	if _is_sharded():
+		names = set()
+		for file in _shard_dir().glob('*.json'):
+			with _open_db(file, _lock_for(file.stem), file.stem) as db:
+				names |= db.tables()
+		return names
+	else:
+		with get_db() as db:
+			return db.tables()
+
+
+def drop_table(name: str):
+	if _is_sqlite():
+		with _lock_for(name):
+			_get_sqlite_db().drop_table(name)
+			_invalidate_values_of(name)
+	elif _is_sharded():
+		file = _db_file(name)
+		with _lock_for(name):
+			if (db := _resident_dbs.pop(file, None)) is not None:
+				db.close()
+			for storage_file in _storage_files(file):
+				storage_file.unlink()
+			_invalidate_values_of(name)
+	else:
+		with get_db() as db:
+			db.drop_table(name)
+	changes.reset([name])
+
+
+def installed_apps_table() -> TableContext:
+	return open_table('installed_apps')
+
+
+def identities_table() -> TableContext:
+	return open_table('identities')
+
+
+def terminals_table() -> TableContext:
+	return open_table('terminals')
+
+
+def peers_table() -> TableContext:
+	return open_table('peers')
+
+
+def backups_table() -> TableContext:
+	return open_table('backups')
+
+
+def tours_table() -> TableContext:
+	return open_table('tours')
+
+
+def app_usage_track_table() -> TableContext:
+	return open_table('app_usage_track')
+
+
+def app_usage_monthly_table() -> TableContext:
+	return open_table('app_usage_monthly')
 
 
 def get_value(key: str):
-	with get_db() as db:
-		if result := db.get(Query().key == key):
-			return result['value']
-		else:
-			raise KeyError(key)
+	"""
+	Value of the key value store, answered from memory after the first read.
+	The value is shared with the cache and must not be modified.
+	"""
+	if (values := _values) is None:
+		values = _load_values()
+	return values[key]
 
 
 def set_value(key: str, value):
-	with get_db() as db:
-		db.upsert({
+	with _open_table(DEFAULT_TABLE) as table:
+		table.upsert({
 			'key': key,
 			'value': value,
 		}, Query().key == key)
+		if _values is not None:
+			_values[key] = value
 
 
 def remove_value(key: str):
-	with get_db() as db:
-		removed_ids = db.remove(Query().key == key)
+	with _open_table(DEFAULT_TABLE) as table:
+		removed_ids = table.remove(Query().key == key)
+		if _values is not None:
+			_values.pop(key, None)
 	return len(removed_ids) > 0
+
+
+def invalidate_values():
+	"""
+	Drops the cached key value store, it is read again on next access.
+	Needed after the default table was written other than through the value accessors.
+	"""
+	global _values
+	_values = None
+
+
+def _invalidate_values_of(*table_names: str):
+	if DEFAULT_TABLE in table_names:
+		invalidate_values()
+
+
+def _load_values() -> Dict[str, Any]:
+	global _values
+	with _open_table(DEFAULT_TABLE) as table:
+		if _values is None:
+			_values = {doc['key']: doc['value'] for doc in table.all() if 'key' in doc}
+		return _values
+
+
+class StoredValue(Generic[T]):
+	"""
+	Typed accessor of a value in the key value store.
+	The parsed value is kept until the stored value changes, it must not be modified.
+	"""
+
+	def __init__(self, key: str, type_: Type[T]):
+		self.key = key
+		self.type_ = type_
+		self._parsed: Tuple[Any, T] | None = None
+
+	def get(self) -> T:
+		value = get_value(self.key)
+		parsed = self._parsed
+		if parsed is None or parsed[0] is not value:
+			parsed = value, pydantic.parse_obj_as(self.type_, value)
+			self._parsed = parsed
+		return parsed[1]
+
+	def set(self, value: T):
+		set_value(self.key, value.dict() if isinstance(value, pydantic.BaseModel) else value)
+
+	def remove(self) -> bool:
+		return remove_value(self.key)
@@ -0,0 +1,265 @@
+import bisect
+import copy
+from types import FunctionType
+from typing import Dict, List, Tuple, Any, Iterable
+
+from tinydb import TinyDB
+from tinydb.queries import QueryLike, QueryInstance
+from tinydb.table import Table, Document
+
+from shard_core.database import changes
+
+_MISSING = object()
+_REGEX_SPECIAL_CHARACTERS = set('.^$*+?{}[]\\|()')
+
+
+class IndexedTable(Table):
+	"""
+	TinyDB table that answers equality queries on a field with a hash index
+	and `matches` queries with a literal prefix, like `Query().id.matches(f'{id}:*')`, with a sorted prefix index.
+	Indexes are built on first use of a field and dropped on every write to the table.
+	Candidates from an index are still checked against the query, so results are the same as with a scan.
+	Queries that cannot use an index fall back to the regular TinyDB implementation.
+	Queries with regex flags are always scanned, as the flags are not part of a query's hash.
+	Writes to a table with subscribers record their changes in the change feed,
+	and the touched documents are marked dirty on storages that support it, like `JournalStorage`.
+
+	Returned documents are deep copies and the query cache is disabled: with resident storage, the table data
+	lives on in memory, and a caller editing a result must not change the database or later results.
+	"""
+	default_query_cache_capacity = 0
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._hash_indexes: Dict[Tuple[str, ...], Dict[Any, List[str]]] = {}
+		self._prefix_indexes: Dict[Tuple[str, ...], Tuple[List[str], List[str]]] = {}
+
+	def search(self, cond: QueryLike) -> List[Document]:
+		candidate_ids = self._candidate_ids(cond)
+		if candidate_ids is None:
+			return super().search(cond)
+		return list(self._matching_documents(candidate_ids, cond))
+
+	def get(self, cond: QueryLike | None = None, doc_id: int | None = None, doc_ids: List | None = None):
+		if cond is not None and doc_id is None and doc_ids is None:
+			candidate_ids = self._candidate_ids(cond)
+			if candidate_ids is not None:
+				return next(self._matching_documents(candidate_ids, cond), None)
+		return super().get(cond, doc_id, doc_ids)
+
+	def update(self, fields, cond: QueryLike | None = None, doc_ids: Iterable[int] | None = None) -> List[int]:
+		if cond is not None and doc_ids is None:
+			# by id, so that only the updated documents are marked dirty
+			if not (matching_ids := self._matching_ids(cond)):
+				return []
+			return super().update(fields, doc_ids=matching_ids)
+		return super().update(fields, cond, doc_ids)
+
+	def remove(self, cond: QueryLike | None = None, doc_ids: Iterable[int] | None = None) -> List[int]:
+		if cond is not None and doc_ids is None:
+			if not (matching_ids := self._matching_ids(cond)):
+				return []
+			return super().remove(doc_ids=matching_ids)
+		return super().remove(cond, doc_ids)
+
+	def clear_cache(self):
+		super().clear_cache()
+		self._drop_indexes()
+
+	def _update_table(self, updater):
+		mark_dirty = getattr(self._storage, 'mark_dirty', None)
+		has_subscribers = changes.has_subscribers(self.name)
+		if not mark_dirty and not has_subscribers:
+			try:
+				super()._update_table(updater)
+			finally:
+				self._drop_indexes()
+			return
+
+		table_changes = []
+
+		def tracking_updater(table: Dict[int, Dict]):
+			before = copy.deepcopy(table) if has_subscribers else None
+			if mark_dirty:
+				touch_tracking_table = _TouchTrackingDict(table)
+				updater(touch_tracking_table)
+				table.clear()
+				table.update(touch_tracking_table)
+				mark_dirty(self.name, {str(doc_id) for doc_id in touch_tracking_table.touched_ids})
+			else:
+				updater(table)
+			if has_subscribers:
+				table_changes.extend(changes.diff(self.name, before, table))
+
+		try:
+			super()._update_table(tracking_updater)
+		finally:
+			self._drop_indexes()
+		if table_changes:
+			changes.record(table_changes)
+
+	def _drop_indexes(self):
+		self._hash_indexes.clear()
+		self._prefix_indexes.clear()
+
+	def _matching_ids(self, cond: QueryLike) -> List[int]:
+		table = self._read_table()
+		candidate_ids = self._candidate_ids(cond)
+		if candidate_ids is None:
+			candidate_ids = table.keys()
+		return [self.document_id_class(doc_id) for doc_id in candidate_ids if cond(table[doc_id])]
+
+	def _matching_documents(self, candidate_ids: List[str], cond: QueryLike) -> Iterable[Document]:
+		table = self._read_table()
+		for doc_id in candidate_ids:
+			if cond(table[doc_id]):
+				yield self.document_class(table[doc_id], self.document_id_class(doc_id))
+
+	def _candidate_ids(self, cond: QueryLike) -> List[str] | None:
+		"""
+		Ids of the documents that can match the query in table order, or None if no index applies.
+		"""
+		if has_regex_flags(cond):
+			return None
+		match getattr(cond, '_hash', None):
+			case ('==', path, str() | int() | float() | None as value):
+				return self._hash_index(path).get(value, [])
+			case ('matches', path, str(regex)) if prefix := literal_prefix(regex):
+				values, doc_ids = self._prefix_index(path)
+				start = bisect.bisect_left(values, prefix)
+				end = start
+				while end < len(values) and values[end].startswith(prefix):
+					end += 1
+				return sorted(doc_ids[start:end], key=int)
+			case ('and', subqueries):
+				for subquery in subqueries:
+					candidate_ids = self._candidate_ids(HashedQuery(subquery))
+					if candidate_ids is not None:
+						return candidate_ids
+		return None
+
+	def _hash_index(self, path: Tuple[str, ...]) -> Dict[Any, List[str]]:
+		if (index := self._hash_indexes.get(path)) is None:
+			index = {}
+			for doc_id, doc in self._read_table().items():
+				value = _resolve(doc, path)
+				if value is _MISSING:
+					continue
+				try:
+					index.setdefault(value, []).append(doc_id)
+				except TypeError:  # unhashable values never equal the scalar values looked up in the index
+					pass
+			self._hash_indexes[path] = index
+		return index
+
+	def _prefix_index(self, path: Tuple[str, ...]) -> Tuple[List[str], List[str]]:
+		if (index := self._prefix_indexes.get(path)) is None:
+			entries = sorted(
+				(value, doc_id) for doc_id, doc in self._read_table().items()
+				if isinstance(value := _resolve(doc, path), str))
+			index = [value for value, _ in entries], [doc_id for _, doc_id in entries]
+			self._prefix_indexes[path] = index
+		return index
+
+
+class DetachedDocument(Document):
+	"""
+	A document that shares no nested values with the table it was read from.
+	"""
+
+	def __init__(self, value: Dict, doc_id: int):
+		super().__init__(copy.deepcopy(value), doc_id)
+
+
+IndexedTable.document_class = DetachedDocument
+
+
+class _TouchTrackingDict(dict):
+	"""
+	Table data that records the ids of all documents an updater set, removed or read, as it may change them in place.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.touched_ids = set()
+
+	def __getitem__(self, doc_id):
+		self.touched_ids.add(doc_id)
+		return super().__getitem__(doc_id)
+
+	def __setitem__(self, doc_id, doc):
+		self.touched_ids.add(doc_id)
+		super().__setitem__(doc_id, doc)
+
+	def __delitem__(self, doc_id):
+		self.touched_ids.add(doc_id)
+		super().__delitem__(doc_id)
+
+	def pop(self, doc_id, *args):
+		self.touched_ids.add(doc_id)
+		return super().pop(doc_id, *args)
+
+
+class IndexedTinyDB(TinyDB):
+	table_class = IndexedTable
+
+
+class HashedQuery:
+	"""
+	Stands in for a part of a combined query, which TinyDB only keeps as its hash.
+	"""
+
+	def __init__(self, hash_):
+		self._hash = hash_
+
+
+def _resolve(doc: Dict, path: Tuple[str, ...]):
+	value = doc
+	for part in path:
+		try:
+			value = value[part]
+		except (KeyError, TypeError):
+			return _MISSING
+	return value
+
+
+def has_regex_flags(cond: QueryLike) -> bool:
+	"""
+	Whether a `matches` or `search` part of the query has regex flags.
+	TinyDB keeps the flags in the closure of the query's test instead of its hash, so they are looked up there.
+	"""
+	pending = [getattr(cond, '_test', None)]
+	seen = set()
+	while pending:
+		obj = pending.pop()
+		if id(obj) in seen:
+			continue
+		seen.add(id(obj))
+		if isinstance(obj, QueryInstance):
+			pending.append(obj._test)
+		elif isinstance(obj, FunctionType) and obj.__closure__:
+			for name, cell in zip(obj.__code__.co_freevars, obj.__closure__):
+				try:
+					value = cell.cell_contents
+				except ValueError:  # not assigned yet
+					continue
+				if name == 'flags' and value:
+					return True
+				pending.append(value)
+	return False
+
+
+def literal_prefix(regex: str) -> str:
+	"""
+	The literal text every string matching `regex` from its start begins with.
+	"""
+	if '|' in regex:
+		return ''
+	prefix = []
+	for char in regex:
+		if char in _REGEX_SPECIAL_CHARACTERS:
+			if char in '*?{' and prefix:
+				prefix.pop()  # the previous character is optional
+			break
+		prefix.append(char)
+	return ''.join(prefix)
@@ -0,0 +1,46 @@
+import threading
+import time
+from typing import Dict
+
+
+class TableLock:
+	"""
+	Reentrant lock guarding one table of the database.
+	Counts how often it was acquired and how often and how long callers had to wait for it.
+	Several table locks can share the same underlying `lock`, they still count separately.
+	"""
+
+	def __init__(self, name: str, lock: threading.RLock = None):
+		self.name = name
+		self._lock = lock or threading.RLock()
+		self.acquisitions = 0
+		self.contentions = 0
+		self.wait_time = 0.0
+
+	def acquire(self):
+		if self._lock.acquire(blocking=False):
+			self.acquisitions += 1
+			return
+		start_time = time.monotonic()
+		self._lock.acquire()
+		self.acquisitions += 1
+		self.contentions += 1
+		self.wait_time += time.monotonic() - start_time
+
+	def release(self):
+		self._lock.release()
+
+	def __enter__(self):
+		self.acquire()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.release()
+
+	def stats(self) -> Dict:
+		return {
+			'acquisitions': self.acquisitions,
+			'contentions': self.contentions,
+			'wait_time': self.wait_time,
+		}
+
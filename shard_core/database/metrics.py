@@ -0,0 +1,155 @@
+import bisect
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Dict, Tuple, Deque
+
+import gconf
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets in seconds, the last bucket is unbounded
+BUCKET_BOUNDS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+CallSite = Tuple[str, int, str]
+
+SLOW_OPERATION_SAMPLES = 50
+
+_DATABASE_PACKAGE = str(Path(__file__).parent) + os.sep
+_CONTEXTLIB = contextlib.__file__
+_PROJECT_ROOT = str(Path(__file__).parent.parent.parent) + os.sep
+
+
+class Histogram:
+	def __init__(self):
+		self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+
+	def observe(self, value: float):
+		self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+		self.count += 1
+		self.sum += value
+		self.max = max(self.max, value)
+
+	def quantile(self, q: float) -> float:
+		"""
+		Upper bound of the bucket containing the quantile, the maximum for the last bucket.
+		"""
+		rank = q * self.count
+		seen = 0
+		for bound, count in zip(BUCKET_BOUNDS, self.counts):
+			seen += count
+			if seen >= rank:
+				return min(bound, self.max)
+		return self.max
+
+	def to_dict(self) -> Dict:
+		return {
+			'count': self.count,
+			'sum': self.sum,
+			'max': self.max,
+			'p50': self.quantile(0.5),
+			'p95': self.quantile(0.95),
+			'p99': self.quantile(0.99),
+			'buckets': {
+				**{f'le_{bound}': count for bound, count in zip(BUCKET_BOUNDS, self.counts)},
+				'le_inf': self.counts[-1],
+			},
+		}
+
+
+class OperationMetrics:
+	def __init__(self):
+		self.wait = Histogram()
+		self.operation = Histogram()
+
+
+# Keyed by table and call site. Entries are only updated while the table lock is held,
+# so updates of the same entry never race.
+_metrics: Dict[Tuple[str, CallSite], OperationMetrics] = {}
+_slow_operations: Deque[Dict] = deque(maxlen=SLOW_OPERATION_SAMPLES)
+_slow_operations_count = 0
+_slow_operations_lock = threading.Lock()
+
+
+def call_site() -> CallSite:
+	"""
+	The first frame on the stack outside of the database package and contextlib.
+	Only walks frames, nothing is formatted.
+	"""
+	frame = sys._getframe(1)
+	while frame.f_back and (
+			frame.f_code.co_filename.startswith(_DATABASE_PACKAGE) or frame.f_code.co_filename == _CONTEXTLIB):
+		frame = frame.f_back
+	return frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+
+
+def record(table: str, site: CallSite, wait_time: float, operation_time: float):
+	metrics = _metrics.get((table, site))
+	if metrics is None:
+		metrics = _metrics.setdefault((table, site), OperationMetrics())
+	metrics.wait.observe(wait_time)
+	metrics.operation.observe(operation_time)
+
+	if wait_time + operation_time > gconf.get('database.metrics.slow_threshold', default=1):
+		_record_slow_operation(table, site, wait_time, operation_time)
+
+
+def _record_slow_operation(table: str, site: CallSite, wait_time: float, operation_time: float):
+	global _slow_operations_count
+	with _slow_operations_lock:
+		_slow_operations_count += 1
+		# every slow operation is counted, only every n-th one is captured with its stack
+		if (_slow_operations_count - 1) % gconf.get('database.metrics.slow_sample_interval', default=1):
+			return
+	log.debug(
+		f'slow database operation on {table} at {_format_call_site(site)}: '
+		f'waited {wait_time:.3f}s for the lock, operation took {operation_time:.3f}s')
+	_slow_operations.append({
+		'time': time.time(),
+		'table': table,
+		'call_site': _format_call_site(site),
+		'thread': threading.current_thread().name,
+		'wait_time': wait_time,
+		'operation_time': operation_time,
+		'stack': traceback.extract_stack(sys._getframe(1), limit=15).format(),
+	})
+
+
+def stats() -> Dict:
+	tables: Dict[str, Dict] = {}
+	for (table, site), metrics in list(_metrics.items()):
+		tables.setdefault(table, {})[_format_call_site(site)] = {
+			'wait': metrics.wait.to_dict(),
+			'operation': metrics.operation.to_dict(),
+		}
+	return {
+		'tables': tables,
+		'slow_operations': {
+			'count': _slow_operations_count,
+			'samples': list(_slow_operations),
+		},
+	}
+
+
+def reset():
+	global _slow_operations_count
+	_metrics.clear()
+	with _slow_operations_lock:
+		_slow_operations.clear()
+		_slow_operations_count = 0
+
+
+def _format_call_site(site: CallSite) -> str:
+	filename, lineno, function = site
+	if filename.startswith(_PROJECT_ROOT):
+		filename = filename[len(_PROJECT_ROOT):]
+	return f'{filename}:{lineno} ({function})'
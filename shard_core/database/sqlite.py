@@ -0,0 +1,341 @@
+import copy
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Iterator, Callable, Mapping, Tuple, Set
+
+from tinydb.queries import QueryLike
+from tinydb.table import Document
+
+from shard_core.database import changes
+from shard_core.database.codec import OrjsonCodec, tag_datetimes
+from shard_core.database.index import HashedQuery, has_regex_flags, literal_prefix
+
+log = logging.getLogger(__name__)
+
+# Fields that are looked up by the code, they get an expression index on the JSON column.
+INDEXED_FIELDS = {
+	'_default': ['key'],
+	'installed_apps': ['name'],
+	'tours': ['name'],
+	'terminals': ['id'],
+	'identities': ['id', 'is_default'],
+	'peers': ['id'],
+	'app_usage_track': ['timestamp'],
+	'app_usage_monthly': ['year'],
+	'backups': ['endTime'],
+}
+
+_codec = OrjsonCodec()
+
+# '!=' is missing on purpose, in SQL it does not match documents where the field is null
+_COMPARISON_OPERATORS = {'==': '=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+class SQLiteDatabase:
+	"""
+	SQLite file holding every table as rows of JSON documents.
+	Each thread gets its own connection, the database runs in WAL mode so that readers do not wait for writers.
+	"""
+
+	def __init__(self, path: Path):
+		self.path = path
+		self._local = threading.local()
+		self._connections: List[sqlite3.Connection] = []
+		self._connections_lock = threading.Lock()
+		self._known_tables: Set[str] = set()
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		with self.connection() as conn:
+			conn.execute('PRAGMA journal_mode=WAL')
+			self._known_tables = {row[0] for row in conn.execute(
+				"SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+	@contextmanager
+	def connection(self) -> Iterator[sqlite3.Connection]:
+		conn = getattr(self._local, 'connection', None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+			conn.execute('PRAGMA synchronous=NORMAL')
+			self._local.connection = conn
+			with self._connections_lock:
+				self._connections.append(conn)
+		yield conn
+
+	@contextmanager
+	def transaction(self) -> Iterator[sqlite3.Connection]:
+		with self.connection() as conn:
+			if conn.in_transaction:
+				yield conn
+				return
+			conn.execute('BEGIN IMMEDIATE')
+			try:
+				yield conn
+			except BaseException:
+				conn.execute('ROLLBACK')
+				raise
+			else:
+				conn.execute('COMMIT')
+
+	def table(self, name: str) -> 'SQLiteTable':
+		if name not in self._known_tables:
+			self._create_table(name)
+		return SQLiteTable(self, name)
+
+	def tables(self) -> Set[str]:
+		return set(self._known_tables)
+
+	def drop_table(self, name: str):
+		with self.transaction() as conn:
+			conn.execute(f'DROP TABLE IF EXISTS {_quote(name)}')
+		self._known_tables.discard(name)
+
+	def close(self):
+		with self._connections_lock:
+			for conn in self._connections:
+				conn.close()
+			self._connections.clear()
+		self._local = threading.local()
+
+	def _create_table(self, name: str):
+		with self.transaction() as conn:
+			conn.execute(
+				f'CREATE TABLE IF NOT EXISTS {_quote(name)} (doc_id INTEGER PRIMARY KEY, doc TEXT NOT NULL)')
+			for field in INDEXED_FIELDS.get(name, []):
+				conn.execute(
+					f'CREATE INDEX IF NOT EXISTS {_quote(f"ix_{name}_{field}")} '
+					f'ON {_quote(name)} ({_json_extract((field,))})')
+		self._known_tables.add(name)
+
+
+class SQLiteTable:
+	"""
+	Table with the same interface as a TinyDB table, as far as it is used in shard_core.
+	Queries on a single field are translated to SQL and can use the indexes in INDEXED_FIELDS,
+	the query itself is still evaluated on every candidate, so any TinyDB query works, if possibly with a scan.
+	Writes to a table with subscribers record their changes in the change feed.
+	"""
+
+	def __init__(self, db: SQLiteDatabase, name: str):
+		self.db = db
+		self.name = name
+		self._table = _quote(name)
+
+	def all(self) -> List[Document]:
+		return self._select()
+
+	def search(self, cond: QueryLike) -> List[Document]:
+		return self._select(cond)
+
+	def get(self, cond: QueryLike | None = None, doc_id: int | None = None, doc_ids: List[int] | None = None):
+		if doc_id is not None:
+			docs = self._select(doc_ids=[doc_id])
+			return docs[0] if docs else None
+		if doc_ids is not None:
+			return self._select(doc_ids=doc_ids)
+		if cond is None:
+			raise RuntimeError('You have to pass either cond or doc_id or doc_ids')
+		docs = self._select(cond, limit=1)
+		return docs[0] if docs else None
+
+	def contains(self, cond: QueryLike | None = None, doc_id: int | None = None) -> bool:
+		if doc_id is not None:
+			return self.get(doc_id=doc_id) is not None
+		if cond is None:
+			raise RuntimeError('You have to pass either cond or doc_id')
+		return self.get(cond) is not None
+
+	def count(self, cond: QueryLike) -> int:
+		return len(self.search(cond))
+
+	def __len__(self) -> int:
+		with self.db.connection() as conn:
+			return conn.execute(f'SELECT COUNT(*) FROM {self._table}').fetchone()[0]
+
+	def __iter__(self) -> Iterator[Document]:
+		return iter(self.all())
+
+	def insert(self, document: Mapping) -> int:
+		return self.insert_multiple([document])[0]
+
+	def insert_multiple(self, documents: List[Mapping]) -> List[int]:
+		doc_ids = []
+		with self.db.transaction() as conn:
+			for document in documents:
+				if not isinstance(document, Mapping):
+					raise ValueError('Document is not a Mapping')
+				doc_id = document.doc_id if isinstance(document, Document) else None
+				cursor = conn.execute(
+					f'INSERT INTO {self._table} (doc_id, doc) VALUES (?, ?)', (doc_id, _encode(document)))
+				doc_ids.append(cursor.lastrowid)
+			if changes.has_subscribers(self.name):
+				changes.record([
+					changes.Change(self.name, doc_id, None, copy.deepcopy(dict(document)))
+					for doc_id, document in zip(doc_ids, documents)])
+		return doc_ids
+
+	def update(
+			self,
+			fields: Mapping | Callable[[Dict], None],
+			cond: QueryLike | None = None,
+			doc_ids: List[int] | None = None,
+	) -> List[int]:
+		with self.db.transaction() as conn:
+			docs = self._select(cond, doc_ids=doc_ids)
+			before = None
+			if changes.has_subscribers(self.name):
+				before = {doc.doc_id: copy.deepcopy(dict(doc)) for doc in docs}
+			for doc in docs:
+				if callable(fields):
+					fields(doc)
+				else:
+					doc.update(fields)
+			conn.executemany(
+				f'UPDATE {self._table} SET doc = ? WHERE doc_id = ?',
+				[(_encode(doc), doc.doc_id) for doc in docs])
+			if before is not None:
+				changes.record(changes.diff(self.name, before, {doc.doc_id: dict(doc) for doc in docs}))
+		return [doc.doc_id for doc in docs]
+
+	def upsert(self, document: Mapping, cond: QueryLike | None = None) -> List[int]:
+		with self.db.transaction():
+			if isinstance(document, Document) and cond is None:
+				if self.contains(doc_id=document.doc_id):
+					return self.update(document, doc_ids=[document.doc_id])
+				return [self.insert(document)]
+			if cond is None:
+				raise ValueError('If you don\'t specify a condition, the document must be a Document')
+			if updated_ids := self.update(document, cond):
+				return updated_ids
+			return [self.insert(document)]
+
+	def remove(self, cond: QueryLike | None = None, doc_ids: List[int] | None = None) -> List[int]:
+		if cond is None and doc_ids is None:
+			raise RuntimeError('Use truncate() to remove all documents')
+		with self.db.transaction() as conn:
+			removed_docs = self._select(cond, doc_ids=doc_ids)
+			removed_ids = [doc.doc_id for doc in removed_docs]
+			conn.executemany(f'DELETE FROM {self._table} WHERE doc_id = ?', [(i,) for i in removed_ids])
+			self._record_removals(removed_docs)
+		return removed_ids
+
+	def truncate(self):
+		with self.db.transaction() as conn:
+			removed_docs = self._select() if changes.has_subscribers(self.name) else []
+			conn.execute(f'DELETE FROM {self._table}')
+			self._record_removals(removed_docs)
+
+	def clear_cache(self):
+		pass
+
+	def _record_removals(self, removed_docs: List[Document]):
+		if changes.has_subscribers(self.name):
+			changes.record([changes.Change(self.name, doc.doc_id, dict(doc), None) for doc in removed_docs])
+
+	def _select(
+			self,
+			cond: QueryLike | None = None,
+			doc_ids: List[int] | None = None,
+			limit: int | None = None,
+	) -> List[Document]:
+		where, params = _to_sql(cond) if cond is not None else (None, [])
+		clauses = [where] if where else []
+		if doc_ids is not None:
+			clauses.append(f'doc_id IN ({", ".join("?" * len(doc_ids))})')
+			params.extend(doc_ids)
+		sql = f'SELECT doc_id, doc FROM {self._table}'
+		if clauses:
+			sql += ' WHERE ' + ' AND '.join(clauses)
+		sql += ' ORDER BY doc_id'
+
+		with self.db.connection() as conn:
+			cursor = conn.execute(sql, params)
+			docs = []
+			for doc_id, raw_doc in cursor:
+				doc = Document(_decode(raw_doc), doc_id)
+				if cond is None or cond(doc):
+					docs.append(doc)
+					if limit and len(docs) >= limit:
+						break
+			return docs
+
+
+def _to_sql(cond: QueryLike) -> Tuple[str | None, List]:
+	"""
+	Translates the parts of a TinyDB query that SQLite can evaluate on an index into a WHERE clause.
+	The clause may match more documents than the query, but never less, so queries with regex flags are not translated.
+	Comparisons with timezone-aware datetimes are left to the query, as the stored strings of the same
+	point in time differ and sort differently with different UTC offsets.
+	"""
+	if has_regex_flags(cond):
+		return None, []
+	hash_ = getattr(cond, '_hash', None)
+	match hash_:
+		case ('and', subqueries):
+			clauses, params = [], []
+			for subquery in subqueries:
+				clause, subquery_params = _to_sql(HashedQuery(subquery))
+				if clause:
+					clauses.append(clause)
+					params.extend(subquery_params)
+			return (' AND '.join(clauses) if clauses else None), params
+		case (operator, path, value) if operator in _COMPARISON_OPERATORS and _is_scalar(value):
+			if value is None or isinstance(value, bool) and operator != '==':
+				return None, []
+			return f'{_json_extract(path)} {_COMPARISON_OPERATORS[operator]} ?', [_to_sql_value(value)]
+		case ('matches', path, str(regex)) if prefix := literal_prefix(regex):
+			return f'{_json_extract(path)} >= ? AND {_json_extract(path)} < ?', [prefix, _prefix_upper_bound(prefix)]
+		case _:
+			return None, []
+
+
+def _is_scalar(value) -> bool:
+	if isinstance(value, datetime.datetime):
+		return value.tzinfo is None
+	return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _to_sql_value(value):
+	return tag_datetimes(value)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+	return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _json_extract(path: Tuple) -> str:
+	json_path = '$' + ''.join(f'."{p}"' for p in path)
+	return f"json_extract(doc, '{json_path}')"
+
+
+def _quote(identifier: str) -> str:
+	return '"' + identifier.replace('"', '""') + '"'
+
+
+def _encode(document: Mapping) -> str:
+	return _codec.dumps(document).decode()
+
+
+def _decode(raw_document: str) -> Dict:
+	return _codec.loads(raw_document)
+
+
+def import_tables(all_tables: Dict[str, Dict[str, Dict]], db: SQLiteDatabase) -> Dict[str, int]:
+	"""
+	Imports the tables of a TinyDB JSON document, keeping the document ids.
+	Returns the number of documents per table.
+	"""
+	counts = {}
+	with db.transaction() as conn:
+		for name, table in all_tables.items():
+			db.table(name)
+			conn.executemany(
+				f'INSERT OR REPLACE INTO {_quote(name)} (doc_id, doc) VALUES (?, ?)',
+				# TinyDB JSON files already have the datetimes tagged the same way
+				[(int(doc_id), json.dumps(doc, separators=(',', ':'))) for doc_id, doc in table.items()])
+			counts[name] = len(table)
+	log.info(f'imported {sum(counts.values())} documents in {len(counts)} tables into {db.path}')
+	return counts
@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Iterable
+
+from tinydb import Storage
+from tinydb.middlewares import Middleware
+
+from shard_core.database.codec import JSONCodec, OrjsonCodec
+
+log = logging.getLogger(__name__)
+
+
+class AtomicJSONStorage(Storage):
+	"""
+	JSON file storage that never rewrites the database file in place.
+	Every write goes to a temporary file next to the database which then replaces it,
+	so a crash during a write leaves either the old or the new version on disk.
+	Without a `codec`, the standard json module is used with the remaining keyword arguments.
+	"""
+
+	def __init__(self, path, create_dirs=False, fsync=True, codec: JSONCodec | OrjsonCodec = None, **kwargs):
+		super().__init__()
+		self.path = Path(path)
+		self.fsync = fsync
+		self.codec = codec or JSONCodec(**kwargs)
+		if create_dirs:
+			self.path.parent.mkdir(parents=True, exist_ok=True)
+
+	def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+		try:
+			content = self.path.read_bytes()
+		except FileNotFoundError:
+			return None
+		if not content:
+			return None
+		return self.codec.loads(content)
+
+	def write(self, data: Dict[str, Dict[str, Any]]):
+		self.write_content(self.codec.dumps(data))
+
+	def write_content(self, content: str | bytes):
+		tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+		with open(tmp_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+			f.write(content)
+			f.flush()
+			if self.fsync:
+				os.fsync(f.fileno())
+		os.replace(tmp_path, self.path)
+		if self.fsync:
+			_fsync_dir(self.path.parent)
+
+
+class JournalStorage(Storage):
+	"""
+	Storage that appends every change to a journal next to a snapshot file instead of rewriting the snapshot.
+	Each write is compared with the previous one per document and appended as a single line
+	of the changed documents, so its cost depends on the size of the change, not of the database.
+	Opening the storage reads the snapshot and replays the journal on top of it.
+
+	Once the journal grows beyond `max_size` bytes or its first record is older than `max_age` seconds,
+	a background thread compacts it: the journal is rotated, a new snapshot is written and the rotated journal removed.
+	Records are full documents, so replaying the rotated journal on top of a snapshot that already contains it
+	is harmless, and a torn last line from a crash is ignored.
+
+	Once a writer calls `mark_dirty`, only the marked documents are serialized and compared on write,
+	so every writer must then mark the documents it changes. Added and dropped tables and removed documents
+	of marked tables are still found by their keys.
+	"""
+
+	def __init__(
+			self, path, create_dirs=False, fsync=True, max_size=1024 * 1024, max_age=3600,
+			codec: JSONCodec | OrjsonCodec = None, **kwargs):
+		super().__init__()
+		self.codec = codec or JSONCodec(**kwargs)
+		self.snapshot = AtomicJSONStorage(path, create_dirs=create_dirs, fsync=fsync, codec=self.codec)
+		self.journal_path = self.snapshot.path.with_name(f'{self.snapshot.path.name}.journal')
+		self.rotated_journal_path = self.snapshot.path.with_name(f'{self.snapshot.path.name}.journal.old')
+		self.fsync = fsync
+		self.max_size = max_size
+		self.max_age = max_age
+		self.lock = threading.Lock()
+		self._state: Dict[str, Dict[str, str]] | None = None
+		self._dirty: Dict[str, Set[str]] | None = None
+		self._journal = None
+		self._journal_size = 0
+		self._journal_started: float | None = None
+		self._compaction: threading.Thread | None = None
+
+	def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+		with self.lock:
+			if self._state is None:
+				self._load()
+			if not self._state:
+				return None
+			return {
+				table_name: {doc_id: self.codec.loads(doc) for doc_id, doc in table.items()}
+				for table_name, table in self._state.items()}
+
+	def write(self, data: Dict[str, Dict[str, Any]]):
+		with self.lock:
+			if self._state is None:
+				self._load()
+			changes = self._diff(data)
+			if changes:
+				self._append(changes)
+			if self._dirty is not None:
+				self._dirty = {}
+			if changes and self._needs_compaction():
+				self._start_compaction()
+
+	def mark_dirty(self, table_name: str, doc_ids: Iterable[str]):
+		with self.lock:
+			if self._dirty is None:
+				self._dirty = {}
+			self._dirty.setdefault(table_name, set()).update(doc_ids)
+
+	def compact(self):
+		with self.lock:
+			state = self._rotate()
+		self._write_snapshot(state)
+
+	def close(self):
+		if self._compaction:
+			self._compaction.join()
+		with self.lock:
+			if self._journal:
+				self._journal.close()
+				self._journal = None
+
+	def _load(self):
+		snapshot = self.snapshot.read() or {}
+		self._state = {
+			table_name: {doc_id: self.codec.dumps_document(doc) for doc_id, doc in table.items()}
+			for table_name, table in snapshot.items()}
+		for journal_path in (self.rotated_journal_path, self.journal_path):
+			for record in _read_journal(journal_path):
+				self._journal_started = self._journal_started or record['ts']
+				self._apply(record['changes'])
+		self._journal_size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+		if self.rotated_journal_path.exists():
+			# a compaction was interrupted
+			self._start_compaction()
+
+	def _diff(self, data: Dict[str, Dict[str, Any]]) -> List[list]:
+		changes = []
+		for table_name in self._state.keys() - data.keys():
+			changes.append(['drop', table_name])
+		for table_name, table in data.items():
+			old_table = self._state.get(table_name)
+			if old_table is None:
+				changes.append(['table', table_name])
+				old_table = {}
+				doc_ids = table.keys()
+			elif self._dirty is None:
+				doc_ids = table.keys()
+			elif table_name in self._dirty:
+				doc_ids = self._dirty[table_name] & table.keys()
+			else:
+				continue
+			for doc_id in doc_ids:
+				dumped_doc = self.codec.dumps_document(table[doc_id])
+				if old_table.get(doc_id) != dumped_doc:
+					changes.append(['put', table_name, doc_id, dumped_doc])
+			for doc_id in old_table.keys() - table.keys():
+				changes.append(['delete', table_name, doc_id])
+		return changes
+
+	def _apply(self, changes: List[list]):
+		for change in changes:
+			match change:
+				case ['drop', table_name]:
+					self._state.pop(table_name, None)
+				case ['table', table_name]:
+					self._state.setdefault(table_name, {})
+				case ['put', table_name, doc_id, doc]:
+					self._state.setdefault(table_name, {})[doc_id] = doc
+				case ['delete', table_name, doc_id]:
+					self._state.get(table_name, {}).pop(doc_id, None)
+
+	def _append(self, changes: List[list]):
+		now = time.time()
+		line = json.dumps({'ts': now, 'changes': changes}) + '\n'
+		if not self._journal:
+			self._journal = open(self.journal_path, 'a')
+		self._journal.write(line)
+		self._journal.flush()
+		if self.fsync:
+			os.fsync(self._journal.fileno())
+		self._apply(changes)
+		self._journal_size += len(line)
+		self._journal_started = self._journal_started or now
+
+	def _needs_compaction(self) -> bool:
+		if self._compaction and self._compaction.is_alive():
+			return False
+		if self._journal_size > self.max_size:
+			return True
+		return self._journal_started is not None and time.time() - self._journal_started > self.max_age
+
+	def _start_compaction(self):
+		self._compaction = threading.Thread(target=self.compact, name='shard_core_db_compaction', daemon=True)
+		self._compaction.start()
+
+	def _rotate(self) -> Dict[str, Dict[str, str]]:
+		if self._journal:
+			self._journal.close()
+			self._journal = None
+		if self.journal_path.exists():
+			if self.rotated_journal_path.exists():
+				# the previous compaction did not finish, keep both journals until the snapshot is written
+				with open(self.rotated_journal_path, 'a') as rotated, open(self.journal_path) as current:
+					rotated.write(current.read())
+				self.journal_path.unlink()
+			else:
+				os.replace(self.journal_path, self.rotated_journal_path)
+		self._journal_size = 0
+		self._journal_started = None
+		return {table_name: dict(table) for table_name, table in self._state.items()}
+
+	def _write_snapshot(self, state: Dict[str, Dict[str, str]]):
+		self.snapshot.write({
+			table_name: {doc_id: self.codec.loads(doc) for doc_id, doc in table.items()}
+			for table_name, table in state.items()})
+		self.rotated_journal_path.unlink(missing_ok=True)
+		log.debug(f'compacted database journal into {self.snapshot.path}')
+
+
+class WriteBehindMiddleware(Middleware):
+	"""
+	Keeps the complete database in memory after the first read.
+	Writes only update the memory and mark it dirty, the wrapped storage is written
+	by a timer after `delay` seconds or when `flush` is called explicitly.
+	A delay of zero or less writes through on every write.
+	While `hold` is active, nothing is written, the writes are flushed or scheduled when the last hold ends.
+
+	`lock` must be the lock that guards all access to the database,
+	it is held while the memory is handed to the wrapped storage.
+	"""
+
+	def __init__(self, storage_cls, delay: float, lock):
+		super().__init__(storage_cls)
+		self.delay = delay
+		self.lock = lock
+		self.cache = None
+		self.is_dirty = False
+		self._timer: threading.Timer | None = None
+		self._holds = 0
+
+	def read(self):
+		if self.cache is None:
+			self.cache = self.storage.read() or {}
+		return self.cache
+
+	def write(self, data):
+		self.cache = data
+		self.is_dirty = True
+		if not self._holds:
+			self._schedule_flush()
+
+	@contextmanager
+	def hold(self):
+		with self.lock:
+			self._holds += 1
+			try:
+				yield
+			finally:
+				self._holds -= 1
+				if not self._holds and self.is_dirty:
+					self._schedule_flush()
+
+	def flush(self):
+		with self.lock:
+			if self._timer:
+				self._timer.cancel()
+				self._timer = None
+			if self.is_dirty:
+				self.storage.write(self.cache)
+				self.is_dirty = False
+
+	def close(self):
+		self.flush()
+		self.storage.close()
+
+	def _schedule_flush(self):
+		if self.delay <= 0:
+			self.flush()
+		elif not self._timer:
+			self._timer = threading.Timer(self.delay, self.flush)
+			self._timer.daemon = True
+			self._timer.start()
+
+
+def _read_journal(path: Path) -> List[Dict]:
+	try:
+		content = path.read_bytes()
+	except FileNotFoundError:
+		return []
+	complete_length = content.rfind(b'\n') + 1
+	if complete_length < len(content):
+		# the last record was not completely written, cut it off so that new records start on a fresh line
+		log.warning(f'ignoring incomplete last record of {path}')
+		os.truncate(path, complete_length)
+	return [json.loads(line) for line in content[:complete_length].splitlines()]
+
+
+def _fsync_dir(directory: Path):
+	fd = os.open(directory, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
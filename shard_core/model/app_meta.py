@@ -3,13 +3,9 @@ from enum import Enum
 from pathlib import Path as FilePath
 from typing import Optional, List, Dict, Union
 
-import gconf
 from pydantic import BaseModel, root_validator, validator
-from tinydb import Query
 
-from shard_core.database.database import installed_apps_table
 from shard_core.model import app_meta_migration
-from shard_core.util import signals
 
 CURRENT_VERSION = '1.2'
 
@@ -145,16 +141,6 @@ class InstalledAppWithMeta(InstalledApp):
 	meta: AppMeta | None
 
 
-@signals.on_request_to_app.connect
-def update_last_access(app: InstalledApp):
-	now = datetime.datetime.utcnow()
-	max_update_frequency = datetime.timedelta(seconds=gconf.get('apps.last_access.max_update_frequency'))
-	if app.last_access and now - app.last_access < max_update_frequency:
-		return
-	with installed_apps_table() as installed_apps:  # type: Table
-		installed_apps.update({'last_access': now}, Query().name == app.name)
-
-
 if __name__ == '__main__':
 	dest_dir = FilePath('schemas')
 	dest_dir.mkdir(exist_ok=True)
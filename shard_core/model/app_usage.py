@@ -13,3 +13,10 @@ class AppUsageReport(BaseModel):
 	year: int
 	month: int
 	usage: Dict[str, float]
+
+
+class AppUsageMonthly(BaseModel):
+	year: int
+	month: int
+	tracks: int
+	usage: Dict[str, int]
@@ -48,7 +48,7 @@ class Identity(PropertyBaseModel):
 
 	@property
 	def public_key(self) -> crypto.PublicKey:
-		return crypto.PrivateKey(self.private_key).get_public_key()
+		return crypto.load_private_key(self.private_key).get_public_key()
 
 	@property
 	def public_key_pem(self) -> str:
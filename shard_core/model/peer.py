@@ -1,6 +1,6 @@
 from typing import Optional
 
-from shard_core.service.crypto import PublicKey
+from shard_core.service.crypto import PublicKey, load_public_key
 from pydantic import BaseModel, validator, root_validator
 
 
@@ -19,7 +19,7 @@ class Peer(BaseModel):
 	@root_validator
 	def public_bytes_must_match_id(cls, values):
 		if values['public_bytes_b64']:
-			pubkey = PublicKey(values['public_bytes_b64'])
+			pubkey = load_public_key(values['public_bytes_b64'])
 			if not pubkey.to_hash_id().startswith(values['id']):
 				raise ValueError('public key and id do not match')
 		return values
@@ -32,8 +32,8 @@ class Peer(BaseModel):
 		return self.id[0:6]
 
 	@property
-	def pubkey(self):
-		return PublicKey(self.public_bytes_b64)
+	def pubkey(self) -> PublicKey:
+		return load_public_key(self.public_bytes_b64)
 
 
 class InputPeer(BaseModel):
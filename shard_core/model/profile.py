@@ -3,7 +3,7 @@ from typing import Optional
 
 from pydantic import BaseModel
 
-from shard_core.database.database import set_value, get_value
+from shard_core.database.database import StoredValue
 from shard_core.model.app_meta import VMSize
 from shard_core.model.backend.portal_meta import PortalMetaExt
 
@@ -32,9 +32,12 @@ class Profile(BaseModel):
 		)
 
 
+_profile = StoredValue('profile', Profile)
+
+
 def set_profile(profile: Profile):
-	set_value('profile', profile.dict())
+	_profile.set(profile)
 
 
 def get_profile() -> Profile:
-	return Profile.parse_obj(get_value('profile'))
+	return _profile.get()
@@ -3,11 +3,8 @@ from enum import Enum
 from typing import Optional
 
 from pydantic import BaseModel
-from tinydb import Query
 
-from shard_core.database.database import terminals_table
 from shard_core.service import human_encoding
-from shard_core.util.signals import on_terminal_auth
 
 
 class Icon(str, Enum):
@@ -40,10 +37,3 @@ class InputTerminal(BaseModel):
 	name: str
 	icon: Icon = Icon.UNKNOWN
 
-
-@on_terminal_auth.connect
-def update_terminal_last_connection(terminal: Terminal):
-	with terminals_table() as terminals:  # type: Table
-		existing_terminal = Terminal(**(terminals.get(Query().id == terminal.id)))
-		existing_terminal.last_connection = datetime.utcnow()
-		terminals.update(existing_terminal.dict(), Query().id == existing_terminal.id)
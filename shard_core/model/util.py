@@ -1,7 +1,9 @@
-from typing import Dict, Any
+from typing import Dict, Any, Mapping, Type, TypeVar
 
 from pydantic import BaseModel
 
+M = TypeVar('M', bound=BaseModel)
+
 
 class PropertyBaseModel(BaseModel):
 	"""
@@ -31,3 +33,11 @@ class PropertyBaseModel(BaseModel):
 			attribs.update({prop: getattr(self, prop) for prop in props})
 
 		return attribs
+
+
+def construct_trusted(model_cls: Type[M], document: Mapping) -> M:
+	"""
+	Builds a model from a document that was validated when it was written, like the documents of the database,
+	without validating it again. Only the fields of the model are taken, so stored properties are left out.
+	"""
+	return model_cls.construct(**{k: v for k, v in document.items() if k in model_cls.__fields__})
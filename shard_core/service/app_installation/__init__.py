@@ -1,6 +1,7 @@
 import logging
 
 import gconf
+from tinydb import Query
 
 from shard_core.database.database import installed_apps_table
 from shard_core.model.app_meta import InstallationReason, InstalledApp, Status
@@ -19,10 +20,9 @@ async def install_app_from_store(
 	if not await util.app_exists_in_store(name):
 		raise AppDoesNotExist(name)
 
-	if util.app_exists_in_db(name):
-		raise AppAlreadyInstalled(name)
-
 	with installed_apps_table() as installed_apps:
+		if installed_apps.contains(Query().name == name):
+			raise AppAlreadyInstalled(name)
 		installed_app = InstalledApp(
 			name=name,
 			installation_reason=installation_reason,
@@ -43,10 +43,9 @@ async def install_app_from_existing_zip(
 		name: str,
 		installation_reason: InstallationReason = InstallationReason.CUSTOM
 ):
-	if util.app_exists_in_db(name):
-		raise AppAlreadyInstalled(name)
-
 	with installed_apps_table() as installed_apps:
+		if installed_apps.contains(Query().name == name):
+			raise AppAlreadyInstalled(name)
 		installed_app = InstalledApp(
 			name=name,
 			installation_reason=installation_reason,
@@ -3,31 +3,24 @@ from pathlib import Path
 
 import aiofiles
 import gconf
-import httpx
 import jinja2
 import pydantic
 import yaml
 from tinydb import Query
 
-from shard_core.database.database import installed_apps_table, identities_table
+from shard_core.database.database import installed_apps_table, identities_table, transaction
 from shard_core.model.app_meta import Status, InstalledApp
 from shard_core.model.identity import Identity, SafeIdentity
+from shard_core.model.util import construct_trusted
 from shard_core.service.app_installation.exceptions import AppInIllegalStatus
 from shard_core.service.app_tools import get_installed_apps_path, get_app_metadata
+from shard_core.service.http_client import get_http_client
 from shard_core.service.traefik_dynamic_config import AppInfo, compile_config
 from shard_core.util import signals
 
 log = logging.getLogger(__name__)
 
 
-def get_app_from_db(app_name: str) -> InstalledApp:
-	with installed_apps_table() as installed_apps:
-		if record := installed_apps.get(Query().name == app_name):
-			return InstalledApp.parse_obj(record)
-		else:
-			raise KeyError(app_name)
-
-
 def app_exists_in_db(app_name: str) -> bool:
 	with installed_apps_table() as installed_apps:
 		return installed_apps.contains(Query().name == app_name)
@@ -39,6 +32,23 @@ def assert_app_status(installed_app: InstalledApp, *allowed_status: Status):
 			f'App {installed_app.name} is in status {installed_app.status}, should be one of {allowed_status}')
 
 
+def transition_app_status(app_name: str, status: Status, *allowed_status: Status) -> InstalledApp:
+	"""
+	Sets the status of an app if it currently is in one of the allowed states, as a single database operation.
+	Returns the app as it was before.
+	"""
+	with transaction('installed_apps') as (installed_apps,):
+		if record := installed_apps.get(Query().name == app_name):
+			installed_app = InstalledApp.parse_obj(record)
+		else:
+			raise KeyError(app_name)
+		assert_app_status(installed_app, *allowed_status)
+		installed_apps.update({'status': status}, Query().name == app_name)
+	log.debug(f'status of {app_name} updated to {status}')
+	signals.on_apps_update.send()
+	return installed_app
+
+
 def update_app_status(app_name: str, status: Status, message: str | None = None):
 	with installed_apps_table() as installed_apps:
 		updated_docs = installed_apps.update({'status': status}, Query().name == app_name)
@@ -51,9 +61,8 @@ def update_app_status(app_name: str, status: Status, message: str | None = None)
 async def app_exists_in_store(name: str) -> bool:
 	app_store = gconf.get('apps.app_store')
 	url = f'{app_store["base_url"]}/{app_store["container_name"]}/master/all_apps/{name}/{name}.zip'
-	async with httpx.AsyncClient() as client:
-		response = await client.get(url)
-		return response.status_code == 200
+	response = await get_http_client().get(url)
+	return response.status_code == 200
 
 
 async def render_docker_compose_template(app: InstalledApp):
@@ -65,7 +74,7 @@ async def render_docker_compose_template(app: InstalledApp):
 	}
 
 	with identities_table() as identities:
-		default_identity = Identity(**identities.get(Query().is_default == True))  # noqa: E712
+		default_identity = construct_trusted(Identity, identities.get(Query().is_default == True))  # noqa: E712
 	portal = SafeIdentity.from_identity(default_identity)
 
 	app_dir = get_installed_apps_path() / app.name
@@ -82,7 +91,7 @@ async def write_traefik_dyn_config():
 	app_infos = [AppInfo(get_app_metadata(a.name), installed_app=a) for a in installed_apps if a.status != Status.ERROR]
 
 	with identities_table() as identities:
-		default_identity = Identity(**identities.get(Query().is_default == True))  # noqa: E712
+		default_identity = construct_trusted(Identity, identities.get(Query().is_default == True))  # noqa: E712
 	portal = SafeIdentity.from_identity(default_identity)
 
 	traefik_dyn_filename = Path(gconf.get('path_root')) / 'core' / 'traefik_dyn' / 'traefik_dyn.yml'
@@ -7,18 +7,18 @@ from pathlib import Path
 from typing import Literal
 
 import gconf
-import httpx
 from pydantic import BaseModel
 from tinydb import Query
 
 from shard_core.database.database import installed_apps_table
 from shard_core.model.app_meta import Status
+from shard_core.service.app_registry import app_registry
 from shard_core.service.app_tools import get_installed_apps_path, docker_create_app_containers, docker_stop_app, \
 	docker_shutdown_app
+from shard_core.service.http_client import get_http_client
 from shard_core.util import signals
 from .exceptions import AppDoesNotExist
-from .util import update_app_status, render_docker_compose_template, write_traefik_dyn_config, get_app_from_db, \
-	assert_app_status
+from .util import update_app_status, render_docker_compose_template, write_traefik_dyn_config, transition_app_status
 
 log = logging.getLogger(__name__)
 
@@ -83,9 +83,7 @@ installation_worker = InstallationWorker()
 
 
 async def _install_app_from_store(app_name: str):
-	installed_app = get_app_from_db(app_name)
-	assert_app_status(installed_app, Status.INSTALLATION_QUEUED)
-	update_app_status(installed_app.name, Status.INSTALLING)
+	installed_app = transition_app_status(app_name, Status.INSTALLING, Status.INSTALLATION_QUEUED)
 	try:
 		zip_file = await _download_app_zip(installed_app.name)
 		await _install_app_from_zip(installed_app, zip_file)
@@ -96,9 +94,7 @@ async def _install_app_from_store(app_name: str):
 
 
 async def _install_app_from_existing_zip(app_name: str):
-	installed_app = get_app_from_db(app_name)
-	assert_app_status(installed_app, Status.INSTALLATION_QUEUED)
-	update_app_status(installed_app.name, Status.INSTALLING)
+	installed_app = transition_app_status(app_name, Status.INSTALLING, Status.INSTALLATION_QUEUED)
 	try:
 		zip_file = get_installed_apps_path() / installed_app.name / f'{installed_app.name}.zip'
 		await _install_app_from_zip(installed_app, zip_file)
@@ -121,6 +117,7 @@ async def _uninstall_app(app_name: str):
 		log.error(f'Error while shutting down app {app_name}: {e:!r}')
 
 	log.debug(f'deleting app data for {app_name}')
+	app_registry.forget_app_files(app_name)
 	shutil.rmtree(Path(get_installed_apps_path() / app_name), ignore_errors=True)
 	log.debug(f'removing app {app_name} from database')
 	with installed_apps_table() as installed_apps:
@@ -131,9 +128,7 @@ async def _uninstall_app(app_name: str):
 
 
 async def _reinstall_app(app_name: str):
-	installed_app = get_app_from_db(app_name)
-	assert_app_status(installed_app, Status.REINSTALLATION_QUEUED)
-	update_app_status(installed_app.name, Status.REINSTALLING)
+	installed_app = transition_app_status(app_name, Status.REINSTALLING, Status.REINSTALLATION_QUEUED)
 
 	try:
 		await docker_stop_app(app_name, set_status=False)
@@ -142,6 +137,7 @@ async def _reinstall_app(app_name: str):
 		log.error(f'Error while shutting down app {app_name}: {e:!r}')
 
 	log.debug(f'deleting app data for {app_name}')
+	app_registry.forget_app_files(app_name)
 	shutil.rmtree(Path(get_installed_apps_path() / app_name), ignore_errors=True)
 
 	try:
@@ -156,6 +152,7 @@ async def _reinstall_app(app_name: str):
 async def _install_app_from_zip(installed_app, zip_file):
 	with zipfile.ZipFile(zip_file, "r") as zip_ref:
 		zip_ref.extractall(zip_file.parent)
+	app_registry.reload_app_files(installed_app.name)
 	signals.on_apps_update.send()
 	zip_file.unlink()
 
@@ -167,13 +164,12 @@ async def _install_app_from_zip(installed_app, zip_file):
 async def _download_app_zip(name: str) -> Path:
 	app_store = gconf.get('apps.app_store')
 	url = f'{app_store["base_url"]}/{app_store["container_name"]}/master/all_apps/{name}/{name}.zip'
-	async with httpx.AsyncClient() as client:
-		response = await client.get(url)
-		if response.status_code != 200:
-			raise AppDoesNotExist(url)
-		zip_file = get_installed_apps_path() / name / f'{name}.zip'
-		zip_file.parent.mkdir(parents=True, exist_ok=True)
-		with open(zip_file, 'wb') as f:
-			f.write(response.content)
+	response = await get_http_client().get(url)
+	if response.status_code != 200:
+		raise AppDoesNotExist(url)
+	zip_file = get_installed_apps_path() / name / f'{name}.zip'
+	zip_file.parent.mkdir(parents=True, exist_ok=True)
+	with open(zip_file, 'wb') as f:
+		f.write(response.content)
 	log.debug(f'downloaded {name} to {zip_file}')
 	return zip_file
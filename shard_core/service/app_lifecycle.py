@@ -3,10 +3,10 @@ import logging
 import time
 from typing import Dict
 
-from shard_core.database.database import installed_apps_table
 from shard_core.model.app_meta import InstalledApp, Status
 from shard_core.service import disk
-from shard_core.service.app_tools import docker_start_app, docker_stop_app, get_app_metadata, size_is_compatible
+from shard_core.service.app_registry import app_registry
+from shard_core.service.app_tools import docker_start_app, docker_stop_app, size_is_compatible
 from shard_core.util import signals
 
 log = logging.getLogger(__name__)
@@ -18,7 +18,7 @@ last_access_dict: Dict[str, float] = dict()
 def ensure_app_is_running(app: InstalledApp):
 	if disk.current_disk_usage.disk_space_low:
 		return
-	app_meta = get_app_metadata(app.name)
+	app_meta = app_registry.get_app_meta(app.name)
 	if size_is_compatible(app_meta.minimum_portal_size):
 		global last_access_dict
 		last_access_dict[app.name] = time.time()
@@ -26,18 +26,16 @@ def ensure_app_is_running(app: InstalledApp):
 
 
 async def control_apps():
-	with installed_apps_table() as installed_apps:
-		installed_apps = [
-			InstalledApp.parse_obj(a)
-			for a in installed_apps.all()
-			if a['status'] not in (Status.INSTALLATION_QUEUED, Status.INSTALLING)]
+	installed_apps = [
+		app for app in app_registry.get_apps()
+		if app.status not in (Status.INSTALLATION_QUEUED, Status.INSTALLING)]
 	tasks = [_control_app(app.name) for app in installed_apps]
 	await asyncio.gather(*tasks)
 
 
 async def _control_app(name: str):
 	global last_access_dict
-	app_meta = get_app_metadata(name)
+	app_meta = app_registry.get_app_meta(name)
 
 	if disk.current_disk_usage.disk_space_low:
 		await docker_stop_app(name)
@@ -0,0 +1,83 @@
+import logging
+from typing import Dict, List, Tuple
+
+from shard_core.database import changes
+from shard_core.database.database import installed_apps_table
+from shard_core.model.app_meta import InstalledApp, AppMeta, Path
+from shard_core.service.app_routes import AppRoutes
+from shard_core.service.app_tools import get_app_metadata, invalidate_app_metadata
+
+log = logging.getLogger(__name__)
+
+
+class AppRegistry:
+	"""
+	Installed apps with their metadata and compiled routes, kept in memory.
+	The apps follow the installed_apps table through the database changes, a change only parses the changed app.
+	Metadata comes from `get_app_metadata`, which parses an app's file again when it changes.
+	Compiled routes are kept with the metadata they were compiled from and compiled again when it changes.
+	Returned objects are shared and must not be modified.
+	"""
+
+	def __init__(self):
+		self._apps: Dict[str, InstalledApp] | None = None
+		self._routes: Dict[str, Tuple[AppMeta, AppRoutes]] = {}
+
+	def get_app(self, name: str) -> InstalledApp | None:
+		return self._get_apps().get(name)
+
+	def get_apps(self) -> List[InstalledApp]:
+		return list(self._get_apps().values())
+
+	def get_app_meta(self, name: str) -> AppMeta:
+		return get_app_metadata(name)
+
+	def match_path(self, name: str, uri: str) -> Path | None:
+		"""
+		Properties of the longest path of the app that the URI starts with.
+		"""
+		app_meta = get_app_metadata(name)
+		compiled = self._routes.get(name)
+		if compiled is None or compiled[0] is not app_meta:
+			compiled = app_meta, AppRoutes(app_meta.paths)
+			self._routes[name] = compiled
+		return compiled[1].match(uri)
+
+	def reload_app_files(self, name: str):
+		"""
+		Loads the metadata of an app and compiles its routes again, after its files have been replaced.
+		"""
+		self.forget_app_files(name)
+		self.match_path(name, '')
+		log.debug(f'loaded metadata of {name} with {len(self._routes[name][1].paths)} paths')
+
+	def forget_app_files(self, name: str):
+		invalidate_app_metadata(name)
+		self._routes.pop(name, None)
+
+	def on_database_change(self, change: changes.Change):
+		if change.doc_id is None:
+			self._apps = None
+			self._routes.clear()
+			return
+
+		old_name = change.old['name'] if change.old else None
+		new_name = change.new['name'] if change.new else None
+		if old_name and old_name != new_name:
+			if self._apps is not None:
+				self._apps.pop(old_name, None)
+			self.forget_app_files(old_name)
+		if new_name and self._apps is not None:
+			self._apps[new_name] = InstalledApp.parse_obj(change.new)
+
+	def _get_apps(self) -> Dict[str, InstalledApp]:
+		if (apps := self._apps) is None:
+			with installed_apps_table() as installed_apps:
+				# assigned with the lock held, so no change can come in between
+				apps = {a['name']: InstalledApp.parse_obj(a) for a in installed_apps.all()}
+				self._apps = apps
+		return apps
+
+
+app_registry = AppRegistry()
+changes.subscribe('installed_apps', app_registry.on_database_change)
@@ -0,0 +1,21 @@
+from typing import Dict
+
+from shard_core.model.app_meta import Path
+
+
+class AppRoutes:
+	"""
+	The paths of an app, compiled for matching request URIs against them.
+	Paths are grouped by length, so the longest path that is a prefix of a URI is found
+	with one dict lookup per distinct path length.
+	"""
+
+	def __init__(self, paths: Dict[str, Path]):
+		self.paths = dict(paths)
+		self._lengths = sorted({len(p) for p in paths}, reverse=True)
+
+	def match(self, uri: str) -> Path | None:
+		for length in self._lengths:
+			if length <= len(uri) and (path := self.paths.get(uri[:length])) is not None:
+				return path
+		return None
@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 from pathlib import Path
+from typing import Dict, Tuple
 
 import gconf
 from tinydb import Query
@@ -23,51 +24,51 @@ async def docker_create_app_containers(name: str):
 
 @throttle(5)
 async def docker_start_app(name: str):
-	with installed_apps_table() as installed_apps:
+	async with installed_apps_table() as installed_apps:
 		# todo: think more about how to handle different states
-		app_status = installed_apps.get(Query().name == name)['status']
+		app_status = (await installed_apps.get(Query().name == name))['status']
 
 	if app_status in [Status.STOPPED, Status.RUNNING, Status.DOWN]:
 		await subprocess('docker-compose', 'up', '-d', cwd=get_installed_apps_path() / name)
-		with installed_apps_table() as installed_apps:
-			installed_apps.update({'status': Status.RUNNING}, Query().name == name)
+		async with installed_apps_table() as installed_apps:
+			await installed_apps.update({'status': Status.RUNNING}, Query().name == name)
 		signals.on_apps_update.send()
 
 
 async def docker_stop_app(name: str, set_status: bool = True):
-	with installed_apps_table() as installed_apps:
+	async with installed_apps_table() as installed_apps:
 		# todo: think more about how to handle different states
-		app_status = installed_apps.get(Query().name == name)['status']
+		app_status = (await installed_apps.get(Query().name == name))['status']
 	if app_status in [Status.RUNNING, Status.UNINSTALLING]:
 		await subprocess('docker-compose', 'stop', cwd=get_installed_apps_path() / name)
 		if set_status:
-			with installed_apps_table() as installed_apps:
-				installed_apps.update({'status': Status.STOPPED}, Query().name == name)
+			async with installed_apps_table() as installed_apps:
+				await installed_apps.update({'status': Status.STOPPED}, Query().name == name)
 		signals.on_apps_update.send()
 
 
 async def docker_shutdown_app(name: str, set_status: bool = True, force: bool = False):
-	with installed_apps_table() as installed_apps:
+	async with installed_apps_table() as installed_apps:
 		# todo: think more about how to handle different states
-		app_status = installed_apps.get(Query().name == name)['status']
+		app_status = (await installed_apps.get(Query().name == name))['status']
 	if force or app_status in [Status.STOPPED, Status.UNINSTALLING]:
 		await subprocess('docker-compose', 'down', cwd=get_installed_apps_path() / name)
 		if set_status:
-			with installed_apps_table() as installed_apps:
-				installed_apps.update({'status': Status.DOWN}, Query().name == name)
+			async with installed_apps_table() as installed_apps:
+				await installed_apps.update({'status': Status.DOWN}, Query().name == name)
 		signals.on_apps_update.send()
 
 
 async def docker_stop_all_apps():
-	with installed_apps_table() as installed_apps:
-		apps = [InstalledApp.parse_obj(a) for a in installed_apps.all()]
+	async with installed_apps_table() as installed_apps:
+		apps = [InstalledApp.parse_obj(a) for a in await installed_apps.all()]
 	tasks = [docker_stop_app(app.name) for app in apps]
 	await asyncio.gather(*tasks)
 
 
 async def docker_shutdown_all_apps(force: bool = False):
-	with installed_apps_table() as installed_apps:
-		apps = [InstalledApp.parse_obj(a) for a in installed_apps.all()]
+	async with installed_apps_table() as installed_apps:
+		apps = [InstalledApp.parse_obj(a) for a in await installed_apps.all()]
 	tasks = [docker_shutdown_app(app.name, force=force) for app in apps]
 	await asyncio.gather(*tasks)
 
@@ -76,15 +77,39 @@ def get_installed_apps_path() -> Path:
 	return Path(gconf.get('path_root')) / 'core' / 'installed_apps'
 
 
+# Parsed metadata by app name, with the path and the mtime, inode and size of the file it was parsed from
+_app_metadata: Dict[str, Tuple[Tuple[Path, int, int, int], AppMeta]] = {}
+
+
 def get_app_metadata(app_name: str) -> AppMeta:
-	app_path = get_installed_apps_path() / app_name
-	if not app_path.exists():
+	"""
+	Metadata of an installed app, parsed again only if its `app_meta.json` was replaced or modified.
+	The returned object is shared and must not be modified.
+	"""
+	app_meta_file = get_installed_apps_path() / app_name / 'app_meta.json'
+	try:
+		stat = app_meta_file.stat()
+	except (FileNotFoundError, NotADirectoryError):
+		_app_metadata.pop(app_name, None)
 		raise MetadataNotFound(app_name)
+	file_version = (app_meta_file, stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+	if (cached := _app_metadata.get(app_name)) and cached[0] == file_version:
+		return cached[1]
 	try:
-		with open(app_path / 'app_meta.json') as f:
-			return AppMeta.parse_obj(json.load(f))
+		with open(app_meta_file) as f:
+			app_meta = AppMeta.parse_obj(json.load(f))
 	except (FileNotFoundError, json.JSONDecodeError):
 		raise MetadataNotFound(app_name)
+	_app_metadata[app_name] = (file_version, app_meta)
+	return app_meta
+
+
+def invalidate_app_metadata(app_name: str):
+	"""
+	Parses the metadata of an app again on next use, even if its new file has the same mtime, inode and size.
+	"""
+	_app_metadata.pop(app_name, None)
 
 
 def size_is_compatible(app_size) -> bool:
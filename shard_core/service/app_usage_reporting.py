@@ -3,27 +3,27 @@ import logging
 from datetime import datetime, date, timedelta
 
 import gconf
-from requests import HTTPError
+from httpx import HTTPError
 from starlette import status
 from tinydb import Query
 
-from shard_core.database.database import installed_apps_table, app_usage_track_table
+from shard_core.database.database import installed_apps_table, app_usage_track_table, transaction
 from shard_core.model.app_meta import InstalledApp
-from shard_core.model.app_usage import AppUsageTrack, AppUsageReport
+from shard_core.model.app_usage import AppUsageTrack, AppUsageReport, AppUsageMonthly
 from shard_core.service.signed_call import signed_request
 
 log = logging.getLogger(__name__)
 
 
 async def track_currently_installed_apps():
-	with installed_apps_table() as installed_apps:  # type: Table
-		all_apps = [InstalledApp.parse_obj(a) for a in installed_apps.all()]
+	async with installed_apps_table() as installed_apps:
+		all_apps = [InstalledApp.parse_obj(a) for a in await installed_apps.all()]
 	track = AppUsageTrack(
 		timestamp=datetime.utcnow(),
 		installed_apps=[app.name for app in all_apps]
 	)
-	with app_usage_track_table() as tracks:  # type: Table
-		tracks.insert(track.dict())
+	async with app_usage_track_table() as tracks:
+		await tracks.insert(track.dict())
 	log.debug(f'created app usage track for {len(track.installed_apps)} apps')
 
 
@@ -35,8 +35,8 @@ async def report_app_usage():
 
 	report = AppUsageReport(year=start.year, month=start.month, usage={})
 
-	with app_usage_track_table() as tracks:  # type: Table
-		relevant_tracks = tracks.search((start <= Query().timestamp) & (Query().timestamp < end))
+	async with app_usage_track_table() as tracks:
+		relevant_tracks = await tracks.search((start <= Query().timestamp) & (Query().timestamp < end))
 
 	if not relevant_tracks:
 		log.warning('no app usage tracks found for reporting')
@@ -66,3 +66,49 @@ async def report_app_usage():
 		else:
 			log.info('sent app usage report')
 			return
+
+
+def compact_app_usage_tracks():
+	"""
+	Rolls the daily tracks from before the last month, which has been reported already, into monthly aggregates
+	and removes aggregates older than the retention.
+	"""
+	first_day_of_last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+	cutoff = datetime.combine(first_day_of_last_month, datetime.min.time())
+	retention = gconf.get('apps.usage_reporting.retention.monthly_aggregates', default=24)
+	oldest_kept_month = _month_index(cutoff.year, cutoff.month) - retention
+
+	with transaction('app_usage_track', 'app_usage_monthly') as (tracks, monthly):
+		old_tracks = tracks.search(Query().timestamp < cutoff)
+		aggregates = {}
+		for t in old_tracks:
+			track = AppUsageTrack.parse_obj(t)
+			month = (track.timestamp.year, track.timestamp.month)
+			if month not in aggregates:
+				if existing := monthly.get((Query().year == month[0]) & (Query().month == month[1])):
+					aggregates[month] = AppUsageMonthly.parse_obj(existing)
+				else:
+					aggregates[month] = AppUsageMonthly(year=month[0], month=month[1], tracks=0, usage={})
+			aggregate = aggregates[month]
+			aggregate.tracks += 1
+			for app in track.installed_apps:
+				aggregate.usage[app] = aggregate.usage.get(app, 0) + 1
+
+		for aggregate in aggregates.values():
+			monthly.upsert(aggregate.dict(), (Query().year == aggregate.year) & (Query().month == aggregate.month))
+		if old_tracks:
+			tracks.remove(doc_ids=[t.doc_id for t in old_tracks])
+
+		expired_ids = [
+			a.doc_id for a in monthly.all()
+			if _month_index(a['year'], a['month']) < oldest_kept_month]
+		if expired_ids:
+			monthly.remove(doc_ids=expired_ids)
+
+	log.info(
+		f'rolled {len(old_tracks)} app usage tracks into {len(aggregates)} monthly aggregates, '
+		f'removed {len(expired_ids)} expired aggregates')
+
+
+def _month_index(year: int, month: int) -> int:
+	return year * 12 + month - 1
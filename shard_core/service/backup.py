@@ -8,7 +8,7 @@ from pathlib import Path
 from typing import List
 
 import gconf
-from requests import HTTPError
+from httpx import HTTPError
 
 from shard_core import database
 from shard_core.database.database import backups_table
@@ -20,8 +20,14 @@ log = logging.getLogger(__name__)
 
 STORE_KEY_BACKUP_PASSPHRASE = 'backup_passphrase'
 STORE_KEY_BACKUP_PASSPHRASE_LAST_ACCESS = 'backup_passphrase_last_access'
+STORE_KEY_LATEST_BACKUP_REPORT = 'latest_backup_report'
 BACKUP_IN_PROGESS_LOCK = asyncio.Lock()
 
+_passphrase = database.StoredValue(STORE_KEY_BACKUP_PASSPHRASE, str)
+passphrase_last_access = database.StoredValue(
+	STORE_KEY_BACKUP_PASSPHRASE_LAST_ACCESS, BackupPassphraseLastAccessInfoDB)
+_latest_backup_report_id = database.StoredValue(STORE_KEY_LATEST_BACKUP_REPORT, int)
+
 COMMAND_TEMPLATE = '''
 rclone 
 --azureblob-sas-url {sas_token} 
@@ -102,8 +108,9 @@ async def backup_directories(directories: List[Path], container_name: str, sas_t
 			startTime=overall_start_time,
 			endTime=overall_end_time,
 		)
-		with backups_table() as table:
-			table.insert(report.dict())
+		async with backups_table() as table:
+			doc_id = await table.insert(report.dict())
+		_latest_backup_report_id.set(doc_id)
 		log.info('Backup done')
 
 
@@ -135,7 +142,7 @@ async def _backup_directory(container_name, rel_directory, obscured_passphrase,
 
 
 async def _get_obscured_passphrase():
-	passphrase = database.get_value(STORE_KEY_BACKUP_PASSPHRASE)
+	passphrase = _passphrase.get()
 	obscured_passphrase = subprocess.run(
 		['rclone', 'obscure', passphrase], capture_output=True, text=True).stdout.strip()
 	return obscured_passphrase
@@ -147,30 +154,75 @@ def _get_relative_directory(directory: Path) -> Path:
 
 
 def get_latest_backup_report() -> BackupReport | None:
+	try:
+		latest_id = _latest_backup_report_id.get()
+	except KeyError:
+		latest_id = None
+	latest_stats = None
+	if latest_id is not None:
+		with backups_table() as table:
+			latest_stats = table.get(doc_id=latest_id)
+	if latest_stats is None:
+		# not stored yet, or the stored report was removed
+		latest_stats = _find_latest_backup_report()
+	return BackupReport.parse_obj(latest_stats) if latest_stats else None
+
+
+def _find_latest_backup_report() -> dict | None:
 	with backups_table() as table:
 		latest_stats = max(table.all(), key=lambda x: x['endTime'], default=None)
-	return BackupReport.parse_obj(latest_stats) if latest_stats else None
+	if latest_stats is not None:
+		_latest_backup_report_id.set(latest_stats.doc_id)
+	return latest_stats
+
+
+def compact_backup_reports():
+	"""
+	Keeps the latest reports complete, summarizes older ones to their totals per directory
+	and removes reports beyond the retention.
+	"""
+	full_reports = max(1, gconf.get('services.backup.retention.full_reports', default=30))
+	summaries = gconf.get('services.backup.retention.summaries', default=365)
+
+	with backups_table() as table:
+		reports = sorted(table.all(), key=lambda x: x['endTime'], reverse=True)
+		to_summarize = [r.doc_id for r in reports[full_reports:full_reports + summaries] if not r.get('summarized')]
+		if to_summarize:
+			table.update(_summarize_backup_report, doc_ids=to_summarize)
+		expired_ids = [r.doc_id for r in reports[full_reports + summaries:]]
+		if expired_ids:
+			table.remove(doc_ids=expired_ids)
+	if reports:
+		_latest_backup_report_id.set(reports[0].doc_id)
+	log.info(f'summarized {len(to_summarize)} backup reports, removed {len(expired_ids)} expired ones')
+
+
+def _summarize_backup_report(report: dict):
+	report['directories'] = [
+		{field: d.get(field) for field in ['directory', 'startTime', 'endTime', 'bytes', 'errors', 'transfers']}
+		for d in report['directories']]
+	report['summarized'] = True
 
 
 def ensure_backup_passphrase():
 	try:
-		database.get_value(STORE_KEY_BACKUP_PASSPHRASE)
+		_passphrase.get()
 	except KeyError:
 		passphrase_numbers = passphrase_util.generate_passphrase_numbers(10)
 		passphrase = passphrase_util.get_passphrase(passphrase_numbers)
-		database.set_value(STORE_KEY_BACKUP_PASSPHRASE, passphrase)
+		_passphrase.set(passphrase)
 		log.info('Generated new backup passphrase')
 	else:
 		log.info('Backup passphrase already exists')
 
 
 def get_backup_passphrase(terminal_id: str) -> str:
-	passphrase = database.get_value(STORE_KEY_BACKUP_PASSPHRASE)
+	passphrase = _passphrase.get()
 	last_access_info = BackupPassphraseLastAccessInfoDB(
 		time=datetime.datetime.now(datetime.timezone.utc),
 		terminal_id=terminal_id,
 	)
-	database.set_value(STORE_KEY_BACKUP_PASSPHRASE_LAST_ACCESS, last_access_info.dict())
+	passphrase_last_access.set(last_access_info)
 	return passphrase
 
 
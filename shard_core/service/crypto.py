@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from cryptography import exceptions
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
@@ -14,6 +16,8 @@ class PublicKey:
 	key: RSAPublicKey
 
 	def __init__(self, input_):
+		self._bytes: bytes | None = None
+		self._hash_id: str | None = None
 		if isinstance(input_, RSAPublicKey):
 			self.key = input_
 		elif isinstance(input_, bytes):
@@ -22,15 +26,19 @@ class PublicKey:
 			self.key = serialization.load_pem_public_key(input_.encode())
 
 	def to_bytes(self) -> bytes:
-		return self.key.public_bytes(
-			serialization.Encoding.PEM,
-			serialization.PublicFormat.SubjectPublicKeyInfo
-		)
+		if self._bytes is None:
+			self._bytes = self.key.public_bytes(
+				serialization.Encoding.PEM,
+				serialization.PublicFormat.SubjectPublicKeyInfo
+			)
+		return self._bytes
 
 	def to_hash_id(self) -> str:
-		digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
-		digest.update(self.to_bytes())
-		return human_encoding.encode(digest.finalize())
+		if self._hash_id is None:
+			digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
+			digest.update(self.to_bytes())
+			self._hash_id = human_encoding.encode(digest.finalize())
+		return self._hash_id
 
 	def verify_signature(self, signature: bytes, data: bytes):
 		try:
@@ -51,6 +59,7 @@ class PrivateKey:
 	key: RSAPrivateKey
 
 	def __init__(self, input_=None):
+		self._public_key: PublicKey | None = None
 		if input_ is None:
 			self.key = rsa.generate_private_key(
 				public_exponent=65537,
@@ -73,7 +82,9 @@ class PrivateKey:
 		)
 
 	def get_public_key(self) -> PublicKey:
-		return PublicKey(self.key.public_key())
+		if self._public_key is None:
+			self._public_key = PublicKey(self.key.public_key())
+		return self._public_key
 
 	def sign_data(self, data: bytes):
 		return self.key.sign(data, padding.PSS(
@@ -82,6 +93,22 @@ class PrivateKey:
 		), hashes.SHA256())
 
 
+@lru_cache(maxsize=256)
+def load_public_key(pem: str | bytes) -> PublicKey:
+	"""
+	Public key parsed from a PEM, shared by all callers with the same PEM, together with the values derived from it.
+	"""
+	return PublicKey(pem)
+
+
+@lru_cache(maxsize=16)
+def load_private_key(pem: str | bytes) -> PrivateKey:
+	"""
+	Private key parsed from a PEM, shared by all callers with the same PEM, together with its public key.
+	"""
+	return PrivateKey(pem)
+
+
 class InvalidSignature(Exception):
 	pass
 
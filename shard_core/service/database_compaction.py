@@ -0,0 +1,14 @@
+from shard_core.database.database import run_in_executor
+from shard_core.service import app_usage_reporting, backup
+
+
+def compact():
+	"""
+	Applies the retention of the tables that grow with every day of operation.
+	"""
+	app_usage_reporting.compact_app_usage_tracks()
+	backup.compact_backup_reports()
+
+
+async def compact_database():
+	await run_in_executor(compact)
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Tuple
+
+import gconf
+import httpx
+
+log = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+@asynccontextmanager
+async def http_client_lifespan():
+	"""
+	Opens the shared client for the lifespan of the app and closes its connections at shutdown.
+	A client opened on first use before the lifespan is used and closed the same way.
+	"""
+	global _client
+	if _client is None:
+		_client = _make_client()
+	client = _client
+	try:
+		yield client
+	finally:
+		_client = None
+		await client.aclose()
+
+
+def get_http_client() -> httpx.AsyncClient:
+	"""
+	The client for all outbound calls. Outside the app lifespan, a client is opened on first use.
+	"""
+	global _client
+	if _client is None:
+		_client = _make_client()
+	return _client
+
+
+def get_proxy_timeout() -> float | None:
+	"""
+	The total timeout for calls proxied on behalf of apps, which are not limited by default.
+	"""
+	return gconf.get('http_client.proxy_timeout', default=None)
+
+
+def _make_client() -> httpx.AsyncClient:
+	limits = httpx.Limits(
+		max_connections=gconf.get('http_client.max_connections', default=100),
+		max_keepalive_connections=gconf.get('http_client.max_keepalive_connections', default=20),
+		keepalive_expiry=gconf.get('http_client.keepalive_expiry', default=30),
+	)
+	timeout = httpx.Timeout(
+		gconf.get('http_client.timeout', default=30),
+		connect=gconf.get('http_client.connect_timeout', default=10),
+	)
+	http2 = gconf.get('http_client.http2', default=False)
+	transport = _HostLimitedTransport(
+		httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+		gconf.get('http_client.max_connections_per_host', default=10),
+	)
+	log.debug(f'opening http client with {limits}, {timeout}, http2={http2}')
+	return httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+
+
+class _HostLimitedTransport(httpx.AsyncBaseTransport):
+	"""
+	Limits the concurrent requests per host, so a slow peer cannot take all connections of the pool.
+	A request counts until its response is closed.
+	"""
+
+	def __init__(self, transport: httpx.AsyncBaseTransport, max_requests_per_host: int):
+		self._transport = transport
+		self._max_requests_per_host = max_requests_per_host
+		# semaphore and number of running and waiting requests by host, dropped when the last request is done
+		self._semaphores: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+
+	async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+		host = request.url.netloc.decode()
+		semaphore, requests = self._semaphores.get(host) or (asyncio.Semaphore(self._max_requests_per_host), 0)
+		self._semaphores[host] = semaphore, requests + 1
+		try:
+			await semaphore.acquire()
+		except BaseException:
+			self._leave(host)
+			raise
+		try:
+			response = await self._transport.handle_async_request(request)
+		except BaseException:
+			self._release(host)
+			raise
+		response.stream = _ReleasingStream(response.stream, functools.partial(self._release, host))
+		return response
+
+	async def aclose(self):
+		await self._transport.aclose()
+
+	def _release(self, host: str):
+		self._semaphores[host][0].release()
+		self._leave(host)
+
+	def _leave(self, host: str):
+		semaphore, requests = self._semaphores[host]
+		if requests > 1:
+			self._semaphores[host] = semaphore, requests - 1
+		else:
+			del self._semaphores[host]
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+	def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+		self._stream = stream
+		self._release: Callable[[], None] | None = release
+
+	async def __aiter__(self) -> AsyncIterator[bytes]:
+		async for chunk in self._stream:
+			yield chunk
+
+	async def aclose(self):
+		if self._release:
+			self._release()
+			self._release = None
+		await self._stream.aclose()
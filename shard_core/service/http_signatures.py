@@ -0,0 +1,164 @@
+import datetime
+import email.utils
+import hashlib
+from typing import Generator, Mapping, Type
+
+import httpx
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from http_message_signatures import HTTPMessageSigner, HTTPMessageVerifier, HTTPSignatureComponentResolver, \
+	HTTPSignatureKeyResolver, InvalidSignature, VerifyResult, algorithms, http_sfv
+from http_message_signatures.algorithms import HTTPSignatureAlgorithm
+
+REQUIRED_COMPONENTS = ('"@method"', '"@authority"', '"@target-uri"')
+# derived components that only depend on the method and the target URI of a request
+REQUEST_TARGET_COMPONENTS = {
+	'@method', '@target-uri', '@authority', '@scheme', '@request-target', '@path', '@query', '@query-param'}
+CONTENT_DIGEST_HASHERS = {'sha-256': hashlib.sha256, 'sha-512': hashlib.sha512}
+
+
+class SignedRequest:
+	"""
+	A request as needed for verifying its signature.
+	The target URI is used as it was sent, headers must be a case-insensitive mapping like Starlette's.
+	"""
+
+	def __init__(self, method: str, target_uri: str, headers: Mapping[str, str]):
+		self.method = method
+		self.url = target_uri
+		self.headers = headers
+
+
+class _ComponentResolver(HTTPSignatureComponentResolver):
+	def __init__(self, message: SignedRequest | httpx.Request):
+		# the headers are used as they are instead of being copied into a case-insensitive dict
+		self.message = message
+		self.message_type = 'request'
+		self.url = str(message.url)
+		self.headers = message.headers
+
+
+class SignatureAuth(httpx.Auth):
+	"""
+	Signs the requests of an httpx client the way `requests_http_signature.HTTPSignatureAuth` does,
+	covering method, authority, target URI, the date and the content digest of a body.
+	Pass a loaded key to an auth that is reused, a PEM is parsed again for every request.
+	"""
+	requires_request_body = True
+
+	def __init__(
+			self,
+			key_id: str,
+			key: bytes | RSAPrivateKey,
+			signature_algorithm: Type[HTTPSignatureAlgorithm] = algorithms.RSA_PSS_SHA512,
+	):
+		self.key_id = key_id
+		self._signer = HTTPMessageSigner(
+			signature_algorithm=signature_algorithm,
+			key_resolver=_SingleKeyResolver(key),
+			component_resolver_class=_ComponentResolver,
+		)
+
+	def auth_flow(self, request: httpx.Request) -> Generator[httpx.Request, httpx.Response, None]:
+		covered_component_ids = ['@method', '@authority', '@target-uri', 'date']
+		if request.content:
+			digest = CONTENT_DIGEST_HASHERS['sha-256'](request.content).digest()
+			request.headers['Content-Digest'] = str(http_sfv.Dictionary({'sha-256': digest}))
+			covered_component_ids.append('content-digest')
+		if 'authorization' in request.headers:
+			covered_component_ids.append('authorization')
+		created = datetime.datetime.now()
+		request.headers.setdefault('Date', email.utils.formatdate(int(created.timestamp()), usegmt=True))
+		self._signer.sign(request, key_id=self.key_id, created=created, covered_component_ids=covered_component_ids)
+		yield request
+
+
+class _SingleKeyResolver(HTTPSignatureKeyResolver):
+	def __init__(self, key: bytes | RSAPrivateKey):
+		self.key = key
+
+	def resolve_private_key(self, key_id: str):
+		return self.key
+
+
+def verify_request(
+		request: SignedRequest,
+		body: bytes,
+		key_resolver: HTTPSignatureKeyResolver,
+		signature_algorithm: Type[HTTPSignatureAlgorithm] = algorithms.RSA_PSS_SHA512,
+		max_age: datetime.timedelta = datetime.timedelta(days=1),
+) -> VerifyResult:
+	"""
+	Verifies the single signature of a request, with the same requirements as `HTTPSignatureAuth.verify`:
+	method, authority and target URI must be covered, and a request with a body must cover its content digest.
+	The body is only hashed if the signature covers the content digest.
+	"""
+	verifier = HTTPMessageVerifier(
+		signature_algorithm=signature_algorithm,
+		key_resolver=key_resolver,
+		component_resolver_class=_ComponentResolver,
+	)
+	verify_results = verifier.verify(request, max_age=max_age)
+	if len(verify_results) != 1:
+		raise InvalidSignature('Multiple signatures are not supported.')
+	verify_result = verify_results[0]
+
+	for component_key in REQUIRED_COMPONENTS:
+		if component_key not in verify_result.covered_components:
+			raise InvalidSignature(f'A required component, {component_key}, was not covered by the signature.')
+
+	content_digest = verify_result.covered_components.get('"content-digest"')
+	if content_digest is None:
+		if body:
+			raise InvalidSignature('A required component, "content-digest", was not covered by the signature.')
+		return verify_result
+	if not body:
+		raise InvalidSignature('Found a content-digest header in a message with no body')
+	_verify_content_digest(content_digest, body)
+	return verify_result._replace(body=body)
+
+
+def covered_values(request: SignedRequest) -> tuple | None:
+	"""
+	The signature headers of a request with the values of everything its signatures cover,
+	so two requests with the same covered values are equal for the signature.
+	None if a signature covers a component that cannot be read from the request as it is.
+	The headers must have a `getlist` method like Starlette's.
+	"""
+	signature_input = request.headers.get('signature-input')
+	signature = request.headers.get('signature')
+	if not signature_input or not signature:
+		return None
+	signatures = http_sfv.Dictionary()
+	try:
+		signatures.parse(signature_input.encode())
+	except Exception:
+		return None
+	header_values = []
+	for covered_components in signatures.values():
+		if not isinstance(covered_components, http_sfv.InnerList):
+			return None
+		for component in covered_components:
+			name = component.value
+			if name.startswith('@'):
+				if name not in REQUEST_TARGET_COMPONENTS:
+					return None
+			elif component.params:
+				return None
+			else:
+				header_values.append((name, tuple(request.headers.getlist(name))))
+	return signature_input, signature, request.method, request.url, tuple(header_values)
+
+
+def _verify_content_digest(content_digest: str, body: bytes):
+	digest = http_sfv.Dictionary()
+	try:
+		digest.parse(content_digest.encode())
+	except Exception as e:
+		raise InvalidSignature('Malformed content-digest header') from e
+	if len(digest) < 1:
+		raise InvalidSignature('Found a content-digest header with no digests')
+	for algorithm, value in digest.items():
+		if algorithm not in CONTENT_DIGEST_HASHERS:
+			raise InvalidSignature(f'Unsupported content digest algorithm "{algorithm}"')
+		if value.value != CONTENT_DIGEST_HASHERS[algorithm](body).digest():
+			raise InvalidSignature('The content-digest header does not match the message body')
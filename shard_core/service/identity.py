@@ -1,10 +1,11 @@
 import logging
 
-from requests import HTTPError
+from httpx import HTTPError
 from tinydb import Query
 
-from shard_core.database.database import identities_table
+from shard_core.database.database import identities_table, transaction
 from shard_core.model.identity import Identity
+from shard_core.model.util import construct_trusted
 from shard_core.service.portal_controller import refresh_profile
 from shard_core.util.signals import async_on_first_terminal_add
 
@@ -29,7 +30,7 @@ def init_default_identity():
 
 
 def make_default(id):
-	with identities_table() as identities:  # type: Table
+	with transaction('identities') as (identities,):
 		last_default = Identity(
 			**identities.get(Query().is_default == True))  # noqa: E712
 		if new_default := Identity(**identities.get(Query().id == id)):
@@ -44,7 +45,7 @@ def make_default(id):
 
 def get_default_identity() -> Identity:
 	with identities_table() as identities:
-		return Identity(**identities.get(Query().is_default == True))  # noqa: E712
+		return construct_trusted(Identity, identities.get(Query().is_default == True))  # noqa: E712
 
 
 @async_on_first_terminal_add.connect
@@ -55,12 +56,12 @@ async def enrich_identity_from_profile(_):
 		log.error(f'Could not enrich default identity from profile because profile could not be obtained: {e}')
 		return
 
-	with identities_table() as identities:  # type: Table
+	async with identities_table() as identities:
 		if profile.owner:
-			identities.update({
+			await identities.update({
 				'name': profile.owner,
 			}, Query().is_default == True)  # noqa: E712
 		if profile.owner_email:
-			identities.update({
+			await identities.update({
 				'email': profile.owner_email,
 			}, Query().is_default == True)  # noqa: E712
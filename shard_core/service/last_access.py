@@ -0,0 +1,68 @@
+import datetime
+import logging
+import threading
+from typing import Dict
+
+from tinydb import Query
+
+from shard_core.database.database import transaction, run_in_executor
+from shard_core.model.app_meta import InstalledApp
+from shard_core.model.terminal import Terminal
+from shard_core.util import signals
+
+log = logging.getLogger(__name__)
+
+# Latest access times not written yet, by terminal id and app name.
+# The dicts are swapped out as a whole when flushing, so recording never waits for the database.
+_terminal_connections: Dict[str, datetime.datetime] = {}
+_app_accesses: Dict[str, datetime.datetime] = {}
+_lock = threading.Lock()
+
+
+@signals.on_terminal_auth.connect
+def record_terminal_connection(terminal: Terminal):
+	with _lock:
+		_terminal_connections[terminal.id] = datetime.datetime.utcnow()
+
+
+@signals.on_request_to_app.connect
+def record_app_access(app: InstalledApp):
+	with _lock:
+		_app_accesses[app.name] = datetime.datetime.utcnow()
+
+
+def flush():
+	"""
+	Writes the recorded access times of terminals and apps in one transaction.
+	Terminals and apps that were removed in the meantime are skipped.
+	If the transaction fails, the times are kept for the next flush.
+	"""
+	global _terminal_connections, _app_accesses
+	with _lock:
+		terminal_connections, _terminal_connections = _terminal_connections, {}
+		app_accesses, _app_accesses = _app_accesses, {}
+	if not terminal_connections and not app_accesses:
+		return
+
+	try:
+		with transaction('terminals', 'installed_apps') as (terminals, installed_apps):
+			for terminal_id, last_connection in terminal_connections.items():
+				terminals.update({'last_connection': last_connection}, Query().id == terminal_id)
+			for app_name, last_access in app_accesses.items():
+				installed_apps.update({'last_access': last_access}, Query().name == app_name)
+	except Exception:
+		with _lock:
+			_merge_newer(_terminal_connections, terminal_connections)
+			_merge_newer(_app_accesses, app_accesses)
+		raise
+	log.debug(f'wrote access times of {len(terminal_connections)} terminals and {len(app_accesses)} apps')
+
+
+async def flush_last_access():
+	await run_in_executor(flush)
+
+
+def _merge_newer(target: Dict[str, datetime.datetime], times: Dict[str, datetime.datetime]):
+	for key, time in times.items():
+		if key not in target or target[key] < time:
+			target[key] = time
@@ -9,18 +9,20 @@ log = logging.getLogger(__name__)
 
 STORE_KEY_MANAGEMENT_SHARED_KEY = 'management_shared_key'
 
+_shared_secret = database.StoredValue(STORE_KEY_MANAGEMENT_SHARED_KEY, str)
+
 
 async def call_management(path: str, method: str = 'GET', body: bytes = None):
 	api_url = gconf.get('management.api_url')
 	url = f'{api_url}/{path}'
 	log.debug(f'call to {method} {url}')
-	return await signed_request(method, url, data=body)
+	return await signed_request(method, url, content=body)
 
 
 async def refresh_shared_secret():
 	response = await call_management('sharedSecret')
 	shared_secret = response.json()['shared_secret']
-	database.set_value(STORE_KEY_MANAGEMENT_SHARED_KEY, shared_secret)
+	_shared_secret.set(shared_secret)
 	return shared_secret
 
 
@@ -29,7 +31,7 @@ async def validate_shared_secret(secret: str):
 		raise SharedSecretInvalid
 
 	try:
-		expected_shared_secret = database.get_value(STORE_KEY_MANAGEMENT_SHARED_KEY)
+		expected_shared_secret = _shared_secret.get()
 	except KeyError:
 		expected_shared_secret = await refresh_shared_secret()
 		if secret != expected_shared_secret:
@@ -10,8 +10,10 @@ from pydantic import BaseModel
 from tinydb import Query
 
 from shard_core import database
+from shard_core.database import changes
 from shard_core.database.database import terminals_table
 from shard_core.model.terminal import Terminal
+from shard_core.util.cache import GenerationTTLCache
 
 STORE_KEY_JWT_SECRET = 'terminal_jwt_secret'
 STORE_KEY_PAIRING_CODE = 'pairing_code'
@@ -25,6 +27,15 @@ class PairingCode(BaseModel):
 	valid_until: datetime
 
 
+_jwt_secret = database.StoredValue(STORE_KEY_JWT_SECRET, str)
+_pairing_code = database.StoredValue(STORE_KEY_PAIRING_CODE, PairingCode)
+
+# Terminals of verified tokens, cleared when a terminal is removed or edited or the secret changes.
+_verified_tokens: GenerationTTLCache[Terminal] = GenerationTTLCache(
+	maxsize=lambda: gconf.get('terminal.jwt cache.max_size', default=256),
+	ttl=lambda: gconf.get('terminal.jwt cache.ttl', default=300))
+
+
 def make_pairing_code(deadline: int = None):
 	now = datetime.now(timezone.utc)
 	pairing_code = PairingCode(
@@ -33,13 +44,13 @@ def make_pairing_code(deadline: int = None):
 		valid_until=now + timedelta(
 			seconds=deadline or gconf.get('terminal.pairing code deadline', default=600))
 	)
-	database.set_value(STORE_KEY_PAIRING_CODE, pairing_code.dict())
+	_pairing_code.set(pairing_code)
 	return pairing_code
 
 
 def redeem_pairing_code(incoming_code: str):
 	try:
-		existing_pairing_code = PairingCode(**database.get_value(STORE_KEY_PAIRING_CODE))
+		existing_pairing_code = _pairing_code.get()
 	except KeyError:
 		raise InvalidPairingCode('no pairing code was issued yet')
 	if existing_pairing_code.code != incoming_code:
@@ -48,7 +59,7 @@ def redeem_pairing_code(incoming_code: str):
 	if datetime.now(timezone.utc) > existing_pairing_code.valid_until:
 		raise PairingCodeExpired(f'issued code ({existing_pairing_code.code}) is expired')
 	else:
-		database.remove_value(STORE_KEY_PAIRING_CODE)
+		_pairing_code.remove()
 
 
 def create_terminal_jwt(terminal_id, **kwargs) -> str:
@@ -61,15 +72,31 @@ def create_terminal_jwt(terminal_id, **kwargs) -> str:
 	return jwt.encode(payload, jwt_secret, algorithm='HS256')
 
 
-def verify_terminal_jwt(token: str = None):
+def get_verified_terminal(token: str = None) -> Terminal | None:
+	"""
+	Terminal of a token that was verified recently, None if it was not.
+	Reads nothing from the database, so it can be called on the event loop.
+	"""
+	if not token:
+		return None
+	terminal, _ = _verified_tokens.get(_strip_bearer(token))
+	return terminal
+
+
+def verify_terminal_jwt(token: str = None) -> Terminal:
+	"""
+	Terminal the token was issued to. Verified tokens are cached, the returned terminal is shared
+	and its `last_connection` may be outdated.
+	"""
 	if not token:
 		raise InvalidJwt('Missing JWT')
 
-	jwt_secret = _ensure_jwt_secret()
+	token = _strip_bearer(token)
+	terminal, generation = _verified_tokens.get(token)
+	if terminal is not None:
+		return terminal
 
-	bearer = 'Bearer '
-	if token.startswith(bearer):
-		token = token[len(bearer):]
+	jwt_secret = _ensure_jwt_secret()
 
 	try:
 		decoded_token = jwt.decode(token, jwt_secret, algorithms=['HS256'])
@@ -78,18 +105,48 @@ def verify_terminal_jwt(token: str = None):
 
 	with terminals_table() as terminals:  # type: Table
 		if terminal := terminals.get(Query().id == decoded_token['sub']):
-			return Terminal(**terminal)
+			terminal = Terminal(**terminal)
 		else:
 			raise InvalidJwt
 
+	_verified_tokens.put(token, terminal, generation)
+	return terminal
+
+
+def _strip_bearer(token: str) -> str:
+	bearer = 'Bearer '
+	return token[len(bearer):] if token.startswith(bearer) else token
+
+
+def _on_terminals_change(change: changes.Change):
+	# new terminals cannot be in the cache and updates of their last connection do not matter
+	if change.doc_id is not None and (change.old is None or (
+			change.new is not None and _without_last_connection(change.old) == _without_last_connection(change.new))):
+		return
+	_verified_tokens.clear()
+
+
+def _without_last_connection(terminal: dict) -> dict:
+	return {k: v for k, v in terminal.items() if k != 'last_connection'}
+
+
+def _on_values_change(change: changes.Change):
+	if change.doc_id is None or STORE_KEY_JWT_SECRET in (
+			(change.old or {}).get('key'), (change.new or {}).get('key')):
+		_verified_tokens.clear()
+
+
+changes.subscribe('terminals', _on_terminals_change)
+changes.subscribe(database.DEFAULT_TABLE, _on_values_change)
+
 
 def _ensure_jwt_secret():
 	try:
-		database.get_value(STORE_KEY_JWT_SECRET)
+		return _jwt_secret.get()
 	except KeyError:
 		jwt_secret = secrets.token_urlsafe(gconf.get('terminal.jwt secret length', default=64))
-		database.set_value(STORE_KEY_JWT_SECRET, jwt_secret)
-	return database.get_value(STORE_KEY_JWT_SECRET)
+		_jwt_secret.set(jwt_secret)
+		return jwt_secret
 
 
 class InvalidPairingCode(Exception):
@@ -1,56 +1,66 @@
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
+import gconf
 import httpx
-import requests
 from fastapi.requests import Request
-from http_message_signatures import HTTPSignatureKeyResolver, algorithms
-from requests_http_signature import HTTPSignatureAuth
+from http_message_signatures import HTTPSignatureKeyResolver
 from tinydb import Query
 
+from shard_core.database import changes
 from shard_core.database.database import peers_table
 from shard_core.model.identity import OutputIdentity
 from shard_core.model.peer import Peer
+from shard_core.model.util import construct_trusted
 from shard_core.service.crypto import PublicKey
+from shard_core.service.http_client import get_http_client
+from shard_core.service.http_signatures import SignedRequest, covered_values, verify_request
 from shard_core.util import signals
+from shard_core.util.cache import GenerationTTLCache
 
 log = logging.getLogger(__name__)
 
+_verification_executor: ThreadPoolExecutor | None = None
+# only changed on the event loop
+_pending_verifications = 0
+# Peers of recently verified requests, cleared when a peer changes
+_verified_signatures: GenerationTTLCache[Peer] = GenerationTTLCache(
+	maxsize=lambda: gconf.get('peers.verification.cache_size', default=1024),
+	ttl=lambda: gconf.get('peers.verification.cache_ttl', default=10))
+
 
 def get_peer_by_id(id: str):
 	with peers_table() as peers:
 		if p := peers.get(Query().id.matches(f'{id}:*')):
-			return Peer(**p)
+			return construct_trusted(Peer, p)
 		else:
 			raise KeyError(id)
 
 
 async def update_all_peer_pubkeys():
-	with peers_table() as peers:  # type: Table
-		peers_without_pubkey = peers.search(Query().public_bytes_b64.exists())
-	await asyncio.gather(*[update_peer_meta(Peer(**peer)) for peer in peers_without_pubkey])
+	async with peers_table() as peers:
+		peers_without_pubkey = await peers.search(Query().public_bytes_b64.exists())
+	await asyncio.gather(*[update_peer_meta(construct_trusted(Peer, peer)) for peer in peers_without_pubkey])
 
 
 async def update_peer_meta(peer: Peer):
 	url = f'https://{peer.short_id}.freeshard.cloud/core/public/meta/whoareyou'
 
-	def do_request():
-		return requests.get(url=url)
-
 	try:
-		response = await asyncio.get_running_loop().run_in_executor(None, do_request)
-	except requests.ConnectionError as e:
+		response = await get_http_client().get(url)
+	except httpx.TransportError as e:
 		log.debug(f'Could not find peer {peer.short_id}: {e}')
-		with peers_table() as peers:
-			peers.update({'is_reachable': False}, Query().id == peer.id)
+		async with peers_table() as peers:
+			await peers.update({'is_reachable': False}, Query().id == peer.id)
 		return
 
 	try:
 		response.raise_for_status()
 	except httpx.HTTPStatusError as e:
 		log.debug(f'Could not update peer meta for {peer.short_id}: {e}')
-		with peers_table() as peers:  # type: Table
-			peers.update({'is_reachable': False}, Query().id == peer.id)
+		async with peers_table() as peers:
+			await peers.update({'is_reachable': False}, Query().id == peer.id)
 		return
 
 	peer_identity = OutputIdentity(**response.json())
@@ -59,8 +69,8 @@ async def update_peer_meta(peer: Peer):
 		raise KeyError(f'Portal {peer.short_id} responded with wrong identity {peer_identity.id}')
 
 	updated_peer = output_identity_to_peer(peer_identity)
-	with peers_table() as peers:  # type: Table
-		peers.update(updated_peer.dict(), Query().id == peer.id)
+	async with peers_table() as peers:
+		await peers.update(updated_peer.dict(), Query().id == peer.id)
 
 
 def output_identity_to_peer(identity: OutputIdentity) -> Peer:
@@ -73,34 +83,77 @@ def output_identity_to_peer(identity: OutputIdentity) -> Peer:
 
 
 async def verify_peer_auth(request: Request) -> Peer:
-	method = request.headers['X-Forwarded-Method']
+	"""
+	Peer that signed the forwarded request. The signature is checked on the verification threads,
+	a signature verified for the same bodyless request within the last seconds is not checked again.
+	Raises PeerVerificationOverloaded instead of queueing more than the configured number of checks.
+	"""
 	proto = request.headers['X-Forwarded-proto']
 	host = request.headers['X-Forwarded-host']
 	uri = request.headers['X-Forwarded-uri']
+	signed_request = SignedRequest(request.headers['X-Forwarded-Method'], f'{proto}://{host}{uri}', request.headers)
+	body = await request.body()
+
+	# the values of everything the signature covers, so a remembered signature is not accepted for a different request
+	cache_key = None if body else covered_values(signed_request)
+	peer, generation = _verified_signatures.get(cache_key)
+	if peer is not None:
+		return peer
+
+	global _pending_verifications
+	if _pending_verifications >= gconf.get('peers.verification.max_pending', default=64):
+		raise PeerVerificationOverloaded
+	_pending_verifications += 1
+	try:
+		peer = await asyncio.get_running_loop().run_in_executor(
+			_get_verification_executor(), _verify_signature, signed_request, body)
+	finally:
+		_pending_verifications -= 1
 
-	prepared_request = requests.Request(
-		method=method,
-		url=f'{proto}://{host}{uri}',
-		headers=request.headers,
-		data=await request.body(),
-		params=request.query_params,
-	).prepare()
-	verify_result = HTTPSignatureAuth.verify(
-		prepared_request,
-		signature_algorithm=algorithms.RSA_PSS_SHA512,
-		key_resolver=_KR()
-	)
-	return get_peer_by_id(verify_result.parameters['keyid'])
+	if cache_key:
+		_verified_signatures.put(cache_key, peer, generation)
+	return peer
+
+
+def _verify_signature(signed_request: SignedRequest, body: bytes) -> Peer:
+	key_resolver = _KR()
+	verify_request(signed_request, body, key_resolver=key_resolver)
+	return key_resolver.peer
+
+
+def _get_verification_executor() -> ThreadPoolExecutor:
+	global _verification_executor
+	if not _verification_executor:
+		_verification_executor = ThreadPoolExecutor(
+			max_workers=gconf.get('peers.verification.workers', default=2),
+			thread_name_prefix='peer_verification',
+		)
+	return _verification_executor
+
+
+def _on_peers_change(_: changes.Change):
+	_verified_signatures.clear()
+
+
+changes.subscribe('peers', _on_peers_change)
 
 
 class _KR(HTTPSignatureKeyResolver):
+	"""
+	Keeps the peer whose key it resolved, so it is not looked up again once the signature is verified.
+	"""
+
+	def __init__(self):
+		self.peer: Peer | None = None
+
 	def resolve_private_key(self, key_id: str):
 		pass
 
 	def resolve_public_key(self, key_id: str):
 		peer = get_peer_by_id(key_id)
 		if peer.public_bytes_b64:
-			return peer.public_bytes_b64.encode()
+			self.peer = peer
+			return peer.pubkey.key
 		else:
 			raise KeyError(f'No public key known for peer id {key_id}')
 
@@ -108,3 +161,7 @@ class _KR(HTTPSignatureKeyResolver):
 @signals.async_on_peer_write.connect
 async def _on_peer_write(peer: Peer):
 	await update_peer_meta(peer)
+
+
+class PeerVerificationOverloaded(Exception):
+	pass
@@ -14,7 +14,7 @@ async def call_portal_controller(path: str, method: str = 'GET', body: bytes = N
 	controller_base_url = gconf.get('portal_controller.base_url')
 	url = f'{controller_base_url}/api/{path}'
 	log.debug(f'call to {method} {url}')
-	return await signed_request(method, url, data=body)
+	return await signed_request(method, url, content=body)
 
 
 async def refresh_profile() -> profile.Profile:
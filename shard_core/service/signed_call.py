@@ -1,31 +1,33 @@
-import asyncio
 import logging
+from functools import lru_cache
 
-import requests
-from http_message_signatures import algorithms
-from requests_http_signature import HTTPSignatureAuth
+import httpx
 
+from shard_core.database.changes import cached_until_change
 from shard_core.model.identity import Identity
-from shard_core.service import identity as identity_service
+from shard_core.service import crypto, identity as identity_service
+from shard_core.service.http_client import get_http_client
+from shard_core.service.http_signatures import SignatureAuth
 
 log = logging.getLogger(__name__)
 
 
-async def signed_request(*args, identity: Identity = None, **kwargs) -> requests.Response:
-	auth = get_signature_auth(identity)
+async def signed_request(method: str, url: str, *, identity: Identity = None, **kwargs) -> httpx.Response:
+	return await get_http_client().request(method, url, auth=get_signature_auth(identity), **kwargs)
 
-	def do_request():
-		return requests.request(*args, auth=auth, **kwargs)
 
-	response = await asyncio.get_running_loop().run_in_executor(None, do_request)
+def get_signature_auth(identity: Identity = None) -> SignatureAuth:
+	if identity is None:
+		return _default_signature_auth()
+	return _signature_auth(identity.short_id, identity.private_key)
 
-	return response
 
+@cached_until_change('identities', maxsize=1)
+def _default_signature_auth() -> SignatureAuth:
+	default_identity = identity_service.get_default_identity()
+	return _signature_auth(default_identity.short_id, default_identity.private_key)
 
-def get_signature_auth(identity: Identity = None):
-	identity = identity or identity_service.get_default_identity()
-	return HTTPSignatureAuth(
-		signature_algorithm=algorithms.RSA_PSS_SHA512,
-		key_id=identity.short_id,
-		key=identity.private_key.encode(),
-	)
+
+@lru_cache(maxsize=16)
+def _signature_auth(key_id: str, private_key_pem: str) -> SignatureAuth:
+	return SignatureAuth(key_id=key_id, key=crypto.load_private_key(private_key_pem).key)
@@ -7,8 +7,9 @@ from typing import Dict, List, Tuple
 from pydantic import BaseModel
 from starlette.websockets import WebSocket
 
+from shard_core.database import changes
 from shard_core.database.database import terminals_table, installed_apps_table
-from shard_core.model.app_meta import InstalledApp
+from shard_core.model.app_meta import InstalledApp, InstalledAppWithMeta
 from shard_core.model.terminal import Terminal
 from shard_core.service.app_tools import enrich_installed_app_with_meta
 from shard_core.service.disk import DiskUsage
@@ -31,19 +32,26 @@ class WSWorker(BackgroundTask):
 		self.is_started = False
 		self._message_task: Task | None = None
 		self._heartbeat_task: Task | None = None
+		self._loop: asyncio.AbstractEventLoop | None = None
+		# enriched installed apps by name, kept up to date from the database changes
+		self._enriched_apps: Dict[str, InstalledAppWithMeta] | None = None
 
 	def start(self):
 		if not self.is_started:
 			self.is_started = True
+			self._loop = asyncio.get_running_loop()
 			self._message_task = asyncio.create_task(
 				self._send_messages(), name='WSWorker messages')
 			self._heartbeat_task = asyncio.create_task(
 				self._send_heartbeats(), name='WSWorker heartbeat')
+			changes.subscribe('installed_apps', self._on_database_change)
 			log.debug('Started WSWorker task')
 
 	def stop(self):
 		if self.is_started:
 			self.is_started = False
+			self._enriched_apps = None
+			changes.unsubscribe('installed_apps', self._on_database_change)
 			self._message_task.cancel()
 			self._heartbeat_task.cancel()
 			log.debug('Stopped WSWorker task')
@@ -87,6 +95,37 @@ class WSWorker(BackgroundTask):
 		except asyncio.QueueFull:
 			log.error('Websocket message queue is full, dropping message')
 
+	def get_enriched_apps(self) -> List[InstalledAppWithMeta]:
+		if self._enriched_apps is not None:
+			return list(self._enriched_apps.values())
+		with installed_apps_table() as installed_apps:
+			all_apps = installed_apps.all()
+		enriched_apps = {app['name']: enrich_installed_app_with_meta(InstalledApp.parse_obj(app)) for app in all_apps}
+		if self.is_started:  # only then changes keep it up to date
+			self._enriched_apps = enriched_apps
+		return list(enriched_apps.values())
+
+	def _on_database_change(self, change: changes.Change):
+		# called by the writing thread with the table lock held, changes from other threads are applied on the loop
+		try:
+			is_loop_thread = asyncio.get_running_loop() is self._loop
+		except RuntimeError:
+			is_loop_thread = False
+		if is_loop_thread:
+			self._apply_database_change(change)
+		else:
+			self._loop.call_soon_threadsafe(self._apply_database_change, change)
+
+	def _apply_database_change(self, change: changes.Change):
+		if change.doc_id is None or self._enriched_apps is None:
+			self._enriched_apps = None
+			return
+		if change.old:
+			self._enriched_apps.pop(change.old['name'], None)
+		if change.new:
+			app = enrich_installed_app_with_meta(InstalledApp.parse_obj(change.new))
+			self._enriched_apps[change.new['name']] = app
+
 
 ws_worker = WSWorker()
 
@@ -118,10 +157,7 @@ def send_terminal_add(terminal: Terminal):
 
 @signals.on_apps_update.connect
 def send_apps_update(_):
-	with installed_apps_table() as installed_apps:
-		all_apps = installed_apps.all()
-	enriched_apps = [enrich_installed_app_with_meta(InstalledApp.parse_obj(app)) for app in all_apps]
-	ws_worker.broadcast_message('apps_update', enriched_apps)
+	ws_worker.broadcast_message('apps_update', ws_worker.get_enriched_apps())
 
 
 @signals.on_app_install_error.connect
@@ -0,0 +1,45 @@
+import threading
+from typing import Callable, Generic, Hashable, Tuple, TypeVar
+
+from cachetools import TTLCache
+
+V = TypeVar('V')
+
+
+class GenerationTTLCache(Generic[V]):
+	"""
+	Thread-safe TTL cache for values that are computed outside of its lock, e.g. on a thread pool.
+	`get` also returns the current generation, which `put` needs: clearing the cache starts a new generation,
+	so values computed from data that changed in the meantime are not added afterwards.
+	The underlying cache is created on first use, `maxsize` and `ttl` are called then, e.g. to read the config.
+	"""
+
+	def __init__(self, maxsize: Callable[[], int], ttl: Callable[[], float]):
+		self._maxsize = maxsize
+		self._ttl = ttl
+		self._cache: TTLCache | None = None
+		self._generation = 0
+		self._lock = threading.Lock()
+
+	def get(self, key: Hashable) -> Tuple[V | None, int]:
+		with self._lock:
+			return self._get_cache().get(key), self._generation
+
+	def put(self, key: Hashable, value: V, generation: int):
+		with self._lock:
+			if generation == self._generation:
+				self._get_cache()[key] = value
+
+	def clear(self):
+		"""
+		Drops all values, including those still being computed.
+		"""
+		with self._lock:
+			self._generation += 1
+			if self._cache is not None:
+				self._cache.clear()
+
+	def _get_cache(self) -> TTLCache:
+		if self._cache is None:
+			self._cache = TTLCache(maxsize=self._maxsize(), ttl=self._ttl())
+		return self._cache
@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 
+from shard_core.web.util import RawEndpoint
+
 from . import auth, app_error, call_backend, call_peer
 
 router = APIRouter(
@@ -11,3 +13,8 @@ router.include_router(app_error.router)
 router.include_router(auth.router)
 router.include_router(call_backend.router)
 router.include_router(call_peer.router)
+
+# Traefik's forwardAuth calls these before every request to an app or the UI, so they skip FastAPI's request handling.
+# Plain routes do not get the prefix of the router.
+router.add_route(f'{router.prefix}/authenticate_terminal', RawEndpoint(auth.authenticate_terminal), methods=['GET'])
+router.add_route(f'{router.prefix}/auth', RawEndpoint(auth.authenticate_and_authorize), methods=['GET'])
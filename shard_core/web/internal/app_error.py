@@ -11,8 +11,8 @@ from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
 
 from shard_core.service import disk
-from shard_core.service.app_tools import get_app_metadata, MetadataNotFound, get_installed_apps_path, \
-	size_is_compatible
+from shard_core.service.app_registry import app_registry
+from shard_core.service.app_tools import MetadataNotFound, get_installed_apps_path, size_is_compatible
 
 log = logging.getLogger(__name__)
 
@@ -39,7 +39,7 @@ def get_splash_behaviour(request: Request):
 	# todo: add special splash screen for app that is not size compatible
 	status_code = int(request.path_params['status'])
 	app_name = get_app_name(request)
-	app_meta = get_app_metadata(app_name)
+	app_meta = app_registry.get_app_meta(app_name)
 	container_status = get_container_status(app_name)
 
 	behaviour = SplashBehaviour(
@@ -100,7 +100,7 @@ def get_template_splash():
 @lru_cache(maxsize=16)
 def data_url(app_name):
 	try:
-		app_meta = get_app_metadata(app_name)
+		app_meta = app_registry.get_app_meta(app_name)
 	except MetadataNotFound:
 		return PLACEHOLDER_DATA
 	icon_file = get_installed_apps_path() / app_name / app_meta.icon
@@ -1,19 +1,21 @@
 import logging
-from typing import Optional
+from functools import lru_cache
+from typing import Dict
 
-import gconf
-from cachetools import cached, TTLCache
-from fastapi import HTTPException, APIRouter, Cookie, Response, status, Header, Request
+from fastapi import HTTPException, APIRouter, status, Header, Request
 from http_message_signatures import InvalidSignature
 from jinja2 import Template
 from tinydb import Query
 
-from shard_core.database.database import installed_apps_table, identities_table
+from shard_core.database.changes import cached_until_change
+from shard_core.database.database import identities_table, run_in_executor
 from shard_core.model.app_meta import InstalledApp, Access, Path
 from shard_core.model.auth import AuthState
 from shard_core.model.identity import Identity, SafeIdentity
+from shard_core.model.terminal import Terminal
+from shard_core.model.util import construct_trusted
 from shard_core.service import pairing, peer as peer_service
-from shard_core.service.app_tools import get_app_metadata
+from shard_core.service.app_registry import app_registry
 from shard_core.service.management import validate_shared_secret, SharedSecretInvalid
 from shard_core.util.signals import on_terminal_auth, on_request_to_app, on_peer_auth
 
@@ -22,20 +24,20 @@ log = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.get('/authenticate_terminal', status_code=status.HTTP_200_OK)
-def authenticate_terminal(response: Response, authorization: str = Cookie(None)):
+async def authenticate_terminal(request: Request) -> Dict[str, str]:
+	authorization = request.cookies.get('authorization')
 	if not authorization:
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
 	try:
-		terminal = pairing.verify_terminal_jwt(authorization)
+		terminal = await _authenticate_terminal(authorization)
 	except pairing.InvalidJwt:
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED)
-	else:
-		response.headers['X-Ptl-Client-Type'] = 'terminal'
-		response.headers['X-Ptl-Client-Id'] = terminal.id
-		response.headers['X-Ptl-Client-Name'] = terminal.name
-		on_terminal_auth.send(terminal)
+	return {
+		'X-Ptl-Client-Type': 'terminal',
+		'X-Ptl-Client-Id': terminal.id,
+		'X-Ptl-Client-Name': terminal.name,
+	}
 
 
 @router.get('/authenticate_management', status_code=status.HTTP_200_OK)
@@ -49,19 +51,19 @@ async def authenticate_management(authorization: str = Header(None)):
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
 
-@router.get('/auth', status_code=status.HTTP_200_OK)
-async def authenticate_and_authorize(
-		request: Request,
-		response: Response,
-		authorization: str = Cookie(None),
-		x_forwarded_host: str = Header(None),
-		x_forwarded_uri: str = Header(None),
-):
+async def authenticate_and_authorize(request: Request) -> Dict[str, str]:
+	x_forwarded_host = request.headers.get('x-forwarded-host', '')
+	x_forwarded_uri = request.headers.get('x-forwarded-uri', '')
 	app = _match_app(x_forwarded_host)
 	path_object = _match_path(x_forwarded_uri, app)
-	auth_state = await _get_auth_state(request, authorization)
+	try:
+		auth_state = await _get_auth_state(request, request.cookies.get('authorization'))
+	except peer_service.PeerVerificationOverloaded:
+		if path_object.access == Access.PEER:
+			log.debug(f'too many peer verifications pending for {x_forwarded_host}{x_forwarded_uri}')
+			raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': '1'})
+		auth_state = AuthState(x_ptl_client_type=AuthState.ClientType.ANONYMOUS)
 	log.debug(f'Auth state is {auth_state}')
-	header_values = _get_identity()
 
 	if path_object.access == Access.PRIVATE and auth_state.type != AuthState.ClientType.TERMINAL:
 		log.debug(f'denied terminal auth for {x_forwarded_host}{x_forwarded_uri}')
@@ -71,60 +73,69 @@ async def authenticate_and_authorize(
 		log.debug(f'denied peer auth for {x_forwarded_host}{x_forwarded_uri}')
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
+	response_headers = {}
 	if path_object.headers:
+		auth_values = auth_state.header_values
+		portal_values = _get_identity()
 		for header_key, header_template in path_object.headers.items():
-			response.headers[header_key] = Template(header_template) \
-				.render(auth=auth_state.header_values, portal=header_values)
-	log.debug(f'granted auth for {x_forwarded_host}{x_forwarded_uri} with headers {response.headers.items()}')
+			response_headers[header_key] = _header_template(header_template) \
+				.render(auth=auth_values, portal=portal_values)
+	log.debug(f'granted auth for {x_forwarded_host}{x_forwarded_uri} with headers {response_headers}')
 
 	on_request_to_app.send(app)
+	return response_headers
 
 
 def _match_app(x_forwarded_host) -> InstalledApp:
 	app_name = x_forwarded_host.split('.')[0]
-	app = _find_app(app_name)
+	app = app_registry.get_app(app_name)
 	if not app:
 		log.debug(f'denied auth for {x_forwarded_host} -> unknown app')
 		raise HTTPException(status.HTTP_404_NOT_FOUND)
 	return app
 
 
-@cached(cache=TTLCache(maxsize=8, ttl=gconf.get('tests.cache_ttl', default=3)))
+@cached_until_change('identities', maxsize=8)
 def _get_identity():
 	with identities_table() as identities:
-		default_identity = Identity(**identities.get(Query().is_default == True))  # noqa: E712
+		default_identity = construct_trusted(Identity, identities.get(Query().is_default == True))  # noqa: E712
 	return SafeIdentity.from_identity(default_identity)
 
 
-@cached(cache=TTLCache(maxsize=32, ttl=gconf.get('tests.cache_ttl', default=3)))
-def _find_app(app_name) -> Optional[InstalledApp]:
-	with installed_apps_table() as installed_apps:  # type: Table
-		if result := installed_apps.get(Query().name == app_name):
-			return InstalledApp(**result)
-		else:
-			return None
+@lru_cache(maxsize=256)
+def _header_template(source: str) -> Template:
+	return Template(source)
 
 
 def _match_path(uri, app: InstalledApp) -> Path:
-	app_meta = get_app_metadata(app.name)
-	for path, props in sorted(app_meta.paths.items(), key=lambda x: len(x[0]), reverse=True):  # type: (str, Path)
-		if uri.startswith(path):
-			return props
+	return app_registry.match_path(app.name, uri)
+
+
+async def _authenticate_terminal(authorization) -> Terminal:
+	# recently verified tokens are answered on the event loop, only the others are verified on the executor
+	if (terminal := pairing.get_verified_terminal(authorization)) is None:
+		terminal = await run_in_executor(pairing.verify_terminal_jwt, authorization)
+	on_terminal_auth.send(terminal)
+	return terminal
 
 
 async def _get_auth_state(request, authorization) -> AuthState:
 	try:
-		terminal = pairing.verify_terminal_jwt(authorization)
+		terminal = await _authenticate_terminal(authorization)
 	except pairing.InvalidJwt as e:
 		log.debug(f'invalid terminal JWT: {e}')
 	else:
-		on_terminal_auth.send(terminal)
 		return AuthState(
 			x_ptl_client_type=AuthState.ClientType.TERMINAL,
 			x_ptl_client_id=terminal.id,
 			x_ptl_client_name=terminal.name,
 		)
 
+	if 'signature' not in request.headers:
+		return AuthState(
+			x_ptl_client_type=AuthState.ClientType.ANONYMOUS,
+		)
+
 	try:
 		peer = await peer_service.verify_peer_auth(request)
 	except InvalidSignature as e:
@@ -1,6 +1,7 @@
 import logging
 from fastapi import APIRouter, Request
 
+from shard_core.service.http_client import get_proxy_timeout
 from shard_core.service.signed_call import signed_request
 from shard_core.web.util import ALL_HTTP_METHODS
 from starlette.responses import StreamingResponse
@@ -18,11 +19,11 @@ async def call_backend(rest: str, request: Request):
 	url = f'{base_url}/{rest}'
 
 	body = await request.body()
-	response = await signed_request(request.method, url, data=body)
+	response = await signed_request(request.method, url, content=body, timeout=get_proxy_timeout())
 
 	log.debug(f'called backend: {url} -> {response.status_code}')
 
 	return StreamingResponse(
 		status_code=response.status_code,
 		headers=response.headers,
-		content=response.iter_content())
+		content=response.iter_bytes())
@@ -7,6 +7,7 @@ from docker.models.containers import Container
 from fastapi import APIRouter, Request
 from starlette.responses import StreamingResponse
 
+from shard_core.service.http_client import get_proxy_timeout
 from shard_core.service.signed_call import signed_request
 from shard_core.web.util import ALL_HTTP_METHODS
 
@@ -23,8 +24,8 @@ async def call_peer(id_: str, rest: str, request: Request):
 	log.debug(f'call peer: {url}')
 
 	body = await request.body()
-	response = await signed_request(request.method, url, data=body)
-	return StreamingResponse(status_code=response.status_code, content=response.iter_content())
+	response = await signed_request(request.method, url, content=body, timeout=get_proxy_timeout())
+	return StreamingResponse(status_code=response.status_code, content=response.iter_bytes())
 
 
 @lru_cache()
@@ -3,10 +3,8 @@ import logging
 from fastapi import Header, HTTPException, APIRouter, status
 from tinydb import Query
 
-from shard_core.database import database
 from shard_core.database.database import terminals_table
-from shard_core.model.backup import BackupPassphraseResponse, BackupInfoResponse, BackupPassphraseLastAccessInfoDB, \
-	BackupPassphraseLastAccessInfoResponse
+from shard_core.model.backup import BackupPassphraseResponse, BackupInfoResponse, BackupPassphraseLastAccessInfoResponse
 from shard_core.model.terminal import Terminal
 from shard_core.service import backup
 
@@ -20,9 +18,7 @@ router = APIRouter(
 @router.get('/info', response_model=BackupInfoResponse)
 async def get_backup_info():
 	try:
-		last_access_info_db = BackupPassphraseLastAccessInfoDB.parse_obj(
-			database.get_value(backup.STORE_KEY_BACKUP_PASSPHRASE_LAST_ACCESS)
-		)
+		last_access_info_db = backup.passphrase_last_access.get()
 	except KeyError:
 		last_access_info_response = None
 	else:
@@ -2,6 +2,7 @@ import logging
 
 from fastapi import APIRouter, status
 
+from shard_core.database import database
 from shard_core.service import disk
 from shard_core.service.app_installation.worker import installation_worker
 
@@ -31,3 +32,8 @@ async def tasks():
 			],
 		}
 	}
+
+
+@router.get('/db', status_code=status.HTTP_200_OK)
+async def db_stats():
+	return database.stats()
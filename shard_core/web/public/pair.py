@@ -3,7 +3,7 @@ import logging
 from fastapi import APIRouter, HTTPException, status, Response
 from tinydb import Query
 
-from shard_core.database.database import terminals_table, identities_table
+from shard_core.database.database import transaction
 from shard_core.model.identity import Identity
 from shard_core.model.terminal import Terminal, InputTerminal
 from shard_core.service import pairing
@@ -25,11 +25,9 @@ async def add_terminal(code: str, terminal: InputTerminal, response: Response):
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED) from e
 
 	new_terminal = Terminal.create(terminal.name)
-	with terminals_table() as terminals:  # type: Table
+	with transaction('terminals', 'identities') as (terminals, identities):
 		terminals.insert(new_terminal.dict())
-		is_first_terminal = terminals.count(Query().noop()) == 1
-
-	with identities_table() as identities:  # type: Table
+		is_first_terminal = len(terminals) == 1
 		default_identity = Identity(**identities.get(Query().is_default == True))  # noqa: E712
 
 	jwt = pairing.create_terminal_jwt(new_terminal.id)
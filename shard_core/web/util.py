@@ -1 +1,32 @@
+import json
+from typing import Awaitable, Callable, Dict
+
+from fastapi import HTTPException, Request
+from starlette.types import Scope, Receive, Send
+
 ALL_HTTP_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'CONNECT', 'OPTIONS', 'TRACE', 'PATCH']
+
+
+class RawEndpoint:
+	"""
+	Plain ASGI endpoint for routes that are called for every request to an app,
+	bypassing FastAPI's dependency injection and response handling.
+	The handler returns the headers of an empty 200 response.
+	It raises HTTPExceptions, which are answered like FastAPI does, with the detail as JSON.
+	"""
+
+	def __init__(self, handler: Callable[[Request], Awaitable[Dict[str, str]]]):
+		self.handler = handler
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send):
+		try:
+			headers = await self.handler(Request(scope, receive))
+			status_code, body = 200, b'null'
+		except HTTPException as e:
+			headers = e.headers or {}
+			status_code, body = e.status_code, json.dumps({'detail': e.detail}, separators=(',', ':')).encode()
+
+		raw_headers = [(b'content-length', str(len(body)).encode()), (b'content-type', b'application/json')]
+		raw_headers.extend((k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items())
+		await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+		await send({'type': 'http.response.body', 'body': body})
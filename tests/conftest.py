@@ -3,7 +3,6 @@ import importlib
 import json
 import logging
 import os
-import re
 import shutil
 from contextlib import contextmanager
 from dataclasses import dataclass
@@ -13,14 +12,13 @@ from pathlib import Path
 from typing import List
 
 import gconf
+import httpx
 import pytest
 import pytest_asyncio
-import responses
+import respx
 import yappi
 from asgi_lifespan import LifespanManager
 from httpx import AsyncClient, ASGITransport
-from requests import PreparedRequest
-from responses import RequestsMock
 
 import shard_core
 from shard_core.model.app_meta import VMSize
@@ -114,8 +112,24 @@ mock_meta = PortalMetaExt(
 )
 
 
+_active_requests_mock: respx.MockRouter | None = None
+
+
 @contextmanager
 def requests_mock_context(*, meta: PortalMetaExt = None, profile: Profile = None):
+	global _active_requests_mock
+	if _active_requests_mock is not None:
+		# respx asks its routers in the order they were started, so a nested router would never be asked.
+		# Instead, the portal meta route of the active router is changed for the nested block.
+		portal_meta_route = _active_requests_mock.routes['portal_meta']
+		outer_response = portal_meta_route.return_value
+		portal_meta_route.respond(text=(meta or mock_meta).json())
+		try:
+			yield _active_requests_mock
+		finally:
+			portal_meta_route.return_value = outer_response
+		return
+
 	management_api = 'https://management-mock'
 	controller_base_url = 'https://portal-controller-mock'
 
@@ -125,35 +139,35 @@ def requests_mock_context(*, meta: PortalMetaExt = None, profile: Profile = None
 	}
 	management_shared_secret = 'constantSharedSecret'
 	with (
-		responses.RequestsMock(assert_all_requests_are_fired=False) as rsps,
+		respx.mock(assert_all_called=False) as rsps,
 		gconf.override_conf(config_override)
 	):
-		rsps.add_callback(
-			responses.PUT,
-			f'{management_api}/resize',
-			callback=requests_mock_resize,
-		)
+		rsps.put(
+			f'{management_api}/resize', name='resize',
+		).mock(side_effect=requests_mock_resize)
 		rsps.post(
-			f'{management_api}/app_usage',
+			f'{management_api}/app_usage', name='app_usage',
 		)
 		rsps.get(
-			f'{management_api}/sharedSecret',
-			body=json.dumps({'shared_secret': management_shared_secret}),
-		)
+			f'{management_api}/sharedSecret', name='shared_secret',
+		).respond(json={'shared_secret': management_shared_secret})
 		rsps.get(
-			f'{controller_base_url}/api/portals/self',
-			body=(meta or mock_meta).json(),
-		)
-		rsps.add_passthru('')
-		yield rsps
-
-
-def requests_mock_resize(request: PreparedRequest):
-	data = json.loads(request.body)
+			f'{controller_base_url}/api/portals/self', name='portal_meta',
+		).respond(text=(meta or mock_meta).json())
+		rsps.route().pass_through()
+		_active_requests_mock = rsps
+		try:
+			yield rsps
+		finally:
+			_active_requests_mock = None
+
+
+def requests_mock_resize(request: httpx.Request):
+	data = json.loads(request.content)
 	if data['size'] in ['l', 'xl']:
-		return 409, {}, ''
+		return httpx.Response(409)
 	else:
-		return 204, {}, ''
+		return httpx.Response(204)
 
 
 @pytest.fixture
@@ -172,13 +186,13 @@ def peer_mock_requests(mocker):
 	base_url = f'https://{peer_identity.domain}/core'
 	app_url = f'https://mock_app.{peer_identity.domain}'
 
-	with (responses.RequestsMock(assert_all_requests_are_fired=False) as rsps):
-		rsps.get(base_url + '/public/meta/whoareyou',
-				 json=OutputIdentity(**peer_identity.dict()).dict())
-		rsps.get(re.compile(app_url + '/.*'))
-		rsps.post(re.compile(app_url + '/.*'))
+	with respx.mock(assert_all_called=False) as rsps:
+		rsps.get(base_url + '/public/meta/whoareyou').respond(
+			json=OutputIdentity(**peer_identity.dict()).dict())
+		rsps.get(url__regex=app_url + '/.*', name='app_get')
+		rsps.post(url__regex=app_url + '/.*', name='app_post')
 
-		rsps.add_passthru('')
+		rsps.route().pass_through()
 
 		yield PeerMockRequests(
 			peer_identity,
@@ -223,7 +237,7 @@ def profile_with_yappi():
 @dataclass
 class PeerMockRequests:
 	identity: Identity
-	mock: RequestsMock
+	mock: respx.MockRouter
 
 
 class MemoryLogHandler(logging.Handler):
@@ -2,10 +2,14 @@ import time
 from datetime import datetime
 from typing import Optional
 
+import pytest
 from tinydb import Query
 
-from shard_core.database.database import installed_apps_table
+from shard_core.database import database
+from shard_core.database.database import installed_apps_table, terminals_table, transaction
 from shard_core.model.app_meta import InstalledApp
+from shard_core.model.terminal import Terminal
+from shard_core.service import last_access
 from tests.conftest import requires_test_env
 
 
@@ -19,35 +23,48 @@ async def test_app_last_access_is_set(api_client):
 	})
 	response.raise_for_status()
 
+	last_access.flush()
 	assert _get_last_access_time_delta('filebrowser') < 3
 
 
 @requires_test_env('full')
-async def test_app_last_access_is_debounced(api_client):
-	await api_client.get('internal/auth', headers={
-		'X-Forwarded-Host': 'filebrowser.myshard.org',
-		'X-Forwarded-Uri': '/share/foo'
-	})
-
-	assert _get_last_access_time_delta('filebrowser') < 3
-	last_access = _get_last_access_time('filebrowser')
-
+def test_access_times_are_batched():
+	database.init_database()
+	terminal = Terminal.create('T1')
+	with transaction('terminals', 'installed_apps') as (terminals, installed_apps):
+		terminals.insert(terminal.dict())
+		installed_apps.insert(InstalledApp(name='app_1').dict())
+		installed_apps.insert(InstalledApp(name='app_2').dict())
+
+	last_access.record_terminal_connection(terminal)
+	last_access.record_app_access(InstalledApp(name='app_1'))
 	time.sleep(0.1)
-	await api_client.get('internal/auth', headers={
-		'X-Forwarded-Host': 'filebrowser.myshard.org',
-		'X-Forwarded-Uri': '/share/foo'
-	})
+	last_access.record_app_access(InstalledApp(name='app_1'))
+	last_access.record_app_access(InstalledApp(name='removed_app'))
+	assert _get_last_access_time('app_1') is None
 
-	assert _get_last_access_time('filebrowser') == last_access
+	last_access.flush()
+	assert _get_last_access_time_delta('app_1') < 0.1
+	assert _get_last_access_time('app_2') is None
+	with terminals_table() as terminals:
+		assert Terminal(**terminals.get(Query().id == terminal.id)).last_connection > terminal.last_connection
 
-	time.sleep(3)
-	await api_client.get('internal/auth', headers={
-		'X-Forwarded-Host': 'filebrowser.myshard.org',
-		'X-Forwarded-Uri': '/share/foo'
-	})
 
-	assert _get_last_access_time_delta('filebrowser') < 3
-	assert _get_last_access_time('filebrowser') != last_access
+@requires_test_env('full')
+def test_access_times_are_kept_if_flush_fails(mocker):
+	database.init_database()
+	with installed_apps_table() as installed_apps:
+		installed_apps.insert(InstalledApp(name='app_1').dict())
+
+	last_access.record_app_access(InstalledApp(name='app_1'))
+	mocker.patch('shard_core.service.last_access.transaction', side_effect=OSError('disk full'))
+	with pytest.raises(OSError):
+		last_access.flush()
+	assert _get_last_access_time('app_1') is None
+
+	mocker.stopall()
+	last_access.flush()
+	assert _get_last_access_time_delta('app_1') < 1
 
 
 def _get_last_access_time_delta(app_name: str) -> Optional[float]:
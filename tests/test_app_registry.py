@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from shard_core.database import database
+from shard_core.database.database import installed_apps_table
+from shard_core.model.app_meta import Access, InstalledApp, Status
+from shard_core.service.app_registry import app_registry
+from shard_core.service.app_tools import get_installed_apps_path, get_app_metadata, invalidate_app_metadata, \
+	MetadataNotFound
+from tests.conftest import requires_test_env
+from tests.util import mock_app_store_path
+
+
+def _install_mock_app_files():
+	app_dir = get_installed_apps_path() / 'mock_app'
+	app_dir.mkdir(parents=True, exist_ok=True)
+	shutil.copy(mock_app_store_path() / 'mock_app' / 'app_meta.json', app_dir)
+	return app_dir
+
+
+@requires_test_env('full')
+def test_apps_follow_database():
+	database.init_database()
+	assert app_registry.get_app('mock_app') is None
+
+	with installed_apps_table() as installed_apps:
+		installed_apps.insert(InstalledApp(name='mock_app', status=Status.STOPPED).dict())
+	assert app_registry.get_app('mock_app').status == Status.STOPPED
+
+	with installed_apps_table() as installed_apps:
+		installed_apps.update({'status': Status.RUNNING}, doc_ids=[1])
+	assert app_registry.get_app('mock_app').status == Status.RUNNING
+	assert [a.name for a in app_registry.get_apps()] == ['mock_app']
+
+	with installed_apps_table() as installed_apps:
+		installed_apps.truncate()
+	assert app_registry.get_apps() == []
+
+
+@requires_test_env('full')
+def test_match_path():
+	database.init_database()
+	app_dir = _install_mock_app_files()
+
+	assert app_registry.match_path('mock_app', '/').access == Access.PRIVATE
+	assert app_registry.match_path('mock_app', '/pub').access == Access.PUBLIC
+	assert app_registry.match_path('mock_app', '/public/foo').access == Access.PUBLIC
+	assert app_registry.match_path('mock_app', '/peer/foo').access == Access.PEER
+	assert app_registry.match_path('mock_app', '/pe').access == Access.PRIVATE
+
+	# routes are compiled again when the metadata file is edited
+	app_meta = json.loads((app_dir / 'app_meta.json').read_text())
+	del app_meta['paths']['']
+	(app_dir / 'app_meta.json').write_text(json.dumps(app_meta))
+	assert app_registry.match_path('mock_app', '/') is None
+	assert app_registry.get_app_meta('mock_app').paths.keys() == {'/pub', '/peer'}
+	assert app_registry.match_path('mock_app', '/pub').access == Access.PUBLIC
+
+
+@requires_test_env('full')
+def test_app_metadata_is_parsed_once():
+	app_dir = _install_mock_app_files()
+	app_meta_file = app_dir / 'app_meta.json'
+	app_meta = get_app_metadata('mock_app')
+	assert get_app_metadata('mock_app') is app_meta
+
+	# modifying the file is noticed by its mtime and size
+	app_meta_dict = json.loads(app_meta_file.read_text())
+	del app_meta_dict['paths']['']
+	app_meta_file.write_text(json.dumps(app_meta_dict))
+	changed_app_meta = get_app_metadata('mock_app')
+	assert changed_app_meta is not app_meta
+	assert changed_app_meta.paths.keys() == {'/pub', '/peer'}
+
+	# a replaced file with the same mtime and size needs an explicit invalidation
+	stat = app_meta_file.stat()
+	app_meta_file.write_text(json.dumps(app_meta_dict).replace('/pub', '/bup'))
+	os.utime(app_meta_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+	assert get_app_metadata('mock_app') is changed_app_meta
+	invalidate_app_metadata('mock_app')
+	assert get_app_metadata('mock_app').paths.keys() == {'/bup', '/peer'}
+
+	shutil.rmtree(app_dir)
+	with pytest.raises(MetadataNotFound):
+		get_app_metadata('mock_app')
@@ -1,15 +1,17 @@
 import asyncio
 from datetime import date, timedelta, datetime, time
 
-import responses
+import respx
 
-from shard_core.database.database import app_usage_track_table
-from shard_core.model.app_usage import AppUsageTrack, AppUsageReport
+from shard_core.database import database
+from shard_core.database.database import app_usage_track_table, app_usage_monthly_table
+from shard_core.model.app_usage import AppUsageTrack, AppUsageReport, AppUsageMonthly
+from shard_core.service.app_usage_reporting import compact_app_usage_tracks
 from tests.conftest import requires_test_env
 
 
 @requires_test_env('full')
-async def test_app_reporting(api_client, requests_mock: responses.RequestsMock):
+async def test_app_reporting(api_client, requests_mock: respx.MockRouter):
 	first_day_of_current_month = date.today().replace(day=1)
 	first_day_of_last_month = (first_day_of_current_month - timedelta(days=1)).replace(day=1)
 	track_timestamp = datetime.combine(first_day_of_last_month, time(hour=1))
@@ -40,7 +42,7 @@ async def test_app_reporting(api_client, requests_mock: responses.RequestsMock):
 
 	await asyncio.sleep(3.5)  # to trigger reporting
 	assert len(requests_mock.calls) >= 1
-	report = AppUsageReport.parse_raw(requests_mock.calls[0].request.body)
+	report = AppUsageReport.parse_raw(requests_mock.calls[0].request.content)
 
 	assert report.year == track_timestamp.year
 	assert report.month == track_timestamp.month
@@ -48,3 +50,34 @@ async def test_app_reporting(api_client, requests_mock: responses.RequestsMock):
 	assert report.usage['bar'] == 1
 	assert 'early' not in report.usage
 	assert 'late' not in report.usage
+
+
+@requires_test_env('full')
+def test_compact_app_usage_tracks():
+	database.init_database()
+	first_day_of_last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+	last_month = datetime.combine(first_day_of_last_month, time(hour=2))
+	month_before = last_month - timedelta(days=1)
+	expired = last_month - timedelta(days=31 * 30)
+
+	with app_usage_track_table() as tracks:
+		tracks.insert(AppUsageTrack(timestamp=last_month, installed_apps=['foo']).dict())
+		tracks.insert(AppUsageTrack(timestamp=month_before, installed_apps=['foo', 'bar']).dict())
+		tracks.insert(AppUsageTrack(timestamp=month_before - timedelta(days=1), installed_apps=['foo']).dict())
+		tracks.insert(AppUsageTrack(timestamp=expired, installed_apps=['foo']).dict())
+
+	compact_app_usage_tracks()
+
+	with app_usage_track_table() as tracks:
+		assert [AppUsageTrack.parse_obj(t).timestamp for t in tracks.all()] == [last_month]
+	with app_usage_monthly_table() as monthly:
+		aggregates = [AppUsageMonthly.parse_obj(a) for a in monthly.all()]
+	assert aggregates == [AppUsageMonthly(
+		year=month_before.year, month=month_before.month, tracks=2, usage={'foo': 2, 'bar': 1})]
+
+	with app_usage_track_table() as tracks:
+		tracks.insert(AppUsageTrack(timestamp=month_before, installed_apps=['baz']).dict())
+	compact_app_usage_tracks()
+
+	with app_usage_monthly_table() as monthly:
+		assert AppUsageMonthly.parse_obj(monthly.get(doc_id=1)).usage == {'foo': 2, 'bar': 1, 'baz': 1}
@@ -0,0 +1,65 @@
+import datetime
+
+from shard_core.database import database
+from shard_core.database.database import backups_table
+from shard_core.model.backup import BackupReport, BackupStats
+from shard_core.service import backup
+from tests.conftest import requires_test_env
+
+config_override = {'services': {'backup': {'retention': {'full_reports': 2, 'summaries': 2}}}}
+
+
+def _report(day: int) -> BackupReport:
+	time = datetime.datetime(2024, 1, day, tzinfo=datetime.timezone.utc)
+	return BackupReport(
+		directories=[BackupStats(directory='core', startTime=time, endTime=time, bytes=day, checks=10)],
+		startTime=time,
+		endTime=time,
+	)
+
+
+@requires_test_env('full')
+def test_latest_backup_report():
+	database.init_database()
+	assert backup.get_latest_backup_report() is None
+
+	with backups_table() as table:
+		table.insert(_report(2).dict())
+		table.insert(_report(3).dict())
+		table.insert(_report(1).dict())
+	assert backup.get_latest_backup_report() == _report(3)
+	assert database.get_value(backup.STORE_KEY_LATEST_BACKUP_REPORT) == 2
+
+
+@requires_test_env('full')
+def test_latest_backup_report_was_removed():
+	database.init_database()
+	with backups_table() as table:
+		table.insert(_report(1).dict())
+		latest_id = table.insert(_report(2).dict())
+	assert backup.get_latest_backup_report() == _report(2)
+
+	with backups_table() as table:
+		table.remove(doc_ids=[latest_id])
+	assert backup.get_latest_backup_report() == _report(1)
+	assert database.get_value(backup.STORE_KEY_LATEST_BACKUP_REPORT) == 1
+
+
+@requires_test_env('full')
+def test_compact_backup_reports():
+	database.init_database()
+	with backups_table() as table:
+		for day in range(1, 6):
+			table.insert(_report(day).dict())
+
+	backup.compact_backup_reports()
+
+	with backups_table() as table:
+		reports = {r['endTime'].day: r for r in table.all()}
+	assert sorted(reports) == [2, 3, 4, 5]
+	assert BackupReport.parse_obj(reports[5]) == _report(5)
+	assert BackupReport.parse_obj(reports[4]) == _report(4)
+	assert reports[3]['summarized']
+	assert reports[3]['directories'][0]['bytes'] == 3
+	assert 'checks' not in reports[3]['directories'][0]
+	assert backup.get_latest_backup_report() == _report(5)
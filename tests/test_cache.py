@@ -0,0 +1,25 @@
+from shard_core.util.cache import GenerationTTLCache
+
+
+def test_generation_ttl_cache():
+	cache = GenerationTTLCache(maxsize=lambda: 8, ttl=lambda: 60)
+	assert cache.get('a') == (None, 0)
+
+	cache.put('a', 1, 0)
+	assert cache.get('a') == (1, 0)
+
+	# a value computed before the cache was cleared is not added
+	_, generation = cache.get('b')
+	cache.clear()
+	cache.put('b', 2, generation)
+	assert cache.get('a') == (None, 1)
+	assert cache.get('b') == (None, 1)
+
+	cache.put('b', 2, 1)
+	assert cache.get('b') == (2, 1)
+
+
+def test_generation_ttl_cache_expires():
+	cache = GenerationTTLCache(maxsize=lambda: 8, ttl=lambda: 0)
+	cache.put('a', 1, 0)
+	assert cache.get('a') == (None, 0)
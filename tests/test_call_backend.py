@@ -18,4 +18,4 @@ async def test_call_backend_from_app_basic(requests_mock, api_client):
 	received_request = requests_mock.calls[0].request
 	v = verify_signature_auth(received_request, pubkey)
 	assert identity.id.startswith(v.parameters['keyid'])
-	assert received_request.path_url == path
+	assert received_request.url.raw_path.decode() == path
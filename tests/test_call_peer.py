@@ -1,8 +1,9 @@
 from shard_core.service.crypto import PublicKey
 from fastapi import status
 from http_message_signatures import algorithms
+import httpx
 from httpx import AsyncClient
-from requests import PreparedRequest, Request
+from requests import Request
 from requests_http_signature import HTTPSignatureAuth
 
 from shard_core.model.identity import OutputIdentity
@@ -20,10 +21,10 @@ async def test_call_peer_from_app_basic(peer_mock_requests, api_client):
 	response = await api_client.get(f'internal/call_peer/{peer_mock_requests.identity.short_id}{path}')
 	assert response.status_code == 200
 
-	received_request = peer_mock_requests.mock.calls[0].request
+	received_request = peer_mock_requests.mock.routes['app_get'].calls.last.request
 	v = verify_signature_auth(received_request, pubkey)
 	assert identity.id.startswith(v.parameters['keyid'])
-	assert received_request.path_url == path
+	assert received_request.url.raw_path.decode() == path
 
 
 @requires_test_env('full')
@@ -38,11 +39,11 @@ async def test_call_peer_from_app_post(peer_mock_requests, api_client):
 		data=b'foo data bar')
 	assert response.status_code == 200
 
-	received_request: PreparedRequest = peer_mock_requests.mock.calls[0].request
+	received_request: httpx.Request = peer_mock_requests.mock.routes['app_post'].calls.last.request
 	v = verify_signature_auth(received_request, pubkey)
 	assert identity.id.startswith(v.parameters['keyid'])
-	assert received_request.path_url == path
-	assert received_request.body == b'foo data bar'
+	assert received_request.url.raw_path.decode() == path
+	assert received_request.content == b'foo data bar'
 
 
 @requires_test_env('full')
@@ -39,3 +39,17 @@ def test_serialization():
 	assert '-BEGIN PUBLIC KEY-' in bytes_.decode()
 	pubkey_from_bytes = crypto.PublicKey(bytes_)
 	assert pubkey_from_bytes.to_hash_id() == public_key.to_hash_id()
+
+
+def test_loaded_keys_are_shared():
+	private_key = crypto.PrivateKey()
+	private_pem = private_key.to_bytes()
+	loaded_private_key = crypto.load_private_key(private_pem)
+	assert crypto.load_private_key(private_pem) is loaded_private_key
+	assert loaded_private_key.get_public_key() is loaded_private_key.get_public_key()
+
+	public_pem = private_key.get_public_key().to_bytes()
+	public_key = crypto.load_public_key(public_pem)
+	assert crypto.load_public_key(public_pem) is public_key
+	assert public_key.to_hash_id() is public_key.to_hash_id()
+	assert public_key.to_hash_id() == loaded_private_key.get_public_key().to_hash_id()
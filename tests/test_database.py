@@ -0,0 +1,593 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import gconf
+import pytest
+from tinydb import Query
+
+from shard_core.database import database, metrics, changes
+from shard_core.database.codec import OrjsonCodec
+from shard_core.model.backup import BackupPassphraseLastAccessInfoDB
+from tests.conftest import requires_test_env
+
+
+def _db_file() -> Path:
+	return Path(gconf.get('path_root')) / 'core' / 'shard_core_db.json'
+
+
+def _read_db_file() -> dict:
+	with open(_db_file()) as f:
+		return json.load(f)
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 0}})
+def test_resident_db_is_read_once():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	assert _read_db_file()['_default']['1']['value'] == 'bar'
+
+	_db_file().write_text('{}')
+	assert database.get_value('foo') == 'bar'
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 0.5}})
+def test_resident_db_writes_behind():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	assert _db_file().read_text() == ''
+
+	time.sleep(1)
+	assert _read_db_file()['_default']['1']['value'] == 'bar'
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 60}})
+def test_resident_db_flushes_on_close():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	database.close_database()
+
+	assert _read_db_file()['_default']['1']['value'] == 'bar'
+	assert not _db_file().with_name('shard_core_db.json.tmp').exists()
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 60}})
+def test_resident_db_with_empty_default_table():
+	# an empty TinyDB is falsy, it must still be kept and flushed
+	database.init_database()
+	with database.terminals_table() as terminals:
+		terminals.insert({'id': 'T1'})
+	with database.terminals_table() as terminals:
+		assert terminals.all() == [{'id': 'T1'}]
+	database.close_database()
+
+	assert _read_db_file()['terminals']['1'] == {'id': 'T1'}
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 60}})
+def test_resident_db_results_are_detached():
+	database.init_database()
+	with database.terminals_table() as terminals:
+		terminals.insert({'id': 'T1', 'tags': ['a']})
+	with database.terminals_table() as terminals:
+		terminal = terminals.search(Query().id == 'T1')[0]
+		terminal['tags'].append('b')
+		terminals.get(Query().id == 'T1')['tags'].append('c')
+	with database.terminals_table() as terminals:
+		assert terminals.search(Query().id == 'T1') == [{'id': 'T1', 'tags': ['a']}]
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'file'}})
+def test_file_db():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	assert _read_db_file()['_default']['1']['value'] == 'bar'
+
+	_db_file().write_text('{}')
+	with pytest.raises(KeyError):
+		database.get_value('foo')
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'layout': 'sharded'}})
+def test_sharded_db_has_file_per_table():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	with database.terminals_table() as terminals:
+		terminals.insert({'id': 'T1'})
+
+	shard_dir = Path(gconf.get('path_root')) / 'core' / 'db'
+	with open(shard_dir / '_default.json') as f:
+		assert json.load(f)['_default']['1']['value'] == 'bar'
+	with open(shard_dir / 'terminals.json') as f:
+		assert json.load(f)['terminals']['1']['id'] == 'T1'
+	assert not _db_file().exists()
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'layout': 'sharded'}})
+def test_sharded_db_splits_single_file():
+	_db_file().parent.mkdir(parents=True)
+	_db_file().write_text(json.dumps({
+		'_default': {'1': {'key': 'foo', 'value': 'bar'}},
+		'terminals': {'1': {'id': 'T1'}},
+	}))
+
+	database.init_database()
+
+	assert database.get_value('foo') == 'bar'
+	with database.terminals_table() as terminals:
+		assert terminals.all() == [{'id': 'T1'}]
+	assert database.table_names() == {'_default', 'terminals'}
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'layout': 'sharded'}})
+def test_sharded_db_locks_tables_separately():
+	database.init_database()
+	holding_terminals = threading.Event()
+	release_terminals = threading.Event()
+
+	def hold_terminals():
+		with database.terminals_table():
+			holding_terminals.set()
+			release_terminals.wait(5)
+
+	thread = threading.Thread(target=hold_terminals)
+	thread.start()
+	holding_terminals.wait(5)
+
+	with database.installed_apps_table() as installed_apps:
+		assert installed_apps.all() == []
+	assert database.lock_stats()['installed_apps']['contentions'] == 0
+
+	release_terminals.set()
+	thread.join()
+
+
+@requires_test_env('full')
+async def test_async_table():
+	database.init_database()
+	async with database.terminals_table() as terminals:
+		await terminals.insert({'id': 'T1', 'name': 'foo'})
+		await terminals.update({'name': 'bar'}, Query().id == 'T1')
+		assert await terminals.get(Query().id == 'T1') == {'id': 'T1', 'name': 'bar'}
+		assert await terminals.len() == 1
+
+	with database.terminals_table() as terminals:
+		assert terminals.all() == [{'id': 'T1', 'name': 'bar'}]
+
+
+@requires_test_env('full')
+async def test_async_table_does_not_block_event_loop():
+	database.init_database()
+	holding_terminals = threading.Event()
+	release_terminals = threading.Event()
+
+	def hold_terminals():
+		with database.terminals_table():
+			holding_terminals.set()
+			release_terminals.wait(5)
+
+	thread = threading.Thread(target=hold_terminals)
+	thread.start()
+	holding_terminals.wait(5)
+
+	async with database.terminals_table() as terminals:
+		waiting_insert = asyncio.create_task(terminals.insert({'id': 'T1'}))
+		await asyncio.sleep(0.1)
+		assert not waiting_insert.done()
+
+		release_terminals.set()
+		await waiting_insert
+	thread.join()
+
+	with database.terminals_table() as terminals:
+		assert terminals.all() == [{'id': 'T1'}]
+
+
+def _journal_file() -> Path:
+	return _db_file().with_name('shard_core_db.json.journal')
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'journal'}})
+def test_journal_appends_changes():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	database.set_value('baz', 'qux')
+	journal_size = _journal_file().stat().st_size
+	database.set_value('foo', 'bar2')
+
+	assert _db_file().read_text() == ''
+	journal_lines = _journal_file().read_text().splitlines()
+	assert len(journal_lines) == 3
+	assert json.loads(journal_lines[-1])['changes'] == [['put', '_default', '1', '{"key":"foo","value":"bar2"}']]
+	assert _journal_file().stat().st_size - journal_size == len(journal_lines[-1]) + 1
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'journal'}})
+def test_journal_serializes_only_dirty_documents(monkeypatch):
+	database.init_database()
+	with database.terminals_table() as terminals:
+		terminals.insert_multiple({'id': f'T{i}'} for i in range(10))
+
+	dumped_docs = []
+	dumps_document = OrjsonCodec.dumps_document
+	monkeypatch.setattr(
+		OrjsonCodec, 'dumps_document', lambda self, doc: dumped_docs.append(doc) or dumps_document(self, doc))
+	with database.terminals_table() as terminals:
+		terminals.update({'name': 'foo'}, Query().id == 'T3')
+		terminals.remove(Query().id.one_of(['T5', 'T6']))
+
+	assert dumped_docs == [{'id': 'T3', 'name': 'foo'}]
+	journal_changes = [json.loads(line)['changes'] for line in _journal_file().read_text().splitlines()[-2:]]
+	assert journal_changes[0] == [['put', 'terminals', '4', '{"id":"T3","name":"foo"}']]
+	assert sorted(journal_changes[1]) == [['delete', 'terminals', '6'], ['delete', 'terminals', '7']]
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'journal'}})
+def test_journal_is_replayed():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	database.set_value('baz', 'qux')
+	database.remove_value('baz')
+	with _journal_file().open('a') as f:
+		f.write('{"ts": 1, "chan')  # torn write
+	database.close_database()
+
+	database.init_database()
+	assert database.get_value('foo') == 'bar'
+	with pytest.raises(KeyError):
+		database.get_value('baz')
+	database.set_value('foo', 'bar2')
+	database.close_database()
+
+	database.init_database()
+	assert database.get_value('foo') == 'bar2'
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'journal', 'journal': {'max_size': 200}}})
+def test_journal_is_compacted():
+	database.init_database()
+	for i in range(5):
+		database.set_value(f'key{i}', 'x' * 50)
+	database.close_database()
+
+	assert len(_read_db_file()['_default']) >= 2
+	assert not _db_file().with_name('shard_core_db.json.journal.old').exists()
+
+	database.init_database()
+	assert all(database.get_value(f'key{i}') == 'x' * 50 for i in range(5))
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'engine': 'sqlite'}})
+def test_sqlite_db():
+	database.init_database()
+	database.set_value('foo', 'bar')
+	assert database.get_value('foo') == 'bar'
+
+	with database.app_usage_track_table() as tracks:
+		tracks.insert_multiple([{'timestamp': datetime(2023, 1, d)} for d in range(1, 11)])
+		found = tracks.search((Query().timestamp >= datetime(2023, 1, 3)) & (Query().timestamp < datetime(2023, 1, 5)))
+	assert [t['timestamp'].day for t in found] == [3, 4]
+
+	with database.peers_table() as peers:
+		peers.insert({'id': 'abcdef:xyz', 'name': 'foo'})
+		peers.insert({'id': 'abcxyz', 'name': 'bar'})
+		peers.update({'name': 'baz'}, Query().id.matches('abcdef:*'))
+		assert peers.get(Query().id.matches('abcdef:*'))['name'] == 'baz'
+		assert peers.remove(Query().name == 'bar') == [2]
+		assert len(peers) == 1
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'engine': 'sqlite'}})
+def test_sqlite_db_uses_index():
+	database.init_database()
+	with database.installed_apps_table() as installed_apps:
+		installed_apps.insert({'name': 'foo'})
+	db = database._get_sqlite_db()
+	with db.connection() as conn:
+		plan = conn.execute(
+			'EXPLAIN QUERY PLAN SELECT * FROM installed_apps WHERE json_extract(doc, \'$."name"\') = ?', ['foo']
+		).fetchall()
+	assert 'ix_installed_apps_name' in str(plan)
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'engine': 'sqlite'}})
+def test_sqlite_db_compares_datetimes_with_offsets():
+	database.init_database()
+	utc = timezone.utc
+	with database.backups_table() as backups:
+		backups.insert({'endTime': datetime(2024, 1, 1, 11, tzinfo=timezone(timedelta(hours=2)))})
+		backups.insert({'endTime': datetime(2024, 1, 1, 10, tzinfo=utc)})
+	with database.backups_table() as backups:
+		assert len(backups.search(Query().endTime < datetime(2024, 1, 1, 9, 30, tzinfo=utc))) == 1
+		assert len(backups.search(Query().endTime == datetime(2024, 1, 1, 9, tzinfo=utc))) == 1
+		assert len(backups.search(Query().endTime >= datetime(2024, 1, 1, 9, tzinfo=utc))) == 2
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'engine': 'sqlite'}})
+def test_sqlite_db_imports_json_file():
+	_db_file().parent.mkdir(parents=True)
+	_db_file().write_text(json.dumps({
+		'_default': {'1': {'key': 'foo', 'value': 'bar'}},
+		'terminals': {'3': {'id': 'T1', 'last_connection': '{TinyDate}:2023-01-01T00:00:00'}},
+	}))
+
+	database.init_database()
+
+	assert database.get_value('foo') == 'bar'
+	with database.terminals_table() as terminals:
+		terminal = terminals.get(Query().id == 'T1')
+	assert terminal.doc_id == 3
+	assert terminal['last_connection'] == datetime(2023, 1, 1)
+	assert not _db_file().exists()
+
+
+@requires_test_env('full')
+def test_indexed_table():
+	database.init_database()
+	with database.peers_table() as peers:
+		peers.insert_multiple([
+			{'id': 'abcdef:xyz', 'name': 'foo', 'is_reachable': True},
+			{'id': 'abcxyz', 'name': 'bar', 'is_reachable': True},
+			{'id': 'abcdefg', 'name': 'baz', 'is_reachable': False},
+		])
+
+		assert peers.get(Query().id.matches('abcdef:*'))['name'] == 'foo'
+		assert [p['name'] for p in peers.search(Query().id.matches('abc'))] == ['foo', 'bar', 'baz']
+		assert [p['name'] for p in peers.search(Query().is_reachable == True)] == ['foo', 'bar']  # noqa: E712
+		assert peers.search((Query().is_reachable == True) & (Query().name == 'bar')) == [  # noqa: E712
+			{'id': 'abcxyz', 'name': 'bar', 'is_reachable': True}]
+		assert peers.get(Query().name == 'nope') is None
+
+		assert peers.update({'name': 'qux'}, Query().name == 'foo') == [1]
+		assert peers.get(Query().name == 'foo') is None
+		assert peers.get(Query().name == 'qux').doc_id == 1
+		assert peers.update({'name': 'qux'}, Query().name == 'nope') == []
+
+		assert peers.remove(Query().id.matches('abcdef:*')) == [1, 3]
+		assert peers.get(Query().id.matches('abcdef:*')) is None
+		assert len(peers) == 1
+
+
+@requires_test_env('full')
+@pytest.mark.parametrize('engine', ['tinydb', 'sqlite'])
+def test_regex_flags_are_not_ignored(engine):
+	with gconf.override_conf({'database': {'engine': engine}}):
+		database.init_database()
+		with database.peers_table() as peers:
+			peers.insert_multiple([{'id': 'ABC:1', 'name': 'foo'}, {'id': 'abc:2', 'name': 'bar'}])
+
+			matching_peers = peers.search(Query().id.matches('abc:', flags=re.IGNORECASE))
+			assert [p['name'] for p in matching_peers] == ['foo', 'bar']
+			both_match = (Query().name == 'foo') | Query().id.matches('abc:', flags=re.IGNORECASE)
+			assert peers.get(Query().id.exists() & both_match)['name'] == 'foo'
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'format': 'compact'}})
+def test_compact_format_reads_and_writes_tiny_dates():
+	_db_file().parent.mkdir(parents=True)
+	_db_file().write_text(json.dumps({
+		'terminals': {'1': {'id': 'T1', 'last_connection': '{TinyDate}:2023-01-01T00:00:00'}},
+	}, indent=2))
+
+	database.init_database()
+	with database.terminals_table() as terminals:
+		assert terminals.get(Query().id == 'T1')['last_connection'] == datetime(2023, 1, 1)
+		terminals.update({'last_connection': datetime(2023, 1, 2, 3, 4, 5)}, Query().id == 'T1')
+	database.close_database()
+
+	assert _db_file().read_text() == \
+		'{"terminals":{"1":{"id":"T1","last_connection":"{TinyDate}:2023-01-02T03:04:05"}}}'
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'metrics': {'slow_threshold': 0.1}}})
+def test_metrics_per_table_and_call_site():
+	database.init_database()
+	metrics.reset()
+	for _ in range(3):
+		with database.terminals_table() as terminals:
+			terminals.all()
+	with database.installed_apps_table():
+		time.sleep(0.2)
+
+	stats = database.stats()
+	terminals_stats, = stats['tables']['terminals'].values()
+	assert terminals_stats['operation']['count'] == 3
+	assert terminals_stats['wait']['count'] == 3
+	call_site, = stats['tables']['installed_apps']
+	assert call_site.startswith('tests/test_database.py:')
+	assert call_site.endswith('(test_metrics_per_table_and_call_site)')
+	assert stats['slow_operations']['count'] == 1
+	assert stats['slow_operations']['samples'][0]['call_site'] == call_site
+	assert stats['locks']['terminals']['acquisitions'] >= 3
+
+
+@requires_test_env('full')
+async def test_metrics_of_async_calls_have_caller_as_call_site():
+	database.init_database()
+	metrics.reset()
+	async with database.terminals_table() as terminals:
+		await terminals.all()
+
+	call_site, = database.stats()['tables']['terminals']
+	assert call_site.endswith('(test_metrics_of_async_calls_have_caller_as_call_site)')
+
+
+@requires_test_env('full')
+async def test_db_stats_endpoint(api_client):
+	response = await api_client.get('protected/stats/db')
+	assert response.status_code == 200
+	assert 'identities' in response.json()['tables']
+
+
+@requires_test_env('full')
+@pytest.mark.parametrize('config', [
+	{'storage': 'resident', 'write_behind_delay': 0},
+	{'storage': 'file'},
+	{'layout': 'sharded', 'write_behind_delay': 0},
+	{'engine': 'sqlite'},
+])
+def test_transaction(config):
+	with gconf.override_conf({'database': config}):
+		database.init_database()
+		with database.transaction('terminals', 'identities') as (terminals, identities):
+			terminals.insert({'id': 'T1'})
+			identities.insert({'id': 'I1'})
+		with database.terminals_table() as terminals, database.identities_table() as identities:
+			assert terminals.all() == [{'id': 'T1'}]
+			assert identities.all() == [{'id': 'I1'}]
+
+		with pytest.raises(KeyError):
+			with database.transaction('terminals', 'identities') as (terminals, identities):
+				terminals.insert({'id': 'T2'})
+				identities.update({'name': 'foo'}, Query().id == 'I1')
+				raise KeyError('I2')
+		with database.terminals_table() as terminals, database.identities_table() as identities:
+			assert terminals.all() == [{'id': 'T1'}]
+			assert identities.all() == [{'id': 'I1'}]
+		database.close_database()
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'database': {'storage': 'resident', 'write_behind_delay': 0}})
+def test_transaction_flushes_once(mocker):
+	database.init_database()
+	database.set_value('foo', 'bar')
+	write = mocker.spy(database._get_resident_db(_db_file()).storage.storage, 'write')
+
+	with database.transaction('terminals', 'identities') as (terminals, identities):
+		terminals.insert({'id': 'T1'})
+		terminals.insert({'id': 'T2'})
+		identities.insert({'id': 'I1'})
+	assert write.call_count == 1
+
+
+@requires_test_env('full')
+@pytest.mark.parametrize('config', [{'storage': 'file'}, {'engine': 'sqlite'}])
+def test_values_are_cached(config, mocker):
+	with gconf.override_conf({'database': config}):
+		database.init_database()
+		database.set_value('foo', 'bar')
+		assert database.get_value('foo') == 'bar'
+
+		open_table = mocker.spy(database, '_open_table')
+		assert database.get_value('foo') == 'bar'
+		with pytest.raises(KeyError):
+			database.get_value('baz')
+		assert open_table.call_count == 0
+
+		database.set_value('foo', 'bar2')
+		assert database.get_value('foo') == 'bar2'
+		database.remove_value('foo')
+		with pytest.raises(KeyError):
+			database.get_value('foo')
+
+		with database.open_table(database.DEFAULT_TABLE) as table:
+			table.insert({'key': 'foo', 'value': 'written directly'})
+		assert database.get_value('foo') == 'written directly'
+
+		with pytest.raises(KeyError):
+			with database.transaction(database.DEFAULT_TABLE) as (table,):
+				table.insert({'key': 'baz', 'value': 'rolled back'})
+				raise KeyError('baz')
+		with pytest.raises(KeyError):
+			database.get_value('baz')
+		database.close_database()
+
+
+@requires_test_env('full')
+def test_stored_value():
+	database.init_database()
+	stored_value = database.StoredValue('last_access', BackupPassphraseLastAccessInfoDB)
+	with pytest.raises(KeyError):
+		stored_value.get()
+
+	stored_value.set(BackupPassphraseLastAccessInfoDB(time=datetime(2024, 1, 1), terminal_id='T1'))
+	last_access = stored_value.get()
+	assert last_access.terminal_id == 'T1'
+	assert stored_value.get() is last_access
+
+	stored_value.set(BackupPassphraseLastAccessInfoDB(time=datetime(2024, 1, 2), terminal_id='T2'))
+	assert stored_value.get().terminal_id == 'T2'
+	assert stored_value.remove()
+	with pytest.raises(KeyError):
+		stored_value.get()
+
+
+@requires_test_env('full')
+@pytest.mark.parametrize('config', [{'storage': 'resident'}, {'storage': 'file'}, {'engine': 'sqlite'}])
+def test_change_feed(config):
+	received = []
+	with gconf.override_conf({'database': config}):
+		database.init_database()
+		changes.subscribe('terminals', received.append)
+		try:
+			with database.terminals_table() as terminals:
+				terminals.insert({'id': 'T1', 'name': 'foo'})
+				terminals.update({'name': 'bar'}, Query().id == 'T1')
+				terminals.update({'name': 'bar'}, Query().id == 'T1')
+				assert received == []
+			with database.identities_table() as identities:
+				identities.insert({'id': 'I1'})
+			with pytest.raises(KeyError):
+				with database.transaction('terminals') as (terminals,):
+					terminals.insert({'id': 'T2'})
+					raise KeyError('T2')
+			with database.terminals_table() as terminals:
+				terminals.remove(Query().id == 'T1')
+			database.close_database()
+		finally:
+			changes.unsubscribe('terminals', received.append)
+
+	assert received == [
+		changes.Change('terminals', 1, None, {'id': 'T1', 'name': 'foo'}),
+		changes.Change('terminals', 1, {'id': 'T1', 'name': 'foo'}, {'id': 'T1', 'name': 'bar'}),
+		changes.Change('terminals', 1, {'id': 'T1', 'name': 'bar'}, None),
+		changes.Change('terminals'),
+	]
+
+
+@requires_test_env('full')
+def test_cached_until_change():
+	database.init_database()
+	calls = []
+
+	@changes.cached_until_change('terminals')
+	def count_terminals(prefix):
+		calls.append(prefix)
+		with database.terminals_table() as terminals:
+			return terminals.count(Query().id.matches(prefix))
+
+	assert count_terminals('T') == 0
+	assert count_terminals('T') == 0
+	with database.identities_table() as identities:
+		identities.insert({'id': 'I1'})
+	assert count_terminals('T') == 0
+	assert calls == ['T']
+
+	with database.terminals_table() as terminals:
+		terminals.insert({'id': 'T1'})
+	assert count_terminals('T') == 1
+	assert calls == ['T', 'T']
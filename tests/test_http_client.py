@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+import respx
+
+from shard_core.service import http_client
+from shard_core.service.http_client import _HostLimitedTransport
+
+
+async def test_client_is_shared_during_lifespan():
+	async with http_client.http_client_lifespan() as client:
+		assert http_client.get_http_client() is client
+	assert client.is_closed
+	assert http_client.get_http_client() is not client
+
+
+async def test_client_opened_before_lifespan_is_closed():
+	client = http_client.get_http_client()
+	async with http_client.http_client_lifespan() as lifespan_client:
+		assert lifespan_client is client
+	assert client.is_closed
+
+
+async def test_requests_per_host_are_limited():
+	running = {'a.example': 0, 'b.example': 0}
+	max_running = {'a.example': 0, 'b.example': 0}
+
+	async def handler(request: httpx.Request):
+		host = request.url.host
+		running[host] += 1
+		max_running[host] = max(max_running[host], running[host])
+		await asyncio.sleep(0.01)
+		running[host] -= 1
+		# streamed like the responses of a network transport, which are closed after reading
+		return httpx.Response(200, stream=httpx.ByteStream(b'ok'))
+
+	transport = _HostLimitedTransport(httpx.MockTransport(handler), max_requests_per_host=2)
+	async with httpx.AsyncClient(transport=transport) as client:
+		responses = await asyncio.gather(
+			*[client.get(f'https://{host}/{i}') for i in range(6) for host in running])
+
+	assert all(r.content == b'ok' for r in responses)
+	assert max_running == {'a.example': 2, 'b.example': 2}
+
+
+async def test_redirects_are_followed():
+	with respx.mock() as rsps:
+		rsps.get('https://a.example/old').respond(307, headers={'Location': 'https://a.example/new'})
+		rsps.get('https://a.example/new').respond(200, content=b'ok')
+		async with http_client.http_client_lifespan() as client:
+			response = await client.get('https://a.example/old')
+
+	assert response.status_code == 200
+	assert response.content == b'ok'
+
+
+async def test_semaphores_of_idle_hosts_are_dropped():
+	async def handler(_: httpx.Request):
+		return httpx.Response(200, stream=httpx.ByteStream(b'ok'))
+
+	transport = _HostLimitedTransport(httpx.MockTransport(handler), max_requests_per_host=2)
+	async with httpx.AsyncClient(transport=transport) as client:
+		await asyncio.gather(*[client.get(f'https://{i}.example/') for i in range(20)])
+		async with client.stream('GET', 'https://a.example/'):
+			assert list(transport._semaphores) == ['a.example']
+	assert transport._semaphores == {}
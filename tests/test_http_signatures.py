@@ -0,0 +1,72 @@
+import httpx
+import pytest
+import requests
+from http_message_signatures import HTTPSignatureKeyResolver, InvalidSignature, algorithms
+from requests_http_signature import HTTPSignatureAuth
+from starlette.datastructures import Headers
+
+from shard_core.service import crypto
+from shard_core.service.http_signatures import SignatureAuth, SignedRequest, verify_request
+from tests.util import verify_signature_auth
+
+_private_key = crypto.PrivateKey()
+
+
+class _KR(HTTPSignatureKeyResolver):
+	def resolve_public_key(self, key_id: str):
+		assert key_id == 'peer'
+		return _private_key.get_public_key().key
+
+
+def _sign(method: str, url: str, body: bytes = None) -> requests.PreparedRequest:
+	auth = HTTPSignatureAuth(signature_algorithm=algorithms.RSA_PSS_SHA512, key_id='peer', key=_private_key.to_bytes())
+	return auth(requests.Request(method, url, data=body).prepare())
+
+
+def _verify(prepared: requests.PreparedRequest, target_uri: str = None, body: bytes = None):
+	return verify_request(
+		SignedRequest(prepared.method, target_uri or prepared.url, Headers(headers=dict(prepared.headers))),
+		body if body is not None else prepared.body or b'',
+		key_resolver=_KR(),
+	)
+
+
+def test_verify_request():
+	prepared = _sign('GET', 'https://app.shard.example/some path/?q=ä')
+	assert _verify(prepared).parameters['keyid'] == 'peer'
+	assert _verify(prepared, 'https://app.shard.example/some%20path/?q=%C3%A4').parameters['keyid'] == 'peer'
+
+	with pytest.raises(InvalidSignature):
+		_verify(prepared, 'https://app.shard.example/other/')
+	with pytest.raises(InvalidSignature):
+		_verify(prepared, body=b'unsigned body')
+
+
+def test_verify_request_with_body():
+	prepared = _sign('POST', 'https://app.shard.example/upload', b'x' * 1000)
+	assert _verify(prepared).body == b'x' * 1000
+
+	with pytest.raises(InvalidSignature):
+		_verify(prepared, body=b'y' * 1000)
+	with pytest.raises(InvalidSignature):
+		_verify(prepared, body=b'')
+
+
+async def test_signature_auth():
+	sent = []
+
+	def handler(request: httpx.Request):
+		sent.append(request)
+		return httpx.Response(200)
+
+	auth = SignatureAuth(key_id='peer', key=_private_key.to_bytes())
+	async with httpx.AsyncClient(transport=httpx.MockTransport(handler), auth=auth) as client:
+		await client.get('https://app.shard.example/some path/?q=ä')
+		await client.post('https://app.shard.example/upload', content=b'x' * 1000)
+
+	for request in sent:
+		assert verify_signature_auth(request, _private_key.get_public_key()).parameters['keyid'] == 'peer'
+		signed_request = SignedRequest(request.method, str(request.url), request.headers)
+		assert verify_request(signed_request, request.content, key_resolver=_KR()).parameters['keyid'] == 'peer'
+	assert 'content-digest' not in sent[0].headers
+	assert 'content-digest' in sent[1].headers
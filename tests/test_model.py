@@ -1,7 +1,8 @@
 import pytest
 
 from shard_core.model.app_meta import Lifecycle, VMSize
-from shard_core.model.util import PropertyBaseModel
+from shard_core.model.identity import Identity
+from shard_core.model.util import PropertyBaseModel, construct_trusted
 from tests.conftest import requires_test_env
 
 
@@ -53,3 +54,15 @@ def test_vm_size():
 	assert VMSize.L <= VMSize.L
 	assert VMSize.L > VMSize.S
 	assert VMSize.L >= VMSize.S
+
+
+@requires_test_env('full')
+def test_construct_trusted():
+	identity = Identity.create('foo', description='bar')
+	document = identity.dict()
+	assert 'public_key_pem' in document
+
+	trusted_identity = construct_trusted(Identity, document)
+	assert trusted_identity == identity
+	assert trusted_identity.public_key_pem == identity.public_key_pem
+	assert 'public_key_pem' not in trusted_identity.__dict__
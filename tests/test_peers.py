@@ -1,7 +1,15 @@
+import pytest
+import requests
+from http_message_signatures import InvalidSignature, algorithms
 from httpx import AsyncClient
+from requests_http_signature import HTTPSignatureAuth
 from starlette import status
+from starlette.requests import Request
 
+from shard_core.database import database
+from shard_core.database.database import peers_table
 from shard_core.model.peer import Peer
+from shard_core.service import crypto, peer as peer_service
 from tests.conftest import requires_test_env
 
 
@@ -73,3 +81,76 @@ async def test_is_unreachable(api_client: AsyncClient):
 	response = await api_client.get('protected/peers')
 	assert len(response.json()) == 1
 	assert response.json()[0]['is_reachable'] is False
+
+
+def _signed_peer_request(private_key: crypto.PrivateKey, key_id: str, uri: str) -> Request:
+	auth = HTTPSignatureAuth(signature_algorithm=algorithms.RSA_PSS_SHA512, key_id=key_id, key=private_key.to_bytes())
+	signed = auth(requests.Request('GET', f'https://mock_app.shard.example{uri}').prepare())
+	headers = {
+		'x-forwarded-method': 'GET',
+		'x-forwarded-proto': 'https',
+		'x-forwarded-host': 'mock_app.shard.example',
+		'x-forwarded-uri': uri,
+		'signature-input': signed.headers['signature-input'],
+		'signature': signed.headers['signature'],
+		'date': signed.headers['date'],
+	}
+
+	async def receive():
+		return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+	return Request({
+		'type': 'http', 'method': 'GET', 'path': '/internal/auth', 'query_string': b'',
+		'headers': [(k.encode(), v.encode()) for k, v in headers.items()],
+	}, receive)
+
+
+def _with_header(request: Request, name: bytes, value: bytes) -> Request:
+	headers = [(k, value if k == name else v) for k, v in request.scope['headers']]
+	return Request({**request.scope, 'headers': headers}, request.receive)
+
+
+@requires_test_env('full')
+async def test_verified_signature_cache(mocker):
+	database.init_database()
+	private_key = crypto.PrivateKey()
+	peer_id = private_key.get_public_key().to_hash_id()
+	public_pem = private_key.get_public_key().to_bytes().decode()
+	with peers_table() as peers:
+		peers.insert(Peer(id=peer_id, name='P1', public_bytes_b64=public_pem).dict())
+	verify = mocker.spy(peer_service, '_verify_signature')
+	get_peer = mocker.spy(peer_service, 'get_peer_by_id')
+
+	assert (await peer_service.verify_peer_auth(_signed_peer_request(private_key, peer_id, '/a'))).name == 'P1'
+	assert (await peer_service.verify_peer_auth(_signed_peer_request(private_key, peer_id, '/a'))).name == 'P1'
+	assert verify.call_count == 2
+
+	request = _signed_peer_request(private_key, peer_id, '/b')
+	await peer_service.verify_peer_auth(request)
+	await peer_service.verify_peer_auth(request)
+	assert verify.call_count == 3
+	assert get_peer.call_count == 3
+
+	# the remembered signature does not cover a different value of a covered header
+	with pytest.raises(InvalidSignature):
+		await peer_service.verify_peer_auth(_with_header(request, b'date', b'Mon, 01 Jan 2024 00:00:00 GMT'))
+	assert verify.call_count == 4
+
+	with peers_table() as peers:
+		peers.update({'name': 'P2'}, doc_ids=[1])
+	assert (await peer_service.verify_peer_auth(request)).name == 'P2'
+	assert verify.call_count == 5
+
+	other_request = _with_header(_signed_peer_request(private_key, peer_id, '/c'), b'x-forwarded-uri', b'/d')
+	with pytest.raises(InvalidSignature):
+		await peer_service.verify_peer_auth(other_request)
+
+
+@requires_test_env('full')
+@pytest.mark.config_override({'peers': {'verification': {'max_pending': 0}}})
+async def test_verification_overload():
+	database.init_database()
+	private_key = crypto.PrivateKey()
+	peer_id = private_key.get_public_key().to_hash_id()
+	with pytest.raises(peer_service.PeerVerificationOverloaded):
+		await peer_service.verify_peer_auth(_signed_peer_request(private_key, peer_id, '/a'))
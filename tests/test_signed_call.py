@@ -3,8 +3,12 @@ from shard_core.service.crypto import PublicKey
 from http_message_signatures import InvalidSignature
 from httpx import AsyncClient
 
+from shard_core.database import database
+from shard_core.database.database import identities_table
 from shard_core.model.identity import Identity, OutputIdentity
 from shard_core.model.profile import Profile
+from shard_core.service import identity as identity_service
+from shard_core.service.signed_call import get_signature_auth
 from tests import conftest
 from tests.conftest import requires_test_env
 from tests.util import verify_signature_auth
@@ -31,3 +35,20 @@ async def test_call_management_api_fail_verify(requests_mock, api_client: AsyncC
 	invalid_identity = Identity.create('invalid')
 	with pytest.raises(InvalidSignature):
 		verify_signature_auth(requests_mock.calls[0].request, invalid_identity.public_key)
+
+
+@requires_test_env('full')
+def test_signature_auth_is_reused():
+	database.init_database()
+	first_default = identity_service.init_default_identity()
+	auth = get_signature_auth()
+	assert get_signature_auth() is auth
+	assert auth.key_id == first_default.short_id
+	assert get_signature_auth(first_default) is auth
+
+	new_identity = Identity.create('second')
+	with identities_table() as identities:
+		identities.insert(new_identity.dict())
+	identity_service.make_default(new_identity.id)
+	assert get_signature_auth().key_id == new_identity.short_id
+	assert get_signature_auth() is get_signature_auth(new_identity)
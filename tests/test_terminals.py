@@ -1,12 +1,15 @@
 from time import sleep
 
+import pytest
 from httpx import AsyncClient
 from starlette import status
 from tinydb.operations import delete
 
+from shard_core.database import database
 from shard_core.database.database import terminals_table
 from shard_core.model.backend.portal_meta import PortalMetaExt
 from shard_core.model.terminal import Terminal, Icon
+from shard_core.service import pairing, last_access
 from tests.conftest import requests_mock_context, mock_meta, requires_test_env
 from tests.util import get_pairing_code, add_terminal, pair_new_terminal
 
@@ -207,6 +210,7 @@ async def test_last_connection(api_client: AsyncClient):
 		'X-Forwarded-Host': 'mock_app.myshard.org',
 		'X-Forwarded-Uri': '/foo'
 	})).status_code == status.HTTP_200_OK
+	last_access.flush()
 	last_connection_1 = Terminal(
 		**(await api_client.get(f'protected/terminals/name/{t_name}')).json()
 	).last_connection
@@ -223,6 +227,7 @@ async def test_last_connection(api_client: AsyncClient):
 		'X-Forwarded-Host': 'mock_app.myshard.org',
 		'X-Forwarded-Uri': '/foo'
 	})).status_code == status.HTTP_200_OK
+	last_access.flush()
 	last_connection_3 = Terminal(
 		**(await api_client.get(f'protected/terminals/name/{t_name}')).json()
 	).last_connection
@@ -256,3 +261,35 @@ async def test_pairing_with_profile_missing_email(
 		assert response.status_code == status.HTTP_200_OK
 		assert response.json()['name'] == 'test owner'
 		assert response.json()['email'] is None
+
+
+@requires_test_env('full')
+def test_verified_token_cache():
+	database.init_database()
+	terminal = Terminal.create('T1')
+	with terminals_table() as terminals:
+		terminals.insert(terminal.dict())
+	token = pairing.create_terminal_jwt(terminal.id)
+
+	assert pairing.get_verified_terminal(token) is None
+	verified_terminal = pairing.verify_terminal_jwt(token)
+	assert verified_terminal.name == 'T1'
+	assert pairing.get_verified_terminal(f'Bearer {token}') is verified_terminal
+	last_access.record_terminal_connection(verified_terminal)
+	last_access.flush()
+	assert pairing.verify_terminal_jwt(f'Bearer {token}') is verified_terminal
+
+	with terminals_table() as terminals:
+		terminals.update({'name': 'T2'}, doc_ids=[1])
+	assert pairing.verify_terminal_jwt(token).name == 'T2'
+
+	pairing._jwt_secret.set('rotated secret')
+	assert pairing.get_verified_terminal(token) is None
+	with pytest.raises(pairing.InvalidJwt):
+		pairing.verify_terminal_jwt(token)
+	pairing.verify_terminal_jwt(pairing.create_terminal_jwt(terminal.id))
+
+	with terminals_table() as terminals:
+		terminals.truncate()
+	with pytest.raises(pairing.InvalidJwt):
+		pairing.verify_terminal_jwt(pairing.create_terminal_jwt(terminal.id))
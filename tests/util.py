@@ -9,6 +9,8 @@ from shard_core.service.crypto import PublicKey
 from fastapi import Response
 from fastapi import status
 from http_message_signatures import HTTPSignatureKeyResolver, algorithms, VerifyResult
+import httpx
+import requests
 from httpx import AsyncClient
 from httpx import URL, Request
 from requests import PreparedRequest
@@ -94,7 +96,17 @@ def mock_app_store_path():
 	return Path(__file__).parent / 'mock_app_store'
 
 
-def verify_signature_auth(request: PreparedRequest, pubkey: PublicKey) -> VerifyResult:
+def verify_signature_auth(request: httpx.Request, pubkey: PublicKey) -> VerifyResult:
+	"""
+	Verifies the signature of an outbound request like a peer does, with `requests_http_signature`.
+	"""
+	prepared_request = requests.Request(
+		method=request.method,
+		url=str(request.url),
+		headers=dict(request.headers),
+		data=request.content,
+	).prepare()
+
 	class KR(HTTPSignatureKeyResolver):
 		def resolve_private_key(self, key_id: str):
 			pass
@@ -103,7 +115,7 @@ def verify_signature_auth(request: PreparedRequest, pubkey: PublicKey) -> Verify
 			return pubkey.to_bytes()
 
 	return HTTPSignatureAuth.verify(
-		request,
+		prepared_request,
 		signature_algorithm=algorithms.RSA_PSS_SHA512,
 		key_resolver=KR(),
 	)